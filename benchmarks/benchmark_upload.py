@@ -0,0 +1,220 @@
+"""
+Throughput of event_upload_rotjane.py and the bulk operations of
+populate_database/db_request.py against the local JANE stand-in server, see
+jane_standin.py. A workspace with synthetic event folders (quakeml, .json,
+4 pages) and StationXML files is created in a temporary folder and the
+scripts are run in it as they are run by cron, so the stand-in has to serve
+on the address the scripts use (127.0.0.1:8000).
+
+# 500 events, 20 ms per request, uploader with 1 and 8 threads
+>>> python benchmarks/benchmark_upload.py --events 500 --latency 0.02 \
+        --workers 1,8
+
+Measured are:
+    upload      first upload of all events (--timespan all)
+    synced      the same run again, nothing to upload
+    sync        --sync after 10% of the events changed one page
+    retry       first upload with failures injected (--failure_rate)
+    applied     first upload with failures injected after the requests were
+                applied, no attachment may be stored twice
+    resume      the run after an upload killed when half of the events were
+                complete, per unfinished event
+    stationxml  db_request.py --action put --pick stationxml --fileid all
+    wipe        db_request.py --action wipe --pick quakeml
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import jane_standin
+
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+UPLOADER = os.path.join(PACKAGE_PATH, 'event_upload_rotjane.py')
+DB_REQUEST = os.path.join(PACKAGE_PATH, 'populate_database', 'db_request.py')
+
+
+def make_workspace(path, events, stations, page_size):
+
+    """
+    Synthetic OUTPUT/ folder and populate_database/station_files/.
+
+    :type events: int
+    :param events: Number of event folders.
+    :type stations: int
+    :param stations: Number of StationXML files.
+    :type page_size: int
+    :param page_size: Size of each page in bytes.
+    """
+    output_path = os.path.join(path, 'OUTPUT')
+    for J in range(events):
+        tag = 'GCMT_{}_6.{:02d}_SYNTHETIC_REGION'.format(
+                '{:04d}-{:02d}-{:02d}T{:02d}{:02d}00Z'.format(
+                        2000 + J // 8064, 1 + J // 672 % 12, 1 + J // 24 % 28,
+                        J % 24, J // 24 % 60), J % 100)
+        folder = os.path.join(output_path, tag)
+        os.makedirs(folder)
+        with open(os.path.join(folder, tag + '.xml'), 'w') as f:
+            f.write('<?xml version="1.0"?>\n<q:quakeml>{}</q:quakeml>\n'.format(
+                                                                        tag))
+        with open(os.path.join(folder, tag + '.json'), 'w') as f:
+            f.write('{{"event_id": "{}"}}\n'.format(tag))
+        for page in range(1, 5):
+            with open(os.path.join(folder, '{}_RLAS_page_{}.png'.format(
+                                                    tag, page)), 'wb') as f:
+                f.write(os.urandom(page_size))
+
+    station_path = os.path.join(path, 'populate_database', 'station_files')
+    os.makedirs(station_path)
+    for J in range(stations):
+        with open(os.path.join(station_path, 'BW.S{:04d}.xml'.format(J)),
+                                                                    'w') as f:
+            f.write('<FDSNStationXML>{}</FDSNStationXML>\n'.format(J))
+    return output_path
+
+
+def run(label, server, count, command, cwd, stdin=None):
+
+    """
+    Runs one of the scripts and prints its throughput.
+
+    :type count: int
+    :param count: Number of items (events, files) handled by the run.
+    :rtype: float
+    :return: wall time [s]
+    """
+    requests_before = server.store.requests
+    start = time.time()
+    process = subprocess.run([sys.executable] + command, cwd=cwd,
+                             input=stdin, stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, universal_newlines=True)
+    elapsed = time.time() - start
+    if process.returncode:
+        print(process.stdout)
+        raise RuntimeError('{} failed'.format(' '.join(command)))
+    print('{:<24} {:>8.2f} s {:>10.1f} /s {:>8} requests'.format(
+                    label, elapsed, count / elapsed,
+                    server.store.requests - requests_before))
+    return elapsed
+
+
+def duplicate_attachments(server):
+    return sum(len(A) - len(set(B['category'] for B in A.values()))
+               for A in server.store.attachments.values())
+
+
+def complete_events(server):
+    # the server threads change the store while it is counted
+    with server.store.lock:
+        return sum(1 for T, N in server.store.documents if T == 'quakeml' and
+                   len(server.store.attachments[
+                        server.store.documents[(T, N)]['index']]) == 5)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput of the upload \
+        scripts against the local JANE stand-in server.')
+    parser.add_argument('--events', help='Number of synthetic events \
+        (default: 200)', type=int, default=200)
+    parser.add_argument('--stations', help='Number of synthetic StationXML \
+        files (default: 100)', type=int, default=100)
+    parser.add_argument('--page_size', help='Size of each page in bytes \
+        (default: 100000)', type=int, default=100000)
+    parser.add_argument('--latency', help='Delay of every request in seconds\
+        (default: 0.01)', type=float, default=0.01)
+    parser.add_argument('--failure_rate', help='Fraction of failed requests\
+        for the retry run (default: 0.05)', type=float, default=0.05)
+    parser.add_argument('--workers', help='Comma separated numbers of \
+        upload threads (default: 1,8)', type=str, default='1,8')
+    parser.add_argument('--port', help='Port of the stand-in server, the \
+        scripts use 8000 (default: 8000)', type=int, default=8000)
+    args = parser.parse_args()
+
+    workspace = tempfile.mkdtemp(prefix='benchmark_upload_')
+    try:
+        output_path = make_workspace(workspace, args.events, args.stations,
+                                                            args.page_size)
+        server = jane_standin.serve(port=args.port, latency=args.latency)
+        print('{} events, {} stations, {:.0f} ms latency, {}'.format(
+                args.events, args.stations, args.latency * 1000,
+                server.root_path))
+        print('{:<24} {:>10} {:>13} {:>17}'.format('', 'wall time',
+                                                'throughput', 'requests'))
+
+        for workers in [int(W) for W in args.workers.split(',')]:
+            server.store.__init__()
+            ledger = os.path.join(output_path, '.upload_ledger.sqlite')
+            if os.path.exists(ledger):
+                os.remove(ledger)
+            uploader = [UPLOADER, '--timespan', 'all',
+                        '--workers', str(workers)]
+            run('upload ({} threads)'.format(workers), server, args.events,
+                                                        uploader, workspace)
+            run('synced ({} threads)'.format(workers), server, args.events,
+                                                        uploader, workspace)
+
+            # reprocessed events change their pages
+            changed = sorted(T for T in os.listdir(output_path)
+                             if not T.startswith('.'))[::10]
+            for tag in changed:
+                with open(os.path.join(output_path, tag,
+                            '{}_RLAS_page_3.png'.format(tag)), 'wb') as f:
+                    f.write(os.urandom(args.page_size))
+            run('sync ({} threads)'.format(workers), server, len(changed),
+                                        uploader + ['--sync'], workspace)
+
+            # upload with failures, retried by the uploader
+            server.store.__init__()
+            os.remove(ledger)
+            server.failure_rate = args.failure_rate
+            run('retry ({} threads)'.format(workers), server, args.events,
+                                                        uploader, workspace)
+            server.failure_rate = 0.
+
+            # failures after the requests were applied, the posts are not
+            # retried blindly
+            server.store.__init__()
+            os.remove(ledger)
+            server.failure_after_rate = args.failure_rate
+            run('applied ({} threads)'.format(workers), server, args.events,
+                                                        uploader, workspace)
+            server.failure_after_rate = 0.
+            if duplicate_attachments(server):
+                print('{} duplicate attachment(s)'.format(
+                                            duplicate_attachments(server)))
+            if complete_events(server) != args.events:
+                print('{} event(s) incomplete'.format(
+                                    args.events - complete_events(server)))
+
+            # resume after an upload interrupted halfway
+            server.store.__init__()
+            os.remove(ledger)
+            process = subprocess.Popen([sys.executable] + uploader,
+                            cwd=workspace, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+            while (process.poll() is None and 
+                            complete_events(server) < args.events // 2):
+                time.sleep(0.01)
+            process.kill()
+            process.wait()
+            incomplete = args.events - complete_events(server)
+            assert incomplete > 0, 'upload finished before it was killed'
+            run('resume ({} threads)'.format(workers), server,
+                                        incomplete, uploader, workspace)
+
+            if complete_events(server) != args.events:
+                print('{} event(s) incomplete'.format(
+                                    args.events - complete_events(server)))
+
+        populate_path = os.path.join(workspace, 'populate_database')
+        run('stationxml', server, args.stations, [DB_REQUEST, '--action',
+            'put', '--pick', 'stationxml', '--fileid', 'all'], populate_path)
+        run('wipe', server, args.events, [DB_REQUEST, '--action', 'wipe',
+            '--pick', 'quakeml'], populate_path, stdin='yes\n')
+
+        server.shutdown()
+    finally:
+        shutil.rmtree(workspace)
@@ -0,0 +1,505 @@
+"""
+Offline end-to-end benchmark of waveformCompare.py with synthetic plane
+waves. For each distance category (far, local, close) a synthetic event is
+created and the waveforms of the stations are generated for a plane wave with
+known backazimuth and phase velocity: the transverse acceleration is a
+band-limited random wave train with a decaying coda that lasts until the end
+of the record, as the analysis windows of the phase velocity bands reach far
+into it. The vertical rotation rate follows from
+
+    rotation rate = transverse acceleration / (2 * phase velocity)
+
+and an independent wave train on the radial component makes the backazimuth
+resolvable. Noise of the same band is added to both with the same relation,
+so every phase velocity band has the same signal-to-noise ratio. The
+waveforms are converted to counts with the instrument responses that
+remove_instr_resp() removes and are handed to the pipeline by a replaced
+download_data(), everything else runs unchanged: process_stations() with the
+pages, the products and the .json and QuakeML files in a temporary folder.
+
+Every run is done in a fresh forked process, reported are its wall time, its
+peak memory (maximum resident set size) and the time spent in each stage of
+the pipeline, nested stages are not counted twice. The estimated backazimuth
+and the median of the mean phase velocities of the frequency bands in the 
+.json file are checked against the synthetic truth, the benchmark exits with
+an error if they are off. The median, as the analysis of a band may only see
+the last windows of the record, where the response removal leaves edge 
+effects that do not show in the rotation rate. Page 1 uses the map backgrounds in ./map_cache/, run it from
+the usual working directory or expect the first run to render them.
+
+# all cases, all pages, best of 3 runs
+>>> python benchmarks/benchmark_waveformCompare.py --repeat 3
+
+# analysis only, two stations processed in parallel as in production
+>>> python benchmarks/benchmark_waveformCompare.py --pages none \
+        --stations RLAS,ROMY --parallel
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import functools
+import traceback
+import multiprocessing
+from collections import OrderedDict
+
+import numpy as np
+from obspy.core.stream import Stream
+from obspy.core.trace import Trace
+from obspy.signal.filter import bandpass
+from obspy.signal.rotate import rotate_ne_rt
+from obspy.core.utcdatetime import UTCDateTime
+from obspy.geodetics.base import gps2dist_azimuth
+from obspy.core.event import Event, Origin, Magnitude, CreationInfo, \
+                                                            EventDescription
+
+PACKAGE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_PATH)
+import waveformCompare as wc
+
+# synthetic events: epicentre [deg], phase velocity [km/s] of the plane wave
+# and decay time [s] of its coda, one per distance category of is_local()
+CASES = OrderedDict([
+    ('far', {'latitude': 35., 'longitude': 140., 'velocity': 4.4,
+             'coda': 3600.}),
+    ('local', {'latitude': 45., 'longitude': 20., 'velocity': 3.8,
+               'coda': 2400.}),
+    ('close', {'latitude': 48.5, 'longitude': 13.5, 'velocity': 3.2,
+               'coda': 1800.})])
+ORIGIN_TIME = UTCDateTime('2017-09-08T04:49:00')
+DEPTH = 20000.
+
+# raw data as served by the archives: 20 Hz from 180 s before to 3 h after
+# the origin, rotation rate sensitivities [counts/(nrad/s)] and STS2 poles
+# and zeros of remove_instr_resp(), translations of the stations
+SAMPLING_RATE = 20.
+ROTATION_SENSITIVITY = {'RLAS': 6.3191e3, 'ROMY': 1.01821e4}
+PAZ_STS2 = {'poles': [(-0.0367429 + 0.036754j), (-0.0367429 - 0.036754j)],
+            'sensitivity': 0.944019640,
+            'zeros': [0j],
+            'gain': 1.0}
+TRANSLATION_STATIONS = {'WET': 'RLAS', 'FUR': 'ROMY'}
+
+# frequency range [Hz] of the waves and the noise, wider than the phase 
+# velocity bands of waveformCompare.py, and peak transverse acceleration 
+# [nm/s^2] of the waves
+FREQMIN, FREQMAX = 0.005, 2.0
+PEAK_ACCELERATION = 1e4
+
+# functions of waveformCompare.py timed as stages, in order of the pipeline
+STAGES = ['download_data', 'event_info_data', 'resample', 'remove_instr_resp',
+          'filter_and_rotate', 'ps_arrival_times', 'time_windows',
+          'get_corrcoefs', 'estimate_baz', 'get_phase_vel', 'baz_analysis',
+          'station_information', 'store_products', 'render_page',
+          'EventResult.write']
+
+
+def make_event(case):
+
+    """
+    Synthetic event of one of the CASES with the attributes the pipeline
+    reads from a GCMT event.
+
+    :type case: str
+    :param case: far, local or close
+    :rtype: :class: `~obspy.core.event.event.Event`
+    """
+    origin = Origin(time=ORIGIN_TIME, latitude=CASES[case]['latitude'],
+                    longitude=CASES[case]['longitude'], depth=DEPTH,
+                    creation_info=CreationInfo(author='GCMT'))
+    magnitude = Magnitude(mag=7.0, magnitude_type='Mw')
+    event = Event(origins=[origin], magnitudes=[magnitude],
+                  event_descriptions=[EventDescription(
+                                        text='SYNTHETIC {}'.format(case),
+                                        type='Flinn-Engdahl region')])
+    event.preferred_origin_id = origin.resource_id
+    event.preferred_magnitude_id = magnitude.resource_id
+    return event
+
+
+def band_limited(rng, npts):
+
+    """
+    :rtype: numpy.ndarray
+    :return: White noise bandpass filtered from FREQMIN to FREQMAX with unit
+        standard deviation.
+    """
+    data = bandpass(rng.randn(npts), FREQMIN, FREQMAX, SAMPLING_RATE,
+                    corners=4, zerophase=True)
+    return data / data.std()
+
+
+def wave_train(rng, time, onset, coda):
+
+    """
+    Random wave train from FREQMIN to FREQMAX, its envelope rises within 
+    coda/20 after the onset and decays exponentially, normalized to 
+    PEAK_ACCELERATION.
+
+    :type rng: :class: `numpy.random.RandomState`
+    :type time: numpy.ndarray
+    :param time: Time since the start of the trace [s].
+    :type onset: float
+    :param onset: Arrival of the wave train [s].
+    :type coda: float
+    :param coda: Decay time of the envelope [s].
+    """
+    lapse = np.clip(time - onset, 0., None)
+    envelope = (1. - np.exp(-20. * lapse / coda)) * np.exp(-lapse / coda)
+    data = band_limited(rng, len(time)) * envelope
+    return data * PEAK_ACCELERATION / abs(data).max()
+
+
+def plane_wave(event, station, velocity, coda, noise, seed):
+
+    """
+    Raw data of one station for a plane wave from the event.
+
+    :type station: str
+    :param station: RLAS or ROMY
+    :type velocity: float
+    :param velocity: Phase velocity [km/s].
+    :type noise: float
+    :param noise: Standard deviation of the noise relative to the standard
+        deviation of the transverse acceleration in the first coda/2 s.
+    :rtype: tuple
+    :return: dictionary of the raw data per channel, true backazimuth [deg]
+    """
+    origin = event.origins[0]
+    station_lat, station_lon = wc.STATION_COORDINATES[station]
+    distance, _, backazimuth = gps2dist_azimuth(origin.latitude,
+                                origin.longitude, station_lat, station_lon)
+
+    npts = int(round((3 * 3600 + 180) * SAMPLING_RATE)) + 1
+    time = np.arange(npts) / SAMPLING_RATE
+    onset = 180. + distance * 1e-3 / velocity
+    rng = np.random.RandomState(seed)
+    transverse = wave_train(rng, time, onset, coda)
+    radial = wave_train(rng, time, onset, coda)
+    sigma = noise * transverse[(time >= onset) &
+                               (time < onset + coda / 2)].std()
+
+    # nm/s^2 / (m/s) = nrad/s, the sign follows the 'normal' polarity
+    rotation = (transverse + sigma * band_limited(rng, npts)) / (
+                                                        2 * velocity * 1e3)
+    transverse = transverse + sigma * band_limited(rng, npts)
+    radial = radial + sigma * band_limited(rng, npts)
+
+    # inverse of rotate_ne_rt()
+    ba = np.radians(backazimuth)
+    north = - radial * np.cos(ba) + transverse * np.sin(ba)
+    east = - radial * np.sin(ba) - transverse * np.cos(ba)
+    assert np.allclose(rotate_ne_rt(north, east, backazimuth)[1], transverse)
+
+    data = {'BJZ': rotation * ROTATION_SENSITIVITY[station],
+            'BHN': north, 'BHE': east,
+            'BHZ': 0.5 * radial + sigma * band_limited(rng, npts)}
+    for channel in ['BHN', 'BHE', 'BHZ']:
+        trace = Trace(data=data[channel], header={
+                                        'sampling_rate': SAMPLING_RATE})
+        trace.simulate(paz_simulate=PAZ_STS2, simulate_sensitivity=True)
+        data[channel] = trace.data
+    return data, backazimuth
+
+
+def install_synthetics(event, stations, velocity, coda, noise, seed):
+
+    """
+    Replaces download_data() of waveformCompare.py by one serving the plane
+    wave of each station and sets the globals set by its __main__.
+
+    :type seed: int
+    :param seed: Seed of the wave trains and the noise of the first station,
+        the following stations count up from it.
+
+    :rtype: dict
+    :return: true backazimuth [deg] per station
+    """
+    data, backazimuths = {}, {}
+    for I, station in enumerate(stations):
+        data[station], backazimuths[station] = plane_wave(event, station,
+                                            velocity, coda, noise, seed + I)
+
+    def download_data(origin_time, instrument_id, source):
+        net, sta, loc, cha = instrument_id.split('.')
+        trace = Trace(data=data[TRANSLATION_STATIONS.get(sta, sta)][cha].copy(),
+                      header={'network': net, 'station': sta, 'location': loc,
+                              'channel': cha, 'sampling_rate': SAMPLING_RATE,
+                              'starttime': origin_time - 180})
+        return Stream([trace]), 'synthetic'
+
+    wc.download_data = download_data
+    wc.polarity = 'normal'
+    wc.instrument = 'STS2'
+    wc.catalog = 'GCMT'
+    wc.bars = '=' * 79
+    return backazimuths
+
+
+class StageTimer(object):
+
+    """
+    Wall time per stage, the time of nested stages is only counted for the
+    innermost one. Stages are timed by replacing the functions of
+    waveformCompare.py, see wrap().
+    """
+    def __init__(self):
+        self.times = OrderedDict((S, 0.) for S in STAGES)
+        self.nested = []
+
+    def wrap(self, stage, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            self.nested.append(0.)
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.time() - start
+                self.times[stage] += elapsed - self.nested.pop()
+                if self.nested:
+                    self.nested[-1] += elapsed
+        return timed
+
+    def install(self):
+        for stage in STAGES:
+            if stage == 'EventResult.write':
+                wc.EventResult.write = self.wrap(stage, wc.EventResult.write)
+            else:
+                setattr(wc, stage, self.wrap(stage, getattr(wc, stage)))
+
+
+def peak_memory():
+
+    """
+    :rtype: float
+    :return: maximum resident set size [MB] of the process and of its
+        children, whichever is larger
+    """
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024.
+
+
+def check_results(result, stations, backazimuths, case, baz_tolerance,
+                                                        velocity_tolerance):
+
+    """
+    Compares the .json results with the synthetic truth.
+
+    :type result: :class: `~waveformCompare.EventResult`
+    :type baz_tolerance: float
+    :param baz_tolerance: Allowed error of the estimated backazimuth [deg].
+    :type velocity_tolerance: float
+    :param velocity_tolerance: Allowed relative error of the median of the
+        mean phase velocities of the bands with a result.
+    :rtype: tuple
+    :return: estimated backazimuths and mean phase velocities per station,
+        list of failed checks
+    """
+    velocity = CASES[case]['velocity']
+    estimates, failures = OrderedDict(), []
+    for station in stations:
+        dic_station = result.station(station)
+        if dic_station is None:
+            failures.append('{}: no results'.format(station))
+            continue
+        parameters = dic_station['rotational_parameters']
+        if parameters['distance_category'] != case:
+            failures.append('{}: distance category {}'.format(station,
+                                            parameters['distance_category']))
+
+        EBA = parameters['estimated_backazimuth']
+        error = (EBA - backazimuths[station] + 180.) % 360. - 180.
+        if not abs(error) <= baz_tolerance:
+            failures.append('{}: EBA {} deg, true {:.1f} deg'.format(station,
+                                                EBA, backazimuths[station]))
+
+        bands = OrderedDict()
+        for name, band in dic_station['phase_velocities'].items():
+            if band['mean_phase_vel'] != band['mean_phase_vel']:
+                continue
+            bands[name] = band['mean_phase_vel']
+        if not bands:
+            failures.append('{}: no phase velocities'.format(station))
+        elif abs(np.median(list(bands.values())) / velocity - 1.) > \
+                                                        velocity_tolerance:
+            failures.append('{}: phase velocity {:.2f} km/s, true {} km/s'
+                    .format(station, np.median(list(bands.values())), velocity))
+        estimates[station] = (EBA, bands)
+    return estimates, failures
+
+
+def benchmark_case(case, args, connection):
+
+    """
+    One run of a case, meant for a forked process. The record of the run,
+    see run_case(), is sent through the connection.
+    """
+    try:
+        stations = args.stations.split(',')
+        event = make_event(case)
+        backazimuths = install_synthetics(event, stations,
+                CASES[case]['velocity'], CASES[case]['coda'], args.noise,
+                args.seed)
+        wc.PAGES = args.pages
+        wc.PRODUCTS = not args.no_products
+        wc.CHECKPOINT_PATH = None
+        wc.MANIFEST = wc.PAGE_RENDERER = wc.UPLOADER = None
+        timer = StageTimer()
+        timer.install()
+
+        workspace = tempfile.mkdtemp(prefix='benchmark_waveformCompare_')
+        try:
+            tag_name = 'GCMT_{}_SYNTHETIC_{}'.format(
+                            ORIGIN_TIME.strftime('%Y-%m-%dT%H%M%SZ'),
+                            case.upper())
+            folder_name = os.path.join(workspace, tag_name)
+            os.makedirs(folder_name)
+
+            baseline = peak_memory()
+            start = time.time()
+            stdout = sys.stdout
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                wc.process_stations(event, stations, 'GCMT', folder_name,
+                                    tag_name, parallel=args.parallel)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            elapsed = time.time() - start
+
+            result = wc.EventResult(event, folder_name, tag_name)
+            estimates, failures = check_results(result, stations,
+                        backazimuths, case, args.baz_tolerance,
+                        args.velocity_tolerance)
+        finally:
+            shutil.rmtree(workspace)
+
+        connection.send({'wall_time': elapsed, 'peak_memory': peak_memory(),
+                         'baseline_memory': baseline, 'stages': timer.times,
+                         'backazimuths': backazimuths, 'estimates': estimates,
+                         'failures': failures})
+    except Exception:
+        connection.send({'error': traceback.format_exc()})
+    finally:
+        connection.close()
+
+
+def run_case(case, args):
+
+    """
+    Runs a case in a forked process, so the peak memory of every run is its
+    own and the stage functions are replaced only there.
+
+    :rtype: dict
+    :return: wall_time [s], peak_memory and baseline_memory (before the
+        processing) [MB], stages (wall time [s] per stage), backazimuths
+        (truth per station), estimates (EBA and phase velocities per station)
+        and failures (failed checks)
+    """
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=benchmark_case,
+                              args=(case, args, sender))
+    process.start()
+    sender.close()
+    try:
+        record = receiver.recv()
+    except EOFError:
+        record = None
+    process.join()
+    if record is None:
+        record = {'error': 'exit code {}'.format(process.exitcode)}
+    if 'error' in record:
+        raise RuntimeError('{} case failed:\n{}'.format(case, record['error']))
+    return record
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline benchmark of \
+        waveformCompare.py with synthetic plane waves of known backazimuth \
+        and phase velocity.')
+    parser.add_argument('--cases', help='Comma separated distance categories\
+        (default: far,local,close)', type=str, default='far,local,close')
+    parser.add_argument('--stations', help='Comma separated stations, RLAS \
+        and/or ROMY (default: RLAS)', type=str, default='RLAS')
+    parser.add_argument('--parallel', help='Process the stations in parallel\
+        processes as in production, their stages are not timed',
+                                                        action='store_true')
+    parser.add_argument('--pages', help='Comma separated pages to render or\
+        none (default: 1,2,3,4)', type=str, default='1,2,3,4')
+    parser.add_argument('--no_products', help='Do not store the analysis \
+        products', action='store_true')
+    parser.add_argument('--noise', help='Standard deviation of the noise \
+        relative to the signal (default: 0.05)', type=float, default=0.05)
+    parser.add_argument('--seed', help='Seed of the synthetic waveforms \
+        (default: 0)', type=int, default=0)
+    parser.add_argument('--repeat', help='Runs per case, the fastest is \
+        reported (default: 1)', type=int, default=1)
+    parser.add_argument('--baz_tolerance', help='Allowed error of the \
+        estimated backazimuth in degrees (default: 5)', type=float, default=5.)
+    parser.add_argument('--velocity_tolerance', help='Allowed relative \
+        error of the median phase velocity of the bands (default: 0.05)',
+                                                    type=float, default=0.05)
+    args = parser.parse_args()
+
+    cases = args.cases.split(',')
+    for case in cases:
+        if case not in CASES:
+            sys.exit('Unknown case: {}'.format(case))
+    for station in args.stations.split(','):
+        if station not in ROTATION_SENSITIVITY:
+            sys.exit('No synthetic data for station: {}'.format(station))
+    if args.pages.lower() == 'none':
+        args.pages = []
+    else:
+        args.pages = sorted(set(int(N) for N in args.pages.split(',')))
+
+    print('{} station(s), pages {}, {:.0%} noise, best of {}'.format(
+                args.stations, args.pages or 'none', args.noise, args.repeat))
+    print('{:<8} {:>10} {:>10} {:>10}   {}'.format('', 'wall time',
+                                        'peak RSS', 'increase', 'checks'))
+    records, failures = OrderedDict(), []
+    for case in cases:
+        runs = [run_case(case, args) for _ in range(max(args.repeat, 1))]
+        record = records[case] = min(runs, key=lambda R: R['wall_time'])
+        failed = [F for R in runs for F in R['failures']]
+        failures.extend('{} {}'.format(case, F) for F in sorted(set(failed)))
+        print('{:<8} {:>8.2f} s {:>7.0f} MB {:>7.0f} MB   {}'.format(case,
+                record['wall_time'], record['peak_memory'],
+                record['peak_memory'] - record['baseline_memory'],
+                'failed' if failed else 'passed'))
+
+    # per-stage timings, the rest is spent between the stages
+    if args.parallel:
+        print('\nStages run in the station processes, not timed')
+    else:
+        print('\n{:<20}'.format('stage [s]') + ''.join('{:>9}'.format(C)
+                                                            for C in records))
+        for stage in STAGES:
+            print('{:<20}'.format(stage) + ''.join('{:>9.2f}'.format(
+                            R['stages'][stage]) for R in records.values()))
+        print('{:<20}'.format('other') + ''.join('{:>9.2f}'.format(
+                            R['wall_time'] - sum(R['stages'].values()))
+                            for R in records.values()))
+
+    # recovered parameters of the fastest runs against the truth
+    print('\n{:<8} {:<8} {:>8} {:>8} {:>9} {:>7}   {}'.format('case', 
+                'station', 'true BAz', 'EBA', 'true vel', 'median',
+                'phase velocities per band [km/s]'))
+    for case, record in records.items():
+        for station, (EBA, bands) in record['estimates'].items():
+            print('{:<8} {:<8} {:>8.1f} {:>8} {:>9.2f} {:>7.2f}   {}'.format(
+                    case, station, record['backazimuths'][station], EBA,
+                    CASES[case]['velocity'], 
+                    np.median(list(bands.values()) or [np.nan]), 
+                    ' '.join('{:.2f}'.format(V) for V in bands.values())))
+
+    if failures:
+        print('\nFailed checks:')
+        for failure in failures:
+            print(failure)
+        sys.exit(1)
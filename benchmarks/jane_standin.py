@@ -0,0 +1,390 @@
+"""
+Local stand-in for the REST interface of the JANE database, for testing and
+benchmarking event_upload_rotjane.py and populate_database/db_request.py
+without a live server. Documents and attachments are kept in memory.
+
+Implemented are the endpoints used by these scripts:
+
+    /rest/documents/<type>/                               GET (paginated)
+    /rest/documents/<type>/<name>                         GET, PUT, DELETE
+    /rest/documents/<type>/<name>/data                    GET
+    /rest/document_indices/<type>/<id>                    GET
+    /rest/document_indices/<type>/<id>/attachments        GET, POST
+    /rest/document_indices/<type>/<id>/attachments/<id>   GET, PUT, DELETE
+
+As with JANE, putting a document with unchanged content answers 409 and
+putting changed content replaces the document index together with its
+attachments. Listings are paginated with limit and offset query parameters
+and a 'next' link.
+
+Injected failures answer 503 before the request is applied (failure_rate)
+or 500 after it was applied (failure_after_rate), like a server that fails
+while sending the response.
+
+# serve on the address the scripts use, 20 ms per request, 1% failures
+>>> python benchmarks/jane_standin.py --port 8000 --latency 0.02 \
+        --failure_rate 0.01
+
+# 1% of the requests fail after they were applied
+>>> python benchmarks/jane_standin.py --failure_after_rate 0.01
+"""
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import datetime
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class JaneStore(object):
+
+    """
+    In-memory documents, indices and attachments of the stand-in server.
+    All access goes through one lock.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.documents = {}         # (type, name) > document dictionary
+        self.indices = {}           # index id > (type, name)
+        self.attachments = {}       # index id > {attachment id > attachment}
+        self.counter = 0
+        self.requests = 0
+
+    def next_id(self):
+        self.counter += 1
+        return self.counter
+
+    @staticmethod
+    def now():
+        return datetime.datetime.utcnow().isoformat()
+
+
+class JaneHandler(BaseHTTPRequestHandler):
+
+    """
+    Request handler, settings are attributes of the server: store, latency
+    [s], failure_rate, failure_after_rate and random (seeded random.Random).
+    """
+    protocol_version = 'HTTP/1.1'
+    page_size = 100
+    fail_after_apply = False
+
+    # headers and body are written separately, without TCP_NODELAY every
+    # response waits for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    # ------------------------------------------------------------------------
+    def base(self):
+        return 'http://{}:{}/rest/'.format(*self.server.server_address[:2])
+
+    def document_json(self, doc_type, document):
+        base = self.base()
+        index_id = document['index']
+        return {
+            'id': document['id'],
+            'url': base + 'documents/{}/{}'.format(doc_type, document['name']),
+            'name': document['name'],
+            'data_url': base + 'documents/{}/{}/data'.format(
+                                                    doc_type, document['name']),
+            'sha1': document['sha1'],
+            'filesize': len(document['data']),
+            'created_at': document['created_at'],
+            'modified_at': document['modified_at'],
+            'indices': [self.index_json(doc_type, index_id)]}
+
+    def index_json(self, doc_type, index_id):
+        base = self.base()
+        url = base + 'document_indices/{}/{}'.format(doc_type, index_id)
+        return {'id': index_id,
+                'url': url,
+                'attachments_count': len(self.server.store.attachments.get(
+                                                                index_id, {})),
+                'attachments_url': url + '/attachments'}
+
+    def attachment_json(self, doc_type, index_id, attachment):
+        url = self.base() + 'document_indices/{}/{}/attachments/{}'.format(
+                                            doc_type, index_id, attachment['id'])
+        return {'id': attachment['id'],
+                'url': url,
+                'data_url': url + '/data',
+                'category': attachment['category'],
+                'content_type': attachment['content_type'],
+                'sha1': attachment['sha1'],
+                'created_at': attachment['created_at'],
+                'modified_at': attachment['modified_at']}
+
+    # ------------------------------------------------------------------------
+    def respond(self, status, body=None, content_type='application/json'):
+        if self.fail_after_apply:
+            self.fail_after_apply = False
+            return self.error(500, 'Injected failure after apply')
+        if body is None:
+            data = b''
+        elif isinstance(body, bytes):
+            data = body
+        else:
+            data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def error(self, status, reason):
+        self.respond(status, {'status': status, 'reason': reason})
+
+    def body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length)
+
+    def handle_request(self, method):
+        server = self.server
+        data = self.body()
+        time.sleep(server.latency)
+        with server.store.lock:
+            server.store.requests += 1
+            fail = server.random.random() < server.failure_rate
+            self.fail_after_apply = \
+                        server.random.random() < server.failure_after_rate
+        if fail:
+            self.fail_after_apply = False
+            return self.error(503, 'Injected failure')
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        path = url.path
+
+        match = re.match(r'^/rest/documents/(\w+)/?$', path)
+        if match and method == 'GET':
+            return self.list_documents(match.group(1), query)
+        match = re.match(r'^/rest/documents/(\w+)/([^/]+)(/data)?$', path)
+        if match:
+            return self.document(method, match.group(1), match.group(2),
+                                 bool(match.group(3)), data)
+        match = re.match(r'^/rest/document_indices/(\w+)/(\d+)'
+                         r'(/attachments)?(?:/(\d+))?(/data)?/?$', path)
+        if match:
+            doc_type, index_id = match.group(1), int(match.group(2))
+            if not match.group(3):
+                return self.index(method, doc_type, index_id)
+            attachment_id = match.group(4) and int(match.group(4))
+            return self.attachment(method, doc_type, index_id, attachment_id,
+                                   bool(match.group(5)), data)
+        self.error(404, 'Not found')
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+    # ------------------------------------------------------------------------
+    def list_documents(self, doc_type, query):
+        store = self.server.store
+        limit = int(query.get('limit', [self.page_size])[0])
+        offset = int(query.get('offset', [0])[0])
+        with store.lock:
+            names = sorted(N for T, N in store.documents if T == doc_type)
+            results = [self.document_json(doc_type,
+                                        store.documents[(doc_type, N)])
+                                        for N in names[offset:offset + limit]]
+        next_url = None
+        if offset + limit < len(names):
+            next_url = self.base() + 'documents/{}/?limit={}&offset={}'.format(
+                                                doc_type, limit, offset + limit)
+        previous_url = None
+        if offset > 0:
+            previous_url = self.base() + \
+                            'documents/{}/?limit={}&offset={}'.format(
+                                    doc_type, limit, max(offset - limit, 0))
+        self.respond(200, {'count': len(names), 'next': next_url,
+                           'previous': previous_url, 'results': results})
+
+    def document(self, method, doc_type, name, data_only, data):
+        store = self.server.store
+        key = (doc_type, name)
+        with store.lock:
+            document = store.documents.get(key)
+            if method == 'GET':
+                if document is None:
+                    return self.error(404, 'Not found')
+                if data_only:
+                    return self.respond(200, document['data'],
+                                                    'application/octet-stream')
+                return self.respond(200, self.document_json(doc_type, document))
+
+            if method == 'PUT' and not data_only:
+                sha1 = hashlib.sha1(data).hexdigest()
+                if document is not None and document['sha1'] == sha1:
+                    return self.error(409, 'File already exists in database')
+                now = store.now()
+                if document is None:
+                    document = {'id': store.next_id(), 'name': name,
+                                'created_at': now}
+                    status = 201
+                else:
+                    # re-indexing drops the old index and its attachments
+                    store.indices.pop(document['index'], None)
+                    store.attachments.pop(document['index'], None)
+                    status = 204
+                index_id = store.next_id()
+                document.update({'data': data, 'sha1': sha1, 'index': index_id,
+                                 'modified_at': now})
+                store.documents[key] = document
+                store.indices[index_id] = key
+                store.attachments[index_id] = {}
+                return self.respond(status)
+
+            if method == 'DELETE' and not data_only:
+                if document is None:
+                    return self.error(404, 'Not found')
+                del store.documents[key]
+                store.indices.pop(document['index'], None)
+                store.attachments.pop(document['index'], None)
+                return self.respond(204)
+
+        self.error(405, 'Method not allowed')
+
+    def index(self, method, doc_type, index_id):
+        store = self.server.store
+        with store.lock:
+            if store.indices.get(index_id, (None,))[0] != doc_type:
+                return self.error(404, 'Not found')
+            if method == 'GET':
+                return self.respond(200, self.index_json(doc_type, index_id))
+        self.error(405, 'Method not allowed')
+
+    def attachment(self, method, doc_type, index_id, attachment_id, data_only,
+                                                                        data):
+        store = self.server.store
+        with store.lock:
+            if store.indices.get(index_id, (None,))[0] != doc_type:
+                return self.error(404, 'Not found')
+            attachments = store.attachments[index_id]
+
+            if attachment_id is None:
+                if method == 'GET':
+                    results = [self.attachment_json(doc_type, index_id, A)
+                               for _, A in sorted(attachments.items())]
+                    return self.respond(200, {'count': len(results),
+                                              'results': results})
+                if method == 'POST':
+                    if not self.headers.get('category'):
+                        return self.error(400, 'category header required')
+                    attachment = {'id': store.next_id(),
+                                  'created_at': store.now()}
+                    self.update_attachment(attachment, data)
+                    attachments[attachment['id']] = attachment
+                    return self.respond(201)
+                return self.error(405, 'Method not allowed')
+
+            attachment = attachments.get(attachment_id)
+            if attachment is None:
+                return self.error(404, 'Not found')
+            if method == 'GET':
+                if data_only:
+                    return self.respond(200, attachment['data'],
+                                                    attachment['content_type'])
+                return self.respond(200, self.attachment_json(doc_type,
+                                                        index_id, attachment))
+            if method == 'PUT' and not data_only:
+                self.update_attachment(attachment, data)
+                return self.respond(204)
+            if method == 'DELETE' and not data_only:
+                del attachments[attachment_id]
+                return self.respond(204)
+        self.error(405, 'Method not allowed')
+
+    def update_attachment(self, attachment, data):
+        attachment.update({
+            'data': data,
+            'sha1': hashlib.sha1(data).hexdigest(),
+            'category': self.headers.get('category',
+                                            attachment.get('category', '')),
+            'content_type': self.headers.get('content-type',
+                                attachment.get('content_type', 'text/plain')),
+            'modified_at': JaneStore.now()})
+
+
+class JaneServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients going away mid-request, i.e. a killed uploader
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(self, request, client_address)
+
+
+def serve(host='127.0.0.1', port=8000, latency=0., failure_rate=0.,
+          failure_after_rate=0., seed=0):
+
+    """
+    Starts the stand-in server in a background thread.
+
+    :type port: int
+    :param port: Port to serve on, 0 picks a free port.
+    :type latency: float
+    :param latency: Delay of every request in seconds.
+    :type failure_rate: float
+    :param failure_rate: Fraction of requests answered with 503.
+    :type failure_after_rate: float
+    :param failure_after_rate: Fraction of requests answered with 500 after
+        they were applied.
+    :rtype: :class: `JaneServer`
+    :return: Running server, the documents are in server.store, its REST
+        root in server.root_path. Stop it with server.shutdown().
+    """
+    server = JaneServer((host, port), JaneHandler)
+    server.store = JaneStore()
+    server.latency = latency
+    server.failure_rate = failure_rate
+    server.failure_after_rate = failure_after_rate
+    server.random = random.Random(seed)
+    server.root_path = 'http://{}:{}/rest/'.format(*server.server_address[:2])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the \
+        REST interface of the JANE database.')
+    parser.add_argument('--port', help='Port to serve on (default: 8000)',
+                                                    type=int, default=8000)
+    parser.add_argument('--latency', help='Delay of every request in seconds\
+        (default: 0)', type=float, default=0.)
+    parser.add_argument('--failure_rate', help='Fraction of requests \
+        answered with 503 Service Unavailable (default: 0)', type=float,
+                                                                default=0.)
+    parser.add_argument('--failure_after_rate', help='Fraction of requests \
+        applied and then answered with 500 Internal Server Error (default: 0)',
+                                                    type=float, default=0.)
+    parser.add_argument('--seed', help='Seed of the failure injection \
+        (default: 0)', type=int, default=0)
+    args = parser.parse_args()
+
+    server = serve(port=args.port, latency=args.latency,
+                   failure_rate=args.failure_rate,
+                   failure_after_rate=args.failure_after_rate, seed=args.seed)
+    print('Serving {}'.format(server.root_path))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit()
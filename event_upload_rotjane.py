@@ -1,20 +1,27 @@
 """04.10.17
 For interacting with Rotational Jane database:
-to upload events from event folders as quakeml files 
+to upload events from event folders as quakeml files
 attach .png and .json files to each quakeml through REST format
 """
 import re
 import os
 import sys
+import time
 import glob
+import random
+import sqlite3
+import hashlib
 import argparse
 import requests
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.exceptions import NewConnectionError
 
-# settings 
+# settings
 root_path = 'http://127.0.0.1:8000/rest/'
 authority = ('nico','Password1')
 OUTPUT_PATH = os.path.abspath('./OUTPUT/')
+ERRORLOG_PATH = os.path.join(os.path.dirname(OUTPUT_PATH), 'errorlogs')
 # our apache is serving this via https now, so we have to use the Geophysik
 # root certificate
 # the certificate was switched to an official DFN certificate (that should be
@@ -26,165 +33,528 @@ requests_kwargs = {
     # 'verify': SSL_ROOT_CERTIFICATE,
     }
 
-# command line arguments
-parser = argparse.ArgumentParser(description='Upload event quakeml and \
-    post attachments to rotational Jane database.')
-parser.add_argument('--timespan', help='What time span to upload files for, \
-    options are the past [week] (default), or [all] events available.', 
-                                                type=str, default='week')
-args = parser.parse_args()
-timespan = args.timespan
-
 # for attachments
 head_p1 = {'content-type': 'image/png',
-                 'category': 'Event Information'} 
+                 'category': 'Event Information'}
 head_p2 = {'content-type': 'image/png',
-                 'category': 'Waveform Comparison'} 
+                 'category': 'Waveform Comparison'}
 head_p3 = {'content-type': 'image/png',
-                 'category': 'Correlation/Backazimuth'} 
+                 'category': 'Correlation/Backazimuth'}
 head_p4 = {'content-type': 'image/png',
-                 'category': 'P-Coda Comparison'} 
+                 'category': 'P-Coda Comparison'}
 headers_json = {'content-type': 'text/json',
-                 'category': 'Processing Results'} 
-
-if timespan == 'week':
-    # look for events in the past week
-    cat = []
-    for J in range(7):
-        past = datetime.datetime.utcnow() - datetime.timedelta(days=J)
-        day = glob.glob(os.path.join(OUTPUT_PATH, 'GCMT_{}*'.format(past.isoformat()[:10])))
-        cat += day
-elif timespan == 'all':
-    # initial population, grab all events in folder
-    cat = glob.glob(os.path.join(OUTPUT_PATH, 'GCMT*')) + \
-        glob.glob(os.path.join(OUTPUT_PATH, 'ISC*'))
-    cat.sort(reverse=True)
-    
-# ============================================================================
-
-error_list,error_type = [],[]
-for event in cat:
-    print(os.path.basename(event))
-    try:
-        os.chdir(event)
-        attachments = glob.glob('*')
-
-        # check: full folder
-        if len(attachments) < 6:
-            error_list.append(event)
-            error_type.append('Attachment Number Too Low: {}'.format(
-                                                            len(attachments)))
-            os.chdir('..')
-            continue
-
-        # assign attachments (kinda hacky)
-        for J in attachments:
-            if '.json' in J:
-                json = J
-            elif '.xml' in J:
-                xml = J
-            elif '_page_1.png' in J:
-                page1 = J
-            elif '_page_2.png' in J:
-                page2 = J
-            elif '_page_3.png' in J:
-                page3 = J
-            elif '_page_4.png' in J:
-                page4 = J
+                 'category': 'Processing Results'}
+
+# number of attachments of a completely uploaded event, 4 pages and .json
+ATTACHMENT_COUNT = 5
+
+# documents per request when listing the database, see remote_documents()
+PAGE_SIZE = 500
+
+# ledger entry of the quakeml document itself, see UploadLedger
+QUAKEML = 'QuakeML'
+
+# failed requests are retried RETRIES times after a random delay of up to
+# BACKOFF seconds, doubled with every retry up to MAX_BACKOFF, see request().
+# POST is only retried on the status codes of requests the server did not
+# apply, see post_attachment()
+RETRIES = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 30.
+RETRY_STATUS = (429, 500, 502, 503, 504)
+NOT_APPLIED_STATUS = (429, 503)
+TIMEOUT = 120.
+
+
+def get_session(workers):
+
+    """
+    One session shared by all upload threads, so connections to the database
+    are kept alive and reused instead of opened for every request.
+
+    :type workers: int
+    :param workers: Number of upload threads, size of the connection pool.
+    :rtype: :class: `requests.Session`
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=max(workers, 1))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    for key, value in requests_kwargs.items():
+        setattr(session, key, value)
+    return session
+
+
+def select_events(timespan):
+
+    """
+    :type timespan: str
+    :param timespan: the past [week] or [all] events in OUTPUT_PATH
+    :rtype: list of str
+    :return: absolute paths of the event folders
+    """
+    if timespan == 'week':
+        # look for events in the past week
+        cat = []
+        for J in range(7):
+            past = datetime.datetime.utcnow() - datetime.timedelta(days=J)
+            day = glob.glob(os.path.join(OUTPUT_PATH, 'GCMT_{}*'.format(
+                                                        past.isoformat()[:10])))
+            cat += day
+    elif timespan == 'all':
+        # initial population, grab all events in folder
+        cat = glob.glob(os.path.join(OUTPUT_PATH, 'GCMT*')) + \
+            glob.glob(os.path.join(OUTPUT_PATH, 'ISC*'))
+        cat.sort(reverse=True)
+    else:
+        sys.exit('Invalid timespan: {}\nValid: week,all'.format(timespan))
+    return cat
+
+
+def backoff(attempt):
+
+    """
+    :rtype: float
+    :return: delay before retry number attempt + 1 [s], exponential backoff
+        with full jitter so threads hitting a busy server don't retry in step
+    """
+    return random.uniform(0, min(MAX_BACKOFF, BACKOFF * 2**attempt))
+
+
+def not_sent(error):
+
+    """
+    :type error: :class: `requests.exceptions.RequestException`
+    :rtype: bool
+    :return: True if the request failed before it was sent, i.e. the
+        connection could not be opened
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def request(session, method, url, filename=None, **kwargs):
+
+    """
+    Sends a request, transient failures (connection errors, timeouts and 
+    the status codes in RETRY_STATUS) are retried with exponential backoff,
+    see backoff(). POST is not idempotent, a POST that may have been applied
+    by the server would store its content twice. It is only retried on the
+    status codes in NOT_APPLIED_STATUS and on connection errors raised
+    before it was sent, other failures are returned or raised to the
+    caller, see post_attachment().
+
+    :type session: :class: `requests.Session`
+    :param session: Session shared by the upload threads, see get_session()
+    :type method: str
+    :param method: GET, PUT, POST or DELETE
+    :type filename: str
+    :param filename: file sent as request body, opened again for every try
+    :rtype: :class: `requests.Response`
+    :return: response of the last try
+    """
+    idempotent = method.upper() != 'POST'
+    retry_status = RETRY_STATUS if idempotent else NOT_APPLIED_STATUS
+    for attempt in range(RETRIES + 1):
+        try:
+            if filename is not None:
+                with open(filename, 'rb') as fh:
+                    r = session.request(method, url, data=fh, 
+                                                    timeout=TIMEOUT, **kwargs)
             else:
-                error_list.append(event)
-                error_type.append('Unidentified Attachment: {}'.format(J))
-
-        # push quakeml file
-        with open(xml,'rb') as fh:
-            r = requests.put(
-                url=root_path + 'documents/quakeml/{}'.format(xml),
-                data=fh, **requests_kwargs)
-
-        # check: already uploaded (409) and check for incomplete folders
-        if r.status_code == 409:
-            r2 = requests.get(
-                url=root_path + 'documents/quakeml/{}'.format(xml),
-                **requests_kwargs)
-            assert r2.ok
+                r = session.request(method, url, timeout=TIMEOUT, **kwargs)
+            if r.status_code not in retry_status or attempt == RETRIES:
+                return r
+        except (requests.exceptions.ConnectionError,
+                                        requests.exceptions.Timeout) as e:
+            if attempt == RETRIES or not (idempotent or not_sent(e)):
+                raise
+        time.sleep(backoff(attempt))
+
+
+def post_attachment(session, attachments_url, filename, headers):
+
+    """
+    Posts an attachment. After a failure the POST may have been applied
+    anyway (server errors, timeouts, connections lost after sending), so
+    instead of posting it again the attachments are listed and one of the
+    same category is replaced by PUT. Only if there is none, the POST is
+    sent again.
+
+    :type session: :class: `requests.Session`
+    :param session: Session shared by the upload threads, see get_session()
+    :type attachments_url: str
+    :param attachments_url: attachments of the document index
+    :type filename: str
+    :param filename: file of the attachment
+    :type headers: dict
+    :param headers: content-type and category of the attachment
+    :rtype: :class: `requests.Response`
+    :return: response of the last request
+    """
+    for attempt in range(RETRIES + 1):
+        try:
+            r = request(session, 'POST', attachments_url, filename,
+                                                            headers=headers)
+            if r.status_code not in RETRY_STATUS or attempt == RETRIES:
+                return r
+        except (requests.exceptions.ConnectionError, 
+                                            requests.exceptions.Timeout):
+            if attempt == RETRIES:
+                raise
+        time.sleep(backoff(attempt))
+
+        r = request(session, 'GET', attachments_url)
+        if not r.ok:
+            return r
+        for attachment in r.json()['results']:
+            if attachment['category'] == headers['category']:
+                return request(session, 'PUT', attachment['url'], filename,
+                                                            headers=headers)
 
-            try:
-                att_count = r2.json()['indices'][0]['attachments_count']
-                if att_count == 5:
-                    os.chdir('..')
-                    continue
-                elif att_count != 5:
-                    error_list.append(event)
-                    error_type.append('Already Uploaded; Attachment Count Error')
-                    os.chdir('..')
-                    continue
-            except IndexError:
-                error_list.append(event)
-                error_type.append('Already Uploaded; Attachment Count Error')
-                os.chdir('..')
-                continue
 
-        assert r.ok
+def remote_documents(session):
 
-        # find attachment url
-        r = requests.get(
-                url=root_path + 'documents/quakeml/{}'.format(xml),
-                **requests_kwargs)
-        assert r.ok
+    """
+    Lists all quakeml documents in the database once, page by page, so the
+    uploader only has to send requests for events that are not uploaded
+    completely.
 
-        attachment_url = r.json()['indices'][0]['attachments_url']
+    :type session: :class: `requests.Session`
+    :param session: Session shared by the upload threads, see get_session()
+    :rtype: dict
+    :return: document index (attachments_count, attachments_url) by name of
+        the quakeml file, None for documents without index
+    """
+    remote = {}
+    url = root_path + 'documents/quakeml/?limit={}'.format(PAGE_SIZE)
+    while url:
+        r = request(session, 'GET', url)
+        r.raise_for_status()
+        page = r.json()
+        for document in page['results']:
+            indices = document.get('indices') or [None]
+            remote[document['name']] = indices[0]
+        url = page.get('next')
+    return remote
 
-        # post image attachments            
-        for pngs,heads in zip([page1,page2,page3,page4],
-                                [head_p1,head_p2,head_p3,head_p4]):
-            with open(pngs,'rb') as fhp:
-                r = requests.post(url=attachment_url, headers=heads, data=fhp,
-                                  **requests_kwargs)
 
+class UploadLedger(object):
+
+    """
+    Local record of what was uploaded: the sha1 hash, size and modification
+    time of the quakeml file (category QUAKEML) and of each attachment 
+    (by category) of every event, kept in OUTPUT_PATH/.upload_ledger.sqlite.
+    With it, files changed by reprocessing are found and uploaded again 
+    without a wipe of the database. Every step is recorded as soon as it 
+    is done, so it is the journal partially uploaded events are resumed 
+    from as well. A connection is opened per call so the upload threads 
+    don't share one.
+
+    :type output_path: str
+    :param output_path: Folder containing the event folders.
+    """
+    filename = '.upload_ledger.sqlite'
+
+    def __init__(self, output_path):
+        self.path = os.path.join(output_path, self.filename)
+        with self.connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS uploads ('
+                               'name TEXT, category TEXT, sha1 TEXT, '
+                               'size INTEGER, mtime INTEGER, uploaded TEXT, '
+                               'PRIMARY KEY (name, category))')
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=60.)
+
+    def entries(self, name):
+
+        """
+        :type name: str
+        :param name: name of the quakeml file
+        :rtype: dict
+        :return: (sha1, size, mtime) by category
+        """
+        with self.connect() as connection:
+            return {C: (H, S, M) for C, H, S, M in connection.execute(
+                        'SELECT category, sha1, size, mtime FROM uploads '
+                        'WHERE name = ?', (name,))}
+
+    def record(self, name, category, filename, sha1):
+        stat = os.stat(filename)
+        with self.connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO uploads VALUES '
+                               '(?, ?, ?, ?, ?, ?)', (name, category, sha1, 
+                               stat.st_size, stat.st_mtime_ns, 
+                               datetime.datetime.utcnow().isoformat()))
+
+    def forget(self, name, categories=None):
+
+        """
+        Removes the entries of an event, i.e. after its document was 
+        deleted or replaced in the database.
+
+        :type categories: list of str
+        :param categories: only these categories, all if None
+        """
+        with self.connect() as connection:
+            if categories is None:
+                connection.execute('DELETE FROM uploads WHERE name = ?', 
+                                                                    (name,))
+            else:
+                connection.executemany('DELETE FROM uploads WHERE name = ? '
+                        'AND category = ?', [(name, C) for C in categories])
+
+
+def file_hash(filename, entry=None):
+
+    """
+    sha1 hash of a file, taken from the ledger entry if the file has the 
+    same size and modification time as when it was uploaded.
+
+    :type entry: tuple
+    :param entry: (sha1, size, mtime) of the ledger, see UploadLedger
+    """
+    if entry is not None:
+        stat = os.stat(filename)
+        if (stat.st_size, stat.st_mtime_ns) == tuple(entry[1:]):
+            return entry[0]
+
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def upload_event(session, event, index=None, ledger=None, sync=False):
+
+    """
+    Pushes the quakeml file of one event folder and posts the pages and the
+    .json file as its attachments. Events already in the database only get
+    the attachments they are missing. Failed requests are retried, see 
+    request(). If they keep failing the uploaded part stays in the database
+    and the event is resumed from the first missing step on the next run.
+    Second attachments of a category, left by failed posts of older
+    versions, are deleted and the remaining one is uploaded again.
+
+    :type session: :class: `requests.Session`
+    :param session: Session shared by the upload threads, see get_session()
+    :type event: str
+    :param event: absolute path of the event folder
+    :type index: dict
+    :param index: document index of the event if it is in the database, 
+        see remote_documents()
+    :type ledger: :class: `UploadLedger`
+    :param ledger: uploaded files are recorded here, also tells the steps 
+        already done for partially uploaded events
+    :type sync: bool
+    :param sync: also upload the files that changed since they were 
+        recorded in the ledger (or are not recorded). A changed quakeml file 
+        replaces the document and with it all attachments, changed 
+        attachments are replaced one by one.
+    :rtype: list of tuples
+    :return: (event, error message) entries for the error log
+    """
+    errors = []
+    # analysis products (.npz) stay local, see waveformCompare.py
+    attachments = [A for A in glob.glob(os.path.join(event, '*'))
+                                        if not A.endswith('_products.npz')]
+
+    # check: full folder
+    if len(attachments) < 6:
+        return [(event, 'Attachment Number Too Low: {}'.format(
+                                                            len(attachments)))]
+
+    # assign attachments (kinda hacky)
+    for J in attachments:
+        if J.endswith('.json'):
+            json = J
+        elif J.endswith('.xml'):
+            xml = J
+        elif '_page_1.png' in J:
+            page1 = J
+        elif '_page_2.png' in J:
+            page2 = J
+        elif '_page_3.png' in J:
+            page3 = J
+        elif '_page_4.png' in J:
+            page4 = J
+        else:
+            errors.append((event, 'Unidentified Attachment: {}'.format(
+                                                        os.path.basename(J))))
+
+    files = list(zip([page1,page2,page3,page4,json],
+                     [head_p1,head_p2,head_p3,head_p4,headers_json]))
+    name = os.path.basename(xml)
+    document_url = root_path + 'documents/quakeml/{}'.format(name)
+
+    # files changed since the last upload
+    recorded = ledger.entries(name) if ledger is not None else {}
+    hashes = {QUAKEML: file_hash(xml, recorded.get(QUAKEML))}
+    for filename, heads in files:
+        hashes[heads['category']] = file_hash(filename, 
+                                            recorded.get(heads['category']))
+    changed = [C for C in hashes 
+                    if sync and hashes[C] != recorded.get(C, (None,))[0]]
+    if index is not None and index['attachments_count'] == ATTACHMENT_COUNT \
+                                                            and not changed:
+        return errors
+
+    r = None
+    try:
+        if index is None or QUAKEML in changed:
+            # push quakeml file
+            r = request(session, 'PUT', document_url, xml)
+
+            # already uploaded (409) with the same content
+            if r.status_code != 409:
+                assert r.ok
+                # a new or replaced document comes with a new index
+                if index is not None:
+                    changed = list(hashes)
+                index, recorded = None, {}
+                if ledger is not None:
+                    ledger.forget(name)
+            if ledger is not None:
+                ledger.record(name, QUAKEML, xml, hashes[QUAKEML])
+
+        if index is None:
+            # find attachment url
+            r = request(session, 'GET', document_url)
             assert r.ok
 
-        # post .json
-        with open(json,'rb') as fhj:
-            r = requests.post(url=attachment_url, headers=headers_json,
-                              data=fhj, **requests_kwargs)
+            try:
+                index = r.json()['indices'][0]
+            except IndexError:
+                return errors + [(event, 'Already Uploaded; No Index')]
 
+        # check: incomplete, only post the missing attachments. The steps
+        # recorded in the journal are done unless they are to be replaced
+        existing = {}
+        journal = [C for C in recorded if C != QUAKEML]
+        if index['attachments_count'] == len(journal) and \
+                                    not any(C in changed for C in journal):
+            existing = dict.fromkeys(journal)
+        elif index['attachments_count'] > 0:
+            r = request(session, 'GET', index['attachments_url'])
             assert r.ok
+            for attachment in r.json()['results']:
+                category = attachment['category']
+                if category not in existing:
+                    existing[category] = attachment['url']
+                    continue
+                # second copy, the one kept is replaced below
+                r = request(session, 'DELETE', attachment['url'])
+                assert r.ok
+                changed.append(category)
+            if len(existing) > ATTACHMENT_COUNT:
+                return errors + [(event,
+                                'Already Uploaded; Attachment Count Error')]
+
+        # post image attachments and .json, replace the changed ones
+        for filename, heads in files:
+            category = heads['category']
+            if category in existing:
+                if category not in changed:
+                    continue
+                r = request(session, 'PUT', existing[category], filename, 
+                                                                headers=heads)
+            else:
+                r = post_attachment(session, index['attachments_url'],
+                                                    filename, heads)
 
-        os.chdir('..')
+            assert r.ok
+            if ledger is not None:
+                ledger.record(name, category, filename, hashes[category])
 
-    except ConnectionError:
-        error_list.append(event)
-        error_type.append('Connection Error')
-        os.chdir('..')
-        continue
+    except requests.exceptions.ConnectionError:
+        errors.append((event, 'Connection Error'))
 
     except AssertionError:
-        # if assertion fails for any reason, delete current folder
+        # if assertion fails for any reason, keep what is uploaded
         print(r.content.decode('UTF-8'))
-        r_del = requests.delete(
-                url=root_path + 'documents/quakeml/{}'.format(xml),
-                **requests_kwargs)
 
         # tag errors for errolog
-        error_list.append(os.path.basename(event))
         try:
             reason = r.json()['reason']
         except Exception:
             reason = ''
-        error_type.append(str(r.status_code) + ' ' + reason)
-        os.chdir('..')
-        continue
-
-# write error log to txt file to see what failed
-if len(error_list) > 0:
-    if not os.path.exists('../errorlogs'):
-            os.makedirs('../errorlogs')
-    os.chdir('../errorlogs')
+        errors.append((os.path.basename(event),
+                                        str(r.status_code) + ' ' + reason))
+
+    return errors
+
+
+def upload_events(cat, workers, sync=False):
+
+    """
+    Uploads the event folders in a pool of threads sharing one session. The
+    database is listed first, events that are uploaded completely are 
+    skipped without further requests unless files changed in sync mode.
+
+    :type cat: list of str
+    :param cat: absolute paths of the event folders
+    :type workers: int
+    :param workers: Number of upload threads.
+    :type sync: bool
+    :param sync: upload changed files, see upload_event()
+    :rtype: list of tuples
+    :return: (event, error message) entries for the error log
+    """
+    session = get_session(workers)
+    ledger = UploadLedger(OUTPUT_PATH)
+    error_list = []
+
+    # reconcile with the database: (event, index) of incomplete events
+    remote = remote_documents(session)
+    pending = []
+    for event in cat:
+        name = os.path.basename(event) + '.xml'
+        if name not in remote:
+            pending.append((event, None))
+        elif remote[name] is None:
+            error_list.append((event, 'Already Uploaded; No Index'))
+        elif sync or remote[name]['attachments_count'] != ATTACHMENT_COUNT:
+            pending.append((event, remote[name]))
+    if not sync:
+        print('{} of {} event(s) already uploaded'.format(
+                                len(cat) - len(pending), len(cat)))
+
+    def upload(job):
+        event, index = job
+        try:
+            return upload_event(session, event, index, ledger, sync)
+        except Exception as e:
+            return [(os.path.basename(event), str(e))]
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for (event, _), errors in zip(pending, executor.map(upload, pending)):
+            print(os.path.basename(event))
+            error_list += errors
+
+    session.close()
+    return error_list
+
+
+def write_error_log(error_list):
+
+    """
+    Write error log to txt file to see what failed.
+
+    :type error_list: list of tuples
+    :param error_list: (event, error message) entries
+    """
+    if not os.path.exists(ERRORLOG_PATH):
+        os.makedirs(ERRORLOG_PATH)
     timestamp = datetime.datetime.now()
     M = timestamp.month
     Y = timestamp.year
     mode = 'w'
-    log_name = 'upload_{}_{}.txt'.format(M,Y)
+    log_name = os.path.join(ERRORLOG_PATH, 'upload_{}_{}.txt'.format(M,Y))
 
     # check if file exists
     if os.path.exists(log_name):
@@ -192,12 +562,36 @@ if len(error_list) > 0:
 
     with open(log_name,mode) as f:
         f.write('Error Log Created {}\n'.format(timestamp))
-        f.write('{}\n'.format('='*79)) 
-        for i in range(len(error_list)):
-           f.write('{}\n> {}\n'.format(error_list[i],error_type[i]))
-        f.write('{}\n'.format('='*79)) 
-
+        f.write('{}\n'.format('='*79))
+        for event, error in error_list:
+           f.write('{}\n> {}\n'.format(event, error))
+        f.write('{}\n'.format('='*79))
 
     print('Logged {} error(s)'.format(len(error_list)))
 
 
+if __name__ == '__main__':
+
+    # command line arguments
+    parser = argparse.ArgumentParser(description='Upload event quakeml and \
+        post attachments to rotational Jane database.')
+    parser.add_argument('--timespan', help='What time span to upload files \
+        for, options are the past [week] (default), or [all] events \
+        available.', type=str, default='week')
+    parser.add_argument('--workers', help='Number of events uploaded in \
+        parallel threads (default: 8)', type=int, default=8)
+    parser.add_argument('--sync', help='Also upload the files of uploaded \
+        events that changed since their last upload, i.e. after \
+        reprocessing. Changes are found by the hashes recorded in \
+        OUTPUT/.upload_ledger.sqlite, files uploaded before the ledger \
+        existed are uploaded once more.', action='store_true')
+    args = parser.parse_args()
+
+    cat = select_events(args.timespan)
+
+    # ========================================================================
+
+    error_list = upload_events(cat, args.workers, args.sync)
+
+    if len(error_list) > 0:
+        write_error_log(error_list)
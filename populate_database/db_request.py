@@ -4,37 +4,11 @@ and deleting single events or stationxmls. Wipe is dangerous
 """
 import os
 import sys
+import json
 import glob
 import requests
 import argparse
-
-# command line arguments
-parser = argparse.ArgumentParser(description='Database interaction script for '
-    'adding stations, individual events, attaching individual attachments, '
-    'deleting stations and events or choosing the nuclear option and wiping '
-    'the database clean. All arguments needed except for wipe.',
-    formatter_class=argparse.RawTextHelpFormatter)
-parser.add_argument('--action', help='Performable actions:\n\
-    get: return all XML information\n\
-    put: upload a XML file\n\
-    attach: post an attachment\n\
-    delete: delete an event and or station\n\
-    wipe: wipe all event XML files, no fileid', type=str, default='blank')
-parser.add_argument('--pick',help='Choose [stationxml] or [quakeml]',type=str,
-                                                                default='blank')
-parser.add_argument('--fileid', help='Filename for object as input,\n' 
-    'If [all], will post all stationxml files to database.\n'
-    'Does not require file extension.\n'
-    'For mass event upload, use event_upload_rotjane.py',
-                                                    type=str,default='blank')
-args = parser.parse_args()
-
-action = args.action
-pick = args.pick
-filename = args.fileid
-if (action or pick or filename) == 'blank':
-    sys.exit('Requires all arguments, use -h to see options')
-
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # ===============================MAIN==========================================
 # jane settings
@@ -45,94 +19,354 @@ authority = ('chow','chow')
 sta_path = './station_files/'
 eve_path = '../OUTPUT/'
 
-# actions
-if action == 'get':
-    if filename == 'blank': filename = ''
-    r = requests.get(
-            url=root_path + 'documents/{}/{}'.format(pick,filename),
-            auth=authority)
-
-    assert r.ok
-    print(r.content.decode('UTF-8'))
-
-elif action == 'put':
-    if filename == 'all' and pick == 'stationxml':
-        # bit hacky because dataless in a folder, but works
-        stations = glob.glob(sta_path + '*')
-        station_names = [_[len(sta_path):] for _ in stations]
-        for sta,sta_name in zip(stations,station_names):
-            with open(sta,'rb') as fh:
-                r = requests.put(
-                url=root_path + 'documents/{}/{}'.format(pick,sta_name),
-                auth=authority,
-                data=fh)
-    # put quakeml
-    else:
-        xml_path = os.path.join(eve_path,filename,filename+'.xml')
-        with open(xml_path,'rb') as fh:
-            r = requests.put(
-                url=root_path + 'documents/{}/{}'.format(pick,filename),
-                auth=authority,
-                data=fh)
+# documents per request when listing the database, see list_documents()
+PAGE_SIZE = 500
+
+
+def get_session(workers):
+
+    """
+    One session shared by all threads, connections are kept alive and reused.
+
+    :type workers: int
+    :param workers: Number of threads, size of the connection pool.
+    :rtype: :class: `requests.Session`
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                            pool_maxsize=max(workers, 1))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.auth = authority
+    return session
+
+
+def failure(r):
+
+    """
+    :type r: :class: `requests.Response`
+    :rtype: str
+    :return: status code and reason of a failed request for the summary
+    """
+    try:
+        reason = r.json()['reason']
+    except Exception:
+        reason = r.reason or ''
+    return '{} {}'.format(r.status_code, reason)
+
+
+def bulk_request(session, method, items, workers):
+
+    """
+    Sends one request per item in a bounded pool of threads, prints the
+    progress and collects the failures instead of stopping at the first.
 
-    assert r.ok 
-
-
-elif action == 'delete':
-    # allow for more flexible file id inputs
-    if filename[-4:] != '.xml':
-        filename += '.xml'
-    r = requests.delete(
-            url=root_path + 'documents/{}/{}'.format(pick,filename),
-            auth=authority)
-
-    assert r.ok
-    
-
-elif action == 'attach' and pick == 'quakeml':
-    content = input('content-type?: ')    
-    category = input('category?: ')
-    headers = {'content-type': '{}'.format(content),
-                 'category': '{}'.format(category)} 
-
-    doc_ind = input('document index: ')
-    Rtmp = requests.get(
-            url=root_path + 'document_indices/{}/{}'.format(pick,doc_ind),
-            auth=authority)
-    print(Rtmp.content)
-
-    with open(filename,'rb') as fh:
-        r = requests.post(
-            url=root_path + 'document_indices/{}/{}/attachments'.format(
-                                                                pick,doc_ind),
-            auth=authority,
-            headers=headers,
-            data=fh)
-
-    assert r.ok
-
-elif action == 'wipe':
-    wipe = input('Are you sure you want to wipe the {} folder?\n'
-                                                    'yes or no?: '.format(pick))
-    if wipe == 'yes' and pick == 'quakeml':
-        filelist = glob.glob(eve_path + 'GCMT*') + glob.glob(eve_path + 'ISC*')
-        filenames = ['{}.xml'.format(_[len(eve_path):]) for _ in filelist]
-    elif wipe == 'yes' and pick == 'stationxml':
-        filelist = glob.glob(sta_path + '*')
-        filenames = [_[len(sta_path):] for _ in filelist]   
-    else:
-        sys.exit('Aborting')
-
-    for filename in filenames:
+    :type session: :class: `requests.Session`
+    :param session: Session shared by the threads, see get_session()
+    :type method: str
+    :param method: PUT or DELETE
+    :type items: list of tuples
+    :param items: (fileid, url, filename) of each request, filename of the
+        file sent as request body or None
+    :type workers: int
+    :param workers: Number of threads.
+    :rtype: list of tuples
+    :return: (fileid, reason) of the failed requests
+    """
+    def send(item):
+        fileid, url, filename = item
         try:
-            r = requests.delete(
+            if filename is None:
+                r = session.request(method, url)
+            else:
+                with open(filename,'rb') as fh:
+                    r = session.request(method, url, data=fh)
+        except requests.exceptions.RequestException as e:
+            return fileid, str(e)
+        if not r.ok:
+            return fileid, failure(r)
+        return fileid, None
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(send, item) for item in items]
+        for counter, future in enumerate(as_completed(futures)):
+            fileid, reason = future.result()
+            print('{} of {}: {}{}'.format(counter + 1, len(items), fileid,
+                            '' if reason is None else ' > ' + reason))
+            if reason is not None:
+                failed.append((fileid, reason))
+    return failed
+
+
+def summary(total, failed):
+
+    """
+    Prints how many requests of a bulk operation failed and their ids.
+
+    :type total: int
+    :param total: number of requests
+    """
+    print('{} of {} succeeded'.format(total - len(failed), total))
+    if failed:
+        print('Failed:')
+        for fileid, reason in sorted(failed):
+            print('{}\t{}'.format(fileid, reason))
+
+
+def list_documents(session, pick):
+
+    """
+    Lists the documents of the database one page at a time, following the
+    'next' links of the paginated listing.
+
+    :type pick: str
+    :param pick: stationxml or quakeml
+    :rtype: generator of lists of dicts
+    :return: documents of each page
+    """
+    url = root_path + 'documents/{}/?limit={}'.format(pick, PAGE_SIZE)
+    while url:
+        r = session.get(url=url)
+        check(r)
+        page = r.json()
+        yield page['results']
+        url = page.get('next')
+
+
+def download(session, url, filename):
+
+    """
+    Streams a document to disk, the file is replaced once it is complete.
+
+    :rtype: str
+    :return: reason if the download failed, else None
+    """
+    try:
+        with session.get(url=url, stream=True) as r:
+            if not r.ok:
+                return failure(r)
+            with open(filename + '.tmp','wb') as fh:
+                for chunk in r.iter_content(chunk_size=1 << 16):
+                    fh.write(chunk)
+    except requests.exceptions.RequestException as e:
+        return str(e)
+    os.replace(filename + '.tmp', filename)
+
+
+def export_documents(session, pick, export_path, workers):
+
+    """
+    Exports all documents of one type to export_path/<pick>/, one file per
+    document. The ids, modification times and hashes of the exported 
+    documents are kept in export_path/<pick>/index.json, so later exports 
+    only download new and changed documents and remove the deleted ones.
+    The index is saved after every page of the listing, an interrupted 
+    export continues where it stopped.
+
+    :type pick: str
+    :param pick: stationxml or quakeml
+    :type export_path: str
+    :param export_path: folder of the export
+    :type workers: int
+    :param workers: Number of parallel downloads.
+    :rtype: tuple
+    :return: numbers of listed, downloaded and removed documents and the
+        (name, reason) of the failed downloads
+    """
+    folder = os.path.join(export_path, pick)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    index_file = os.path.join(folder, 'index.json')
+    index = {}
+    if os.path.exists(index_file):
+        with open(index_file) as f:
+            index = json.load(f)
+
+    def save_index():
+        with open(index_file + '.tmp', 'w') as f:
+            json.dump(index, f, indent=4, sort_keys=True)
+        os.replace(index_file + '.tmp', index_file)
+
+    listed, downloaded, failed = set(), 0, []
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        for page in list_documents(session, pick):
+            futures = {}
+            for document in page:
+                name = document['name']
+                listed.add(name)
+                entry = {'id': document.get('id'),
+                         'modified_at': document.get('modified_at'),
+                         'sha1': document.get('sha1')}
+                if index.get(name) == entry and \
+                                os.path.exists(os.path.join(folder, name)):
+                    continue
+                url = document.get('data_url') or \
+                        root_path + 'documents/{}/{}/data'.format(pick, name)
+                futures[executor.submit(download, session, url, 
+                                    os.path.join(folder, name))] = (name, entry)
+
+            for future in as_completed(futures):
+                name, entry = futures[future]
+                reason = future.result()
+                if reason is not None:
+                    failed.append((name, reason))
+                    continue
+                index[name] = entry
+                downloaded += 1
+            save_index()
+            print('{} listed, {} downloaded'.format(len(listed), downloaded))
+
+    # documents deleted from the database since the last export
+    removed = sorted(set(index) - listed)
+    for name in removed:
+        if os.path.exists(os.path.join(folder, name)):
+            os.remove(os.path.join(folder, name))
+        del index[name]
+    save_index()
+
+    return len(listed), downloaded, len(removed), failed
+
+
+def check(r):
+
+    """
+    Reports a failed single request and exits with an error.
+    """
+    if not r.ok:
+        sys.exit('Request failed: {}'.format(failure(r)))
+
+
+if __name__ == '__main__':
+
+    # command line arguments
+    parser = argparse.ArgumentParser(description='Database interaction script for '
+        'adding stations, individual events, attaching individual attachments, '
+        'deleting stations and events or choosing the nuclear option and wiping '
+        'the database clean. All arguments needed except for wipe.',
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--action', help='Performable actions:\n\
+        get: return all XML information\n\
+        export: download all documents of --pick, only the ones\n\
+            changed since the last export\n\
+        put: upload a XML file\n\
+        attach: post an attachment\n\
+        delete: delete an event and or station\n\
+        wipe: wipe all event XML files, no fileid', type=str, default='blank')
+    parser.add_argument('--pick',help='Choose [stationxml] or [quakeml]',type=str,
+                                                                    default='blank')
+    parser.add_argument('--fileid', help='Filename for object as input,\n'
+        'If [all], will post all stationxml files to database.\n'
+        'Does not require file extension.\n'
+        'For mass event upload, use event_upload_rotjane.py',
+                                                        type=str,default='blank')
+    parser.add_argument('--workers', help='Number of parallel requests for\n'
+        'put all, wipe and export (default: 8)', type=int, default=8)
+    parser.add_argument('--export_path', help='Folder of the export, the\n'
+        'documents are stored in a folder per --pick (default: ./export/)',
+                                                type=str, default='./export/')
+    args = parser.parse_args()
+
+    action = args.action
+    pick = args.pick
+    filename = args.fileid
+    if action == 'export' and filename == 'blank':
+        filename = 'all'
+    if (action or pick or filename) == 'blank':
+        sys.exit('Requires all arguments, use -h to see options')
+
+    session = get_session(args.workers)
+
+    # actions
+    if action == 'get':
+        if filename == 'blank': filename = ''
+        r = session.get(
+                url=root_path + 'documents/{}/{}'.format(pick,filename),
+                stream=True)
+
+        check(r)
+        for chunk in r.iter_content(chunk_size=1 << 16):
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.write(b'\n')
+
+    elif action == 'export':
+        listed, downloaded, removed, failed = export_documents(
+                            session, pick, args.export_path, args.workers)
+        print('{} documents: {} downloaded, {} removed, {} unchanged'.format(
+                listed, downloaded, removed, listed - downloaded - len(failed)))
+        summary(downloaded + len(failed), failed)
+        if failed:
+            sys.exit(1)
+
+    elif action == 'put':
+        if filename == 'all' and pick == 'stationxml':
+            # bit hacky because dataless in a folder, but works
+            stations = glob.glob(sta_path + '*')
+            station_names = [_[len(sta_path):] for _ in stations]
+            items = [(sta_name,
+                      root_path + 'documents/{}/{}'.format(pick,sta_name), sta)
+                      for sta,sta_name in zip(stations,station_names)]
+            failed = bulk_request(session, 'PUT', items, args.workers)
+            summary(len(items), failed)
+            if failed:
+                sys.exit(1)
+        # put quakeml
+        else:
+            xml_path = os.path.join(eve_path,filename,filename+'.xml')
+            with open(xml_path,'rb') as fh:
+                r = session.put(
                     url=root_path + 'documents/{}/{}'.format(pick,filename),
-                    auth=authority)
-            assert r.ok
-            print(os.path.basename(filename))
-        except AssertionError:
-            continue
-       
+                    data=fh)
+
+            check(r)
+
+
+    elif action == 'delete':
+        # allow for more flexible file id inputs
+        if filename[-4:] != '.xml':
+            filename += '.xml'
+        r = session.delete(
+                url=root_path + 'documents/{}/{}'.format(pick,filename))
+
+        check(r)
+
+
+    elif action == 'attach' and pick == 'quakeml':
+        content = input('content-type?: ')
+        category = input('category?: ')
+        headers = {'content-type': '{}'.format(content),
+                     'category': '{}'.format(category)}
+
+        doc_ind = input('document index: ')
+        Rtmp = session.get(
+                url=root_path + 'document_indices/{}/{}'.format(pick,doc_ind))
+        print(Rtmp.content)
+
+        with open(filename,'rb') as fh:
+            r = session.post(
+                url=root_path + 'document_indices/{}/{}/attachments'.format(
+                                                                    pick,doc_ind),
+                headers=headers,
+                data=fh)
+
+        check(r)
 
+    elif action == 'wipe':
+        wipe = input('Are you sure you want to wipe the {} folder?\n'
+                                                        'yes or no?: '.format(pick))
+        if wipe == 'yes' and pick == 'quakeml':
+            filelist = glob.glob(eve_path + 'GCMT*') + glob.glob(eve_path + 'ISC*')
+            filenames = ['{}.xml'.format(_[len(eve_path):]) for _ in filelist]
+        elif wipe == 'yes' and pick == 'stationxml':
+            filelist = glob.glob(sta_path + '*')
+            filenames = [_[len(sta_path):] for _ in filelist]
+        else:
+            sys.exit('Aborting')
 
+        items = [(filename,
+                  root_path + 'documents/{}/{}'.format(pick,filename), None)
+                  for filename in filenames]
+        failed = bulk_request(session, 'DELETE', items, args.workers)
+        summary(len(items), failed)
 
+    session.close()
@@ -30,6 +30,10 @@ event and station information, as well as output data results from processing
 + 4 images showing waveform compariosn, correlations, phase velocities and 
 analysis of rotations in he P-Coda time window
 
++ a compressed numpy (.npz) file per station with the analysis products (traces,
+correlations, phase velocities, BAz estimation), used to re-plot and 
+re-analyze events without reprocessing
+
 Extra Information:
 
 + quakeML input files can be read directly. Useful for pulling events from other 
@@ -58,17 +62,66 @@ Running The Script:
 >>>python waveformCompare.py --min_magnitude 9 --min_datetime 2011-01-01T00:00 \
 --mode iris
 
+# process several stations for each event in a single pass
+>>> python waveformCompare.py --stations RLAS,ROMY
+
+# only compute the .json and QuakeML files, render the pages later on
+>>> python waveformCompare.py --pages none
+>>> python waveformCompare.py --render_missing
+
+# apply a plotting or analysis fix to all processed events from their
+# product files, without downloading and processing the data again
+>>> python waveformCompare.py --reanalyze --replot
+
+# reprocess only the events processed with older code or other parameters,
+# after PROCESSING_VERSION or one of the processing constants was changed
+>>> python waveformCompare.py --reprocess_stale
+
+# events interrupted or failed are resumed from the last completed stage
+# (download, preprocessing, analysis, pages) kept in ./scratch/
+>>> python waveformCompare.py --scratch ./scratch/
+
+# render the page 1 map backgrounds of local and close events ahead of time
+>>> python waveformCompare.py --warm_map_cache
+
+# render the pages in 3 processes while the next event is processed
+>>> python waveformCompare.py --render_workers 3
+
+# process events in parallel, i.e. rebuilding a large catalog on 8 cores
+>>> python waveformCompare.py --mode iris --min_datetime 2010-01-01 --workers 8
+
+# rebuild the manifest of processed events from the folders in ./OUTPUT/, 
+# i.e. after event folders were copied or removed by hand
+>>> python waveformCompare.py --rebuild_manifest
+
+# upload each processed event to the JANE database while the next events are
+# processed, see event_upload_rotjane.py
+>>> python waveformCompare.py --upload --upload_workers 4
+
 """
+import gc
+import io
 import os
 import sys
 import json
 import glob
 import obspy
+import time
+import pickle
+import sqlite3
+import hashlib
+import signal
+import uuid
 import shutil
+import socket
 import argparse
+import threading
 import datetime
 import warnings
+import multiprocessing
 from collections import OrderedDict
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from urllib.request import urlopen
 from xml.dom.minidom import parseString
 
@@ -78,6 +131,9 @@ from pprint import pprint
 mpl.use('Agg')
 from obspy.core import read
 import matplotlib.pylab as plt
+from matplotlib.figure import Figure
+from matplotlib.gridspec import GridSpec
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from obspy.taup import TauPyModel
 from obspy.core.stream import Stream
 from obspy import read_events, Catalog
@@ -87,7 +143,6 @@ from obspy.signal.rotate import rotate_ne_rt
 from obspy.core.utcdatetime import UTCDateTime
 from obspy.core.util.attribdict import AttribDict
 from obspy.clients.fdsn import Client as fdsnClient
-from obspy.signal.cross_correlation import correlate
 from obspy.geodetics.base import gps2dist_azimuth, locations2degrees
 
 # warnings.filterwarnings(
@@ -98,6 +153,88 @@ from obspy.geodetics.base import gps2dist_azimuth, locations2degrees
 # if matplotlib.__version__ < '1.0':  # Matplotlib 1.0 or newer is necessary
 #     raise ValueError('I need Matplotlib version 1.0 or newer.')
 
+# sampling rates [Hz] of the full trace and the p-coda per distance category,
+# taken from the levels of a DecimationPyramid built on the 20 Hz raw data
+SAMPLING_RATES = {'FAR': (5., 10.),
+                  'LOCAL': (10., 20.),
+                  'CLOSE': (10., 20.)}
+
+# time window lengths [s] of the full trace and p-coda correlations and lowpass
+# cut-off frequency [Hz] of the full trace per distance category, highpass 
+# cut-off frequency [Hz] of the p-coda
+CORRELATION_WINDOWS = {'FAR': {'sec': 120, 'sec_p': 5, 'cutoff': 1.0},
+                       'LOCAL': {'sec': 5, 'sec_p': 2, 'cutoff': 2.0},
+                       'CLOSE': {'sec': 3, 'sec_p': 2, 'cutoff': 4.0}}
+CUTOFF_PCODA = 0.5
+
+# time between the starts of neighbouring correlation windows as a fraction of
+# the window length, for the full trace, p-coda and frequency band windows. 
+# 1.0 gives consecutive windows, 0.5 windows overlapping by half
+CORRELATION_HOP = 1.0
+
+# corner frequencies [Hz] of the phase velocity bands and their correlation
+# time window lengths [s]
+BAND_FREQUENCIES = [0.01, 0.02, 0.04, 0.1, 0.2, 0.3, 0.4, 0.6, 1.0]
+BAND_WINDOWS = [200, 100, 50, 20, 12, 10, 8, 6]
+
+# correlation coefficients from which windows count for the phase velocities
+# (dashed line on page 3) and for the backazimuth estimate, applied again by
+# --reanalyze
+CORRELATION_THRESHOLD = 0.75
+EBAZ_THRESHOLD = 0.9
+
+# version of the processing code, recorded in the .json files with a hash of
+# the processing parameters, see processing_provenance(). Bump it when a 
+# change alters the results, --reprocess_stale then reprocesses the events
+PROCESSING_VERSION = '1.0'
+
+# travel time models loaded by get_taup_model()
+TAUP_MODELS = {}
+
+# pages rendered by plot_waveform_comp(), set by --pages
+PAGES = [1, 2, 3, 4]
+
+# PageRenderer of the main process, set by --render_workers
+PAGE_RENDERER = None
+
+# store the analysis products of each station, see store_products(), unset by
+# --no_products. Bump PRODUCTS_VERSION if the layout of the products changes
+PRODUCTS = True
+PRODUCTS_VERSION = 2
+
+# scratch folder of the stage checkpoints, see StageCheckpoints, set by 
+# --scratch. None disables the checkpoints
+CHECKPOINT_PATH = './scratch/'
+
+# manifest of the processed events in the output folder, see EventManifest, 
+# set in __main__. None falls back to globbing the output folder
+MANIFEST = None
+
+# EventUploader of the main process, set by --upload
+UPLOADER = None
+
+# station coordinates [deg] as (latitude, longitude)
+STATION_COORDINATES = {'RLAS': (49.144001, 12.8782),
+                       'ROMY': (48.162941, 11.275476)}
+
+# page 1 map views: Basemap arguments, quantum [deg] the map center is rounded
+# to, figure size, gridline spacing [deg] and marker settings. Backgrounds 
+# are cached per view and rounded center, see MapBackgrounds
+MAP_VIEWS = {'GLOBE': {'basemap': {'projection': 'ortho', 'resolution': 'l'},
+                       'quantum': 5., 'figsize': (18, 9), 'grid': 30.,
+                       'shift_text': 200000, 'event_size': 200},
+             'WORLD': {'basemap': {'projection': 'moll', 'resolution': 'l'},
+                       'quantum': 10., 'figsize': (18, 9), 'grid': 30.,
+                       'shift_text': 200000, 'event_size': 200},
+             'LOCAL': {'basemap': {'projection': 'lcc', 'resolution': 'i',
+                                   'width': 3000000, 'height': 2000000},
+                       'quantum': 1., 'figsize': (18, 9), 'grid': 5.,
+                       'shift_text': 35000, 'event_size': 300},
+             'CLOSE': {'basemap': {'projection': 'lcc', 'resolution': 'i',
+                                   'width': 600000, 'height': 400000},
+                       'quantum': .5, 'figsize': (26, 13), 'grid': 2.,
+                       'shift_text': 7000, 'event_size': 300}}
+
 class RotationalProcessingException(Exception):
 
     """
@@ -237,9 +374,9 @@ def event_info_data(event, station, polarity, instrument):
     origin = event.preferred_origin() or event.origins[0]
     startev = origin.time
 
+    station_lat, station_lon = STATION_COORDINATES[station]
+
     if station == 'RLAS':
-        station_lat = 49.144001
-        station_lon = 12.8782
 
         source = ['http://eida.bgr.de', 
                   'http://erde.geophysik.uni-muenchen.de']
@@ -269,9 +406,6 @@ def event_info_data(event, station, polarity, instrument):
             ac += tr
 
     elif station == 'ROMY':
-        station_lat = 48.162941
-        station_lon = 11.275476
-
         source = ['http://eida.bgr.de', 
                   'http://erde.geophysik.uni-muenchen.de']
 
@@ -356,10 +490,69 @@ def get_moment_tensor(event):
     return moment_tensor
 
 
+class DecimationPyramid(object):
+
+    """
+    Multirate representation of a stream. Levels are derived from the base
+    sampling rate by cascaded decimation by 2 (each step runs the obspy
+    anti-alias lowpass before downsampling), so every level is computed once
+    from the next finer one and shared by every consumer that asks for it.
+    Levels are returned by reference, consumers that need an untouched copy
+    of a level have to copy it themselves.
+
+    :type stream: :class: `~obspy.core.stream.Stream`
+    :param stream: Stream at the base sampling rate, becomes the finest level
+    :type rates: list of floats
+    :param rates: Sampling rates of the levels in Hz, finest first.
+    """
+
+    def __init__(self, stream, rates=(20., 10., 5.)):
+        self.rates = sorted(rates, reverse=True)
+        self.levels = OrderedDict()
+        self.levels[self.rates[0]] = stream
+
+    def build(self, rates):
+        """
+        Compute the requested levels (and all intermediate ones) by cascading
+        down from the finest level. Levels that are already present are reused.
+        Call before any consumer modifies a level in place.
+
+        :type rates: list of floats
+        :param rates: Sampling rates of the levels needed downstream in Hz.
+        """
+        lowest = min(rates)
+        for finer, coarser in zip(self.rates[:-1], self.rates[1:]):
+            if coarser < lowest:
+                break
+            if coarser not in self.levels:
+                level = self.levels[finer].copy()
+                level.decimate(factor=int(round(finer / coarser)))
+                self.levels[coarser] = level
+
+        return self
+
+    def level(self, rate):
+        """
+        Return the stream at a given sampling rate.
+
+        :type rate: float
+        :param rate: Sampling rate of the level in Hz.
+        :rtype: :class: `~obspy.core.stream.Stream`
+        :return: Stream of the requested level.
+        """
+        if rate not in self.levels:
+            self.build([rate])
+
+        return self.levels[rate]
+
+
 def resample(is_local, rt, ac):
 
     """
-    Resample signal dependent on locality of event.
+    Resample signal dependent on locality of event. Builds a decimation 
+    pyramid for each stream, the full trace and the p-coda are taken from the
+    levels given by SAMPLING_RATES. Time windows and cut-off frequencies are
+    taken from CORRELATION_WINDOWS.
 
     :type is_local: str
     :param is_local: Self-explaining string for event distance.
@@ -372,46 +565,32 @@ def resample(is_local, rt, ac):
     :rtype ac: :class: `~obspy.core.stream.Stream`
     :return ac: Resampled three component broadband station signal.
     :rtype rt_pcoda: :class: `~obspy.core.stream.Stream`
-    :return rt_pcoda: (Decimated) copy of rt for p-coda calculation.
+    :return rt_pcoda: (Decimated) level of rt for p-coda calculation.
     :rtype ac_pcoda: :class: `~obspy.core.stream.Stream`
-    :return ac_pcoda: (Decimated) copy of ac for p-coda calculation.
+    :return ac_pcoda: (Decimated) level of ac for p-coda calculation.
     :rtype sec/sec_p: int
     :return sec/sec_p: Time window length.
     :rtype cutoff/cutoff_pc: float
     :return cutoff: Cut-off frequency for lowpass filter.
     """
 
-    cutoff_pc = 0.5 # cutoff for pcoda lowpass
-    if is_local == 'FAR':
-        rt_pcoda = rt.copy()
-        ac_pcoda = ac.copy()
-        rt_pcoda.decimate(factor=2)
-        ac_pcoda.decimate(factor=2)
-        rt.decimate(factor=4)
-        ac.decimate(factor=4)
-        sec = 120 # length of time window in seconds
-        sec_p = 5 # pcoda time window in seconds
-        cutoff = 1.0 # cut-off freq for full-trace lowpass
-    elif is_local == 'LOCAL':
-        for trr in (rt + ac):
-            trr.data = trr.data[0: int(1800 * rt[0].stats.sampling_rate)]
-        rt_pcoda = rt.copy()
-        ac_pcoda = ac.copy()
-        rt.decimate(factor=2)
-        ac.decimate(factor=2)
-        sec = 5 
-        sec_p = 2
-        cutoff = 2.0  
-    elif is_local == 'CLOSE':
+    # time windows in seconds and cut-off freq for full-trace lowpass
+    windows = CORRELATION_WINDOWS[is_local]
+    sec, sec_p, cutoff = windows['sec'], windows['sec_p'], windows['cutoff']
+    cutoff_pc = CUTOFF_PCODA # cutoff for pcoda lowpass
+
+    # only 0.5 hour recordings for local and close events
+    if is_local in ['LOCAL', 'CLOSE']:
         for trr in (rt + ac):
             trr.data = trr.data[0: int(1800 * rt[0].stats.sampling_rate)]
-        rt_pcoda = rt.copy()
-        ac_pcoda = ac.copy()
-        rt.decimate(factor=2)
-        ac.decimate(factor=2)
-        sec = 3
-        sec_p = 2
-        cutoff = 4.0  
+
+    # one pyramid per stream, both levels computed before anything is filtered
+    rate, rate_pc = SAMPLING_RATES[is_local]
+    rt_pyramid = DecimationPyramid(rt).build([rate, rate_pc])
+    ac_pyramid = DecimationPyramid(ac).build([rate, rate_pc])
+
+    rt, ac = rt_pyramid.level(rate), ac_pyramid.level(rate)
+    rt_pcoda, ac_pcoda = rt_pyramid.level(rate_pc), ac_pyramid.level(rate_pc)
 
     return rt, ac, rt_pcoda, ac_pcoda, sec, sec_p, cutoff, cutoff_pc
 
@@ -600,7 +779,7 @@ def filter_and_rotate(rt, ac, rt_pcoda, ac_pcoda, cutoff, cutoff_pc, is_local):
     """
 
     # set the list of frequencies for bandpass filters
-    freq_list = [0.01, 0.02, 0.04, 0.1, 0.2, 0.3, 0.4, 0.6, 1.0]
+    freq_list = BAND_FREQUENCIES
     number_of_bands = len(freq_list) - 1
     
     # lower sampling rate copies for pcoda analysis in page 2
@@ -665,6 +844,22 @@ def filter_and_rotate(rt, ac, rt_pcoda, ac_pcoda, cutoff, cutoff_pc, is_local):
 
 
 
+def get_taup_model(model='iasp91'):
+
+    """
+    Returns a TauPy model, each model is only loaded once per process.
+
+    :type model: str
+    :param model: Name of the velocity model.
+    :rtype: :class: `~obspy.taup.TauPyModel`
+    :return: Travel time model.
+    """
+    if model not in TAUP_MODELS:
+        TAUP_MODELS[model] = TauPyModel(model)
+
+    return TAUP_MODELS[model]
+
+
 def ps_arrival_times(ds_in_km, depth, init_sec):
 
     """
@@ -685,7 +880,7 @@ def ps_arrival_times(ds_in_km, depth, init_sec):
     :return arriv_s: S-wave first arrival.
     """
     # use taup to get the theoretical arrival times for P & S
-    TauPy_model = TauPyModel('iasp91')
+    TauPy_model = get_taup_model('iasp91')
     tt = TauPy_model.get_travel_times(
                                 distance_in_degree=ds_in_km / 111.11, 
                                 source_depth_in_km=depth)
@@ -818,7 +1013,73 @@ def surf_tts(ds_in_km, start_time):
     return sw_arrival
 
 
-def get_corrcoefs(streamA, streamB, sec):
+def sliding_corrcoefs(dataA, dataB, window, hop=None):
+
+    """
+    Correlation engine for zero-lag correlation coefficients in sliding time
+    windows. Window sums of both signals, their squares and their product are
+    built from cumulative sums, so the cost is O(n) per window length 
+    regardless of the hop, 1-sample hops included. Coefficients are
+    normalized and demeaned per window, same as obspy's correlate(shift=0).
+    *dataA and dataB are truncated to the shorter of both.
+
+    Cumulative sums run forward and backward inside blocks of one window 
+    length, a window is then the suffix of one block plus the prefix of the 
+    next. Only samples inside the window are ever accumulated, so quiet 
+    windows keep full precision next to large amplitude arrivals.
+
+    :type dataA: numpy.ndarray
+    :param dataA: First signal to correlate
+    :type dataB: numpy.ndarray
+    :param dataB: Second signal to correlate
+    :type window: int
+    :param window: Window length in samples.
+    :type hop: int
+    :param hop: Samples between window starts (default: window, no overlap).
+    :rtype coefs: numpy.ndarray
+    :return coefs: Correlation coefficient of each window, window i starts
+        at sample i * hop
+    """
+    if hop is None:
+        hop = window
+
+    n = min(len(dataA), len(dataB))
+    if window <= 0 or n < window:
+        return np.array([])
+
+    a = np.asarray(dataA[:n], dtype=np.float64)
+    b = np.asarray(dataB[:n], dtype=np.float64)
+
+    starts = np.arange(0, n - window + 1, hop)
+    blocks = -(-n // window)
+    split = (starts % window) > 0
+
+    def window_sums(x):
+        x = np.append(x, np.zeros(blocks * window - n)).reshape(blocks, window)
+        prefix = np.cumsum(x, axis=1).ravel()
+        suffix = np.cumsum(x[:, ::-1], axis=1)[:, ::-1].ravel()
+        sums = suffix[starts]
+        sums[split] += prefix[starts[split] + window - 1]
+        return sums
+
+    sum_a = window_sums(a)
+    sum_b = window_sums(b)
+    energy_a = window_sums(a * a)
+    energy_b = window_sums(b * b)
+    cov = window_sums(a * b) - sum_a * sum_b / window
+    var_a = energy_a - sum_a ** 2 / window
+    var_b = energy_b - sum_b ** 2 / window
+
+    # windows with (numerically) zero energy get a zero coefficient
+    tolerance = np.finfo(np.float64).eps * window
+    valid = ((var_a > tolerance * energy_a) & (var_b > tolerance * energy_b))
+    coefs = np.zeros(len(starts))
+    coefs[valid] = cov[valid] / np.sqrt(var_a[valid] * var_b[valid])
+
+    return np.clip(coefs, -1., 1.)
+
+
+def get_corrcoefs(streamA, streamB, sec, hop=None):
 
     """
     Calculates the zero-lag correlation coefficients between two streams in 
@@ -831,31 +1092,26 @@ def get_corrcoefs(streamA, streamB, sec):
     :param streamB: Second stream to correlate
     :type sec: int
     :param sec: Time window length.
+    :type hop: float
+    :param hop: Time between window starts in seconds (default: sec)
     :rtype corrcoefs: numpy.ndarray
     :return corrcoefs: Correlation coefficients.
     :rtype thres: numpy.ndarray
-    :return thres: Array for plotting dashed line of 75% correlation.
+    :return thres: Array for plotting dashed line of CORRELATION_THRESHOLD.
     """
 
-    # time window in samples
+    # time window and hop in samples
     strA_TW = int(streamA[0].stats.sampling_rate * sec)
-    strB_TW = int(streamB[0].stats.sampling_rate * sec)
+    strA_hop = int(streamA[0].stats.sampling_rate * (hop or sec))
 
-    corrcoefs = []
-    for i in range(0, len(streamA[0].data) // strA_TW):
-        coeffs = correlate(a = streamA[0].data[i*strA_TW:(i+1)*strA_TW],
-                           b = streamB[0].data[i*strB_TW:(i+1)*strB_TW], 
-                           shift = 0)
-
-        corrcoefs.append(coeffs[0])
-
-    corrcoefs = np.asarray(corrcoefs)
-    thres = 0.75 * np.ones(len(corrcoefs) + 1)
+    corrcoefs = sliding_corrcoefs(streamA[0].data, streamB[0].data, 
+                                  window=strA_TW, hop=strA_hop)
+    thres = CORRELATION_THRESHOLD * np.ones(len(corrcoefs) + 1)
 
     return corrcoefs, thres
 
 
-def baz_analysis(rt, ac, sec):
+def baz_analysis(rt, ac, sec, hop=None):
 
     """
     Computes correlation coefficients for varying backazimuth steps.
@@ -870,19 +1126,21 @@ def baz_analysis(rt, ac, sec):
     :param ac: Stream of translation data.
     :type sec: int
     :param sec: Time window length.
+    :type hop: float
+    :param hop: Time between window starts in seconds (default: sec)
     :rtype corrbaz_list: numpy.ndarray
     :return corrbaz_list: Array of correlation coefficients per backazimuth step
     :rtype maxcorr_list: numpy.ndarray
     :return maxcorr_list: BAz values for the maximum correlation per time window 
     :rtype backas: numpy.ndarray
     :return backas: Vector containing backazimuths values by step length
-    :rtype coefs_list: list
-    :return coefs_list: List of the max correlation value for each time window.
+    :rtype coefs_list: numpy.ndarray
+    :return coefs_list: Max correlation value for each time window.
     """
 
-    # time window in samples
+    # time window and hop in samples
     rt_TW = int(rt[0].stats.sampling_rate * sec)
-    ac_TW = int(ac[0].stats.sampling_rate * sec)
+    rt_hop = int(rt[0].stats.sampling_rate * (hop or sec))
 
     # separate data from streams for faster rotation/correlation
     acN = ac.select(component='N')[0].data
@@ -891,43 +1149,30 @@ def baz_analysis(rt, ac, sec):
 
     # create a list of backazimuths to iterate over
     step = 10
-    corr_length = len(rt[0].data) // rt_TW
-    backas = np.linspace(0, 360 - step, 360 / step)
+    backas = np.linspace(0, 360 - step, int(360 / step))
     
-    # iterate over BAz, rotate, correlate trace
+    # iterate over BAz, rotate once, correlate all windows of the trace
     corrbaz_list = []
     for BAZ in backas:
-        for j in range(0, corr_length):
-            acRTZ = rotate_ne_rt(n = acN, e = acE, ba = BAZ)
-            acT = acRTZ[1]
-            corrbaz = correlate(a = rtZ[j*rt_TW:(j+1)*rt_TW],
-                                b = acT[j*ac_TW:(j+1)*ac_TW],
-                                shift = 0)
-            corrbaz_list.append(corrbaz[0])
+        acT = rotate_ne_rt(n = acN, e = acE, ba = BAZ)[1]
+        corrbaz_list.append(sliding_corrcoefs(rtZ, acT, 
+                                              window=rt_TW, hop=rt_hop))
 
     corrbaz_list = np.asarray(corrbaz_list)
-    corrbaz_list = corrbaz_list.reshape(len(backas), corr_length)
-
-    # find maximum correlations
-    maxcorr_list = []
-    for k in range(0, corr_length):
-        maxcorr_list.append(backas[corrbaz_list[:,k].argmax()])
-
-    maxcorr_list = np.asarray(maxcorr_list)
 
-    # array containing max corr coef for each window
-    coefs_list = []    
-    for l in range(0, corr_length):
-        coefs_list.append(np.max(corrbaz_list[:,l]))
+    # find maximum correlations and corresponding BAz for each window
+    maxcorr_list = backas[corrbaz_list.argmax(axis=0)]
+    coefs_list = corrbaz_list.max(axis=0)
 
     return corrbaz_list, maxcorr_list, backas, coefs_list
 
 
-def estimate_baz(rt, ac, start, end):
+def estimate_baz(rt, ac, start, end, hop=None):
 
     """
     Estimate the backazimuth of an event by taking the average of all BAz's 
-    which give a correlation greater than 0.9 in the s-wave and surface waves
+    which give a correlation of at least EBAZ_THRESHOLD in the s-wave and 
+    surface waves
 
     :type rt: :class: `~obspy.core.stream.Stream`
     :param rt: Rotational signal from ringlaser.
@@ -937,24 +1182,30 @@ def estimate_baz(rt, ac, start, end):
     :param start: Starttime for S-waves window.
     :type end: float
     :param end: Endtime for latter surface waves window.
-    :rtype corrsum_list: list of floats
-    :return corrsum_list: Sum of all corr. coefficients above 0.9, start to end
+    :type hop: float
+    :param hop: Time between window starts in seconds (default: 30, the 
+        window length)
+    :rtype corrsum_list: numpy.ndarray
+    :return corrsum_list: Sum of all corr. coefficients above EBAZ_THRESHOLD,
+        start to end
     :rtype baz_list: numpy.ndarray
     :return baz_list: Vector containing backazimuths by step length
     :rtype max_ebaz_xcoefs: numpy.ndarray
     :return max_ebaz_xcoefs: Array of maximum correlations for each est. BAz
     :rtype EBA: float
     :return EBA: The estimated BAz if applicable, else NaN
+    :rtype corr_list: numpy.ndarray
+    :return corr_list: Correlation coefficients per BAz and time window
     """
 
     # set integer sampling rates
     rt_SR = int(rt[0].stats.sampling_rate)
     ac_SR = int(ac[0].stats.sampling_rate)
     
-    # time window in samples
+    # time window and hop in samples
     sec_internal = 30
     rt_TW = sec_internal * rt_SR
-    ac_TW = sec_internal * ac_SR
+    rt_hop = int(rt_SR * (hop or sec_internal))
 
     # sample number of surface wave start/end
     start_sample = start * rt_SR
@@ -972,31 +1223,38 @@ def estimate_baz(rt, ac, start, end):
     # iterate over all BAz values, correlate in time windows
     corr_list = []
     for BAZ in baz_list:
-        for j in range(len(rt_cut) // rt_TW):
-            rad_cut,trv_cut = rotate_ne_rt(n = acN_cut, e = acE_cut, ba = BAZ)
-            corr = correlate(a = rt_cut[j*rt_TW:(j+1)*rt_TW],
-                             b = trv_cut[j*ac_TW:(j+1)*ac_TW],
-                             shift = 0)  
-
-            corr_list.append(corr[0])
+        rad_cut,trv_cut = rotate_ne_rt(n = acN_cut, e = acE_cut, ba = BAZ)
+        corr_list.append(sliding_corrcoefs(rt_cut, trv_cut, 
+                                           window=rt_TW, hop=rt_hop))
 
     corr_list = np.asarray(corr_list)
-    corr_list = corr_list.reshape(
-                        len(baz_list),int(round(len(corr_list)/len(baz_list))))
-
-    # iterate over correlations, choose those > 0.9
-    corrsum_list = []
-    for k in range(len(baz_list)):
-        bazsum = []
-        for l in range(len(corr_list[0, :])):
-            if corr_list[k, l] >= 0.9:
-                bazsum.append(corr_list[k, l])
-            else:
-                bazsum.append(0.0)
+    corrsum_list, max_ebaz_xcoef, EBA = ebaz_from_correlations(corr_list,
+                                                                    baz_list)
+
+    return corrsum_list, baz_list, max_ebaz_xcoef, EBA, corr_list
+
 
-        bazsum = np.asarray(bazsum)
-        bazsum = sum(bazsum)
-        corrsum_list.append(bazsum)
+def ebaz_from_correlations(corr_list, baz_list):
+
+    """
+    Estimates the backazimuth from the correlations of estimate_baz(), also
+    used to re-analyze stored products, see reanalyze_products().
+
+    :type corr_list: numpy.ndarray
+    :param corr_list: Correlation coefficients per BAz and time window
+    :type baz_list: numpy.ndarray
+    :param baz_list: Vector containing backazimuths by step length
+    :rtype corrsum_list: numpy.ndarray
+    :return corrsum_list: Sum of all corr. coefficients above EBAZ_THRESHOLD 
+        per BAz
+    :rtype max_ebaz_xcoefs: numpy.ndarray
+    :return max_ebaz_xcoefs: Array of maximum correlations for each est. BAz
+    :rtype EBA: float
+    :return EBA: The estimated BAz if applicable, else NaN
+    """
+    # sum correlations >= EBAZ_THRESHOLD for each BAz
+    corrsum_list = np.where(corr_list >= EBAZ_THRESHOLD, corr_list, 
+                                                            0.0).sum(axis=1)
 
     # determine estimated backazimuth
     best_ebaz = baz_list[np.asarray(corrsum_list).argmax()] 
@@ -1007,14 +1265,20 @@ def estimate_baz(rt, ac, start, end):
     else:
         EBA = best_ebaz
 
-    return corrsum_list, baz_list, max_ebaz_xcoef, EBA
+    return corrsum_list, max_ebaz_xcoef, EBA
 
 
-def get_phase_vel(rt, trv_acc, sec, corrcoefs, start):
+def get_phase_vel(rt, trv_acc, sec, corrcoefs, start, hop=None):
 
     """
-    Calculate phase velocities by taking amplitude ratios, only for 
-    correlation values > 0.75. 'start' controls where in data calculations begin
+    Calculate phase velocities by taking amplitude ratios in all windows. 
+    'start' controls where in data calculations begin
+    The windows are gathered into (window, sample) arrays, window i starting 
+    at i * hop, so window peaks are taken with a single numpy reduction. Mean 
+    and standard deviation are computed from the windows with correlations of
+    at least CORRELATION_THRESHOLD, see phasv_statistics(). The velocities of 
+    the other windows are kept, so the threshold can be changed by 
+    --reanalyze.
 
     :type rt: :class: `~obspy.core.stream.Stream`
     :param rt: Rotational signal from ringlaser.
@@ -1026,28 +1290,63 @@ def get_phase_vel(rt, trv_acc, sec, corrcoefs, start):
     :param corrcoefs: Calculated correlation coefficients.
     :type start: int
     :param start: index from which to start calculations
+    :type hop: float
+    :param hop: Time between window starts in seconds (default: sec), as 
+        used for corrcoefs
     :rtype phasv_list: numpy.ndarray
-    :return phasv_list: Calculated phase velocities
+    :return phasv_list: Calculated phase velocities of all windows
+    :rtype phasv_mean: float
+    :return phasv_mean: Mean of phase velocities (NaN's excluded) or NaN
+    :rtype phasv_std: float
+    :return phasv_std: Std. of phase velocities (NaN's excluded) or NaN
     """
-    # time window in samples
+    # time window and hop in samples
     rt_TW = int(rt[0].stats.sampling_rate * sec)
     trv_TW = int(trv_acc[0].stats.sampling_rate * sec)
+    rt_hop = int(rt[0].stats.sampling_rate * (hop or sec))
+    trv_hop = int(trv_acc[0].stats.sampling_rate * (hop or sec))
+
+    # one row per window, from 'start' to the last correlated window
+    windows = np.arange(start, len(corrcoefs))
+    rt_win = rt[0].data[windows[:, None] * rt_hop + np.arange(rt_TW)]
+    trv_win = trv_acc[0].data[windows[:, None] * trv_hop + np.arange(trv_TW)]
+
+    # calculate phase velocity (km/s), windows without signal give inf/NaN
+    with np.errstate(divide='ignore', invalid='ignore'):
+        phasv_list = (trv_win.max(axis=1) / rt_win.max(axis=1) 
+                                                            * (1/2) * (1E-3))
+
+    phasv_mean, phasv_std = phasv_statistics(phasv_list, corrcoefs, start)
+
+    return phasv_list, phasv_mean, phasv_std
 
-    # calculate phase velocity (km/s) for correlations >= 0.75
-    phasv_list = []
-    for i in range(start, len(corrcoefs)):
-        if corrcoefs[i] >= 0.75:
-            phasv = (max(trv_acc[0].data[i*trv_TW:(i+1)*trv_TW]) / 
-                     max(rt[0].data[i*rt_TW:(i+1)*rt_TW]))
-            phasv *= (1/2) * (1E-3)
-        else:
-            phasv = np.NaN
 
-        phasv_list.append(phasv)
+def phasv_statistics(phasv_list, corrcoefs, start):
 
-    phasv_list = np.asarray(phasv_list)  
+    """
+    Mean and standard deviation of the phase velocities of get_phase_vel()
+    for the .json file, only windows with correlations of at least 
+    CORRELATION_THRESHOLD are used.
+
+    :type phasv_list: numpy.ndarray
+    :param phasv_list: Phase velocities from window 'start' on.
+    :type corrcoefs: numpy.ndarray
+    :param corrcoefs: Correlation coefficients of all windows.
+    :type start: int
+    :param start: index of the first window of phasv_list
+    :rtype phasv_mean: float
+    :return phasv_mean: Mean of phase velocities (NaN's excluded) or NaN
+    :rtype phasv_std: float
+    :return phasv_std: Std. of phase velocities (NaN's excluded) or NaN
+    """
+    mask = np.asarray(corrcoefs)[start:] >= CORRELATION_THRESHOLD
+    if mask.any():
+        phasv_mean = np.mean(phasv_list[mask])
+        phasv_std = np.std(phasv_list[mask])
+    else:
+        phasv_mean = phasv_std = np.nan
 
-    return phasv_list
+    return phasv_mean, phasv_std
 
 
 def sn_ratio(stream, p_arrival):
@@ -1080,12 +1379,13 @@ def sn_ratio(stream, p_arrival):
     return SNR
 
 
-def store_info_json(rt, ac, trv_acc, data_sources, station, event, dist_baz, 
-                    arriv_p, corrcoefs, EBA, max_ebaz_xcoef, 
-                    phasv_means, phasv_stds, folder_name, tag_name):
+def station_information(rt, ac, trv_acc, data_sources, station, dist_baz, 
+                        arriv_p, corrcoefs, EBA, max_ebaz_xcoef, 
+                        phasv_means, phasv_stds):
 
     """
-    Generates a human readable .json file to store processed data for each event
+    Collects the processed data of one station for the .json file, returns
+    a dictionary with the single key 'station_information_<station>'
 
     :type rt: :class: `~obspy.core.stream.Stream`
     :param rt: Rotational signal from ringlaser.
@@ -1097,8 +1397,6 @@ def store_info_json(rt, ac, trv_acc, data_sources, station, event, dist_baz,
     :param data_sources: collection of data source for each channel.
     :type station: str
     :param station: Station of interest.
-    :type event: :class: `~obspy.core.event.event.Event`
-    :param event: Event information container
     :type dist_baz: tuple
     :param dist_baz: [0] Great circle distance in m, 
                 [1] azimuth A->B in degrees,
@@ -1115,19 +1413,12 @@ def store_info_json(rt, ac, trv_acc, data_sources, station, event, dist_baz,
     :param phasv_means: Vector of mean phase velocities per freq. band
     :type phasv_std: numpy.ndarray
     :param phasv_std: Vector of phase velocities std. per freq. band
-    :type folder_name: string
-    :param folder_name: Name of the folder containing the event.
-    :type tag_name: string
-    :param tag_name: Handle of the event.
+    :rtype dic_station: :class: `~collections.OrderedDict`
+    :return dic_station: station information and rotational parameters
     """
     # set the global 'round to decimal point' value
     rnd = 6
 
-    # parse out parameters for json file
-    orig = event.preferred_origin() or event.origins[0] # Event origin
-    catalog = orig.creation_info.author or orig.creation_info.agency_id
-    magnitude = event.preferred_magnitude() or event.magnitudes[0] # Mag info.
-
     PAT = round(max(trv_acc[0].data), rnd)  # Peak transverse acc. [nm/s]
     PRZ = round(max(rt[0].data), rnd)  # Peak vertical rotation rate [nrad/s]
     PCC = round(max(corrcoefs), rnd)  # Peak correlation coefficient
@@ -1143,21 +1434,6 @@ def store_info_json(rt, ac, trv_acc, data_sources, station, event, dist_baz,
     phasv_means = [round(_,rnd) for _ in phasv_means] 
     phasv_stds = [round(_,rnd) for _ in phasv_stds] 
 
-    # common event dictionary
-    dic_event = OrderedDict([
-                ('event_id', event.resource_id.id),
-                ('event_source', catalog),
-                ('event_latitude', orig.latitude),
-                ('event_longitude', orig.longitude),
-                ('origin_time', str(orig.time)),
-                ('trace_start', str(orig.time-180)),
-                ('trace_end', str(orig.time+3*3600)),
-                ('magnitude', magnitude.mag),
-                ('magnitude_type', magnitude.magnitude_type),
-                ('depth', orig.depth * 0.001),
-                ('depth_unit', 'km')
-                ])
-
     # individual station dictionary w/ rotational parameters and velocities
     dic_station = OrderedDict([
             ('station_information_{}'.format(station), 
@@ -1287,807 +1563,2367 @@ def store_info_json(rt, ac, trv_acc, data_sources, station, event, dist_baz,
                         ])
                     )
                     ])
-                )
+                ),
+                ('processing', processing_provenance(polarity, instrument))
                 ])
             )
             ])  
 
-    # if: json already created for previous station, overwrite event info
-    # else: write a new json file !!! assumes the event information is the same
-    filename_json = os.path.join(folder_name,tag_name + '.json')
+    return dic_station
 
-    if os.path.exists(filename_json): 
-        dic_event = json.load(open(filename_json),object_pairs_hook=OrderedDict)
 
-    # combine two dictionaries, save
-    dic_event.update(dic_station)
+def processing_provenance(polarity, instrument):
 
-    outfile = open(filename_json, 'wt')
-    json.dump(dic_event, outfile, indent = 4)
-    outfile.close()
+    """
+    Code version and processing parameters of the results of a station, 
+    stored in its .json entry. Results are stale if the version or the hash
+    of the parameters differ from the current ones, see is_stale().
 
+    :type polarity: str
+    :param polarity: Polarity of the rotation data ('normal' or 'reverse').
+    :type instrument: str
+    :param instrument: Translation instrument used for RLAS.
+    :rtype: :class: `~collections.OrderedDict`
+    :return: Code version, parameter hash and parameters.
+    """
+    parameters = OrderedDict([
+                    ('sampling_rates', SAMPLING_RATES),
+                    ('correlation_windows', CORRELATION_WINDOWS),
+                    ('cutoff_pcoda', CUTOFF_PCODA),
+                    ('correlation_hop', CORRELATION_HOP),
+                    ('band_frequencies', BAND_FREQUENCIES),
+                    ('band_windows', BAND_WINDOWS),
+                    ('correlation_threshold', CORRELATION_THRESHOLD),
+                    ('ebaz_threshold', EBAZ_THRESHOLD),
+                    ('polarity', polarity),
+                    ('instrument', instrument)
+                    ])
 
-def store_info_xml(event,folder_name,tag_name,station):
+    return OrderedDict([
+                ('code_version', PROCESSING_VERSION),
+                ('parameter_hash', parameter_hash(parameters)),
+                ('parameters', parameters)
+                ])
 
-    """
-    Write QuakeML file. Store extra parameters under the namespace rotational
-    seismology. Stations are taken care of in nested tags in the extra tag
-    of the XML file. Parameters used for filtering events on JANE database 
-    framework are taken from the previously written .json file 
 
-    :type event: :class: `~obspy.core.event.event.Event`
-    :param event: Event information container
-    :type folder_name: string
-    :param folder_name: Name of the folder containing the event.
-    :type tag_name: string
-    :param tag_name: Handle of the event.
-    :type station: str
-    :param station: Station from which data are fetched (i.e. 'RLAS').
+def is_stale(dic_station):
+
     """
-    ns = 'http://www.rotational-seismology.org'
-    filename_json = os.path.join(folder_name,tag_name + '.json')
-    filename_xml = os.path.join(folder_name,tag_name + '.xml')
+    Checks if the .json entry of a station was processed with another code
+    version or other processing parameters than the current ones. Polarity
+    and instrument are taken from the entry, they are chosen per event. 
+    Entries without provenance are stale.
+
+    :type dic_station: dict
+    :param dic_station: Value of 'station_information_<station>' in the .json
+    :rtype: bool
+    :return: True if the station has to be reprocessed.
+    """
+    recorded = dic_station.get('processing')
+    if not recorded:
+        return True
+    current = processing_provenance(recorded['parameters']['polarity'],
+                                    recorded['parameters']['instrument'])
 
-    # check if xml already exists
-    if os.path.exists(filename_xml):
-        event = read_events(filename_xml,format='QUAKEML')[0]
+    return (recorded['code_version'] != current['code_version'] or
+            recorded['parameter_hash'] != current['parameter_hash'])
 
-    # check if xml already has extra section
-    try:
-        event.extra
-    except AttributeError:
-        event.extra = AttribDict()
 
-    # grab data from json file
-    data = json.load(open(filename_json))
-    rotational_parameters = ['epicentral_distance',
-                             'theoretical_backazimuth',
-                             'peak_correlation_coefficient']
-    
-    # write parameters from json into attribute dictionaries
-    params = AttribDict()
-    for RP in rotational_parameters:
-        RP_value = (data['station_information_{}'.format(station)]
-                                                ['rotational_parameters'][RP])
-        params[RP] = AttribDict()
-        params[RP] = {'namespace':ns,
-                      'value': RP_value}
-
-    # set unit attributes
-    params.epicentral_distance.attrib = {'unit':"km"}
-    params.theoretical_backazimuth.attrib = {'unit':"degree"}
-
-    event.extra['rotational_parameters_{}'.format(station)] = \
-                                                            {'namespace': ns,
-                                                            'value': params}
+def write_files(contents):
 
-    event.write(filename_xml,'QUAKEML',
-                        nsmap={"rotational_seismology_database": 
-                            r"http://www.rotational-seismology.org"})
+    """
+    Writes several files such that each of them is either complete or left
+    as it was. All contents go to temporary files that are synced to disk 
+    before any of them is renamed, the folders are synced once at the end.
+
+    :type contents: list of tuples
+    :param contents: (filename, bytes) of each file.
+    """
+    temps = []
+    for filename, data in contents:
+        temp = filename + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        temps.append((temp, filename))
+
+    for temp, filename in temps:
+        os.replace(temp, filename)
+
+    for folder in set(os.path.dirname(os.path.abspath(F)) for _, F in temps):
+        fd = os.open(folder, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
 
-def plot_waveform_comp(event, station, mode, folder_name, tag_name):
+class EventResult(object):
 
     """
-    Main processing script, calls all other functions defined above.
-    Compare vertical rotation rate and transverse acceleration.
-    Creates and saves four figures, a .json file with processed parameters,
-    and a QuakeML file for each event.
- 
+    Processed data of one event: the event information and the station 
+    dictionaries of station_information(). Both the human readable .json 
+    file and the QuakeML file are written from it by write(), the QuakeML
+    file stores extra parameters under the namespace rotational seismology,
+    stations are taken care of in nested tags in the extra tag. If the event
+    was processed before, the stations of its .json file are kept and the
+    event information is taken from there.
+
     :type event: :class: `~obspy.core.event.event.Event`
     :param event: Event information container
-    :type station: str
-    :param station: Station from which data are fetched (i.e. 'RLAS').
-    :type link: string
-    :param link: URL to the IRIS-XML file
-    :type mode: str
-    :param mode: Determines if moment tensor information is fetched
     :type folder_name: string
     :param folder_name: Name of the folder containing the event.
     :type tag_name: string
     :param tag_name: Handle of the event.
     """
-    # =========================================================================
-    #                                   
-    #              Gather event information, stream objects etc.
-    #
-    # =========================================================================
-    event_lat, event_lon, depth, startev, rt, ac, dist_baz, data_sources = \
-        event_info_data(event, station, polarity, instrument)
-    
-    # parse out event and station location information
-    ds_in_km = dist_baz[0] * 1E-3
-    BAz = dist_baz[2]
-    station_lat = rt[0].stats.coordinates.latitude
-    station_lon = rt[0].stats.coordinates.longitude
+    namespace = 'http://www.rotational-seismology.org'
 
-    # parse out information for title
-    flinn_engdahl_title = event.event_descriptions[0]['text'].title()
-    mag = event.preferred_magnitude() or event.magnitudes[0] 
+    # parameters used for filtering events on JANE database framework
+    rotational_parameters = ['epicentral_distance',
+                             'theoretical_backazimuth',
+                             'peak_correlation_coefficient']
 
-    # try to get moment tensor information
-    if event.preferred_focal_mechanism():
-        moment_tensor = get_moment_tensor(event)
-    else:
-        moment_tensor = None
+    def __init__(self, event, folder_name, tag_name):
+        self.event = event
+        self.filename_json = os.path.join(folder_name, tag_name + '.json')
+        self.filename_xml = os.path.join(folder_name, tag_name + '.xml')
+
+        # if: json already created for previous station, keep its event info
+        # else: new event dictionary !!! assumes the event information is the 
+        # same
+        if os.path.exists(self.filename_json):
+            self.dic_event = json.load(open(self.filename_json),
+                                                object_pairs_hook=OrderedDict)
+        else:
+            # parse out parameters for json file
+            orig = event.preferred_origin() or event.origins[0] # Event origin
+            catalog = orig.creation_info.author or orig.creation_info.agency_id
+            magnitude = event.preferred_magnitude() or event.magnitudes[0]
+
+            self.dic_event = OrderedDict([
+                        ('event_id', event.resource_id.id),
+                        ('event_source', catalog),
+                        ('event_latitude', orig.latitude),
+                        ('event_longitude', orig.longitude),
+                        ('origin_time', str(orig.time)),
+                        ('trace_start', str(orig.time-180)),
+                        ('trace_end', str(orig.time+3*3600)),
+                        ('magnitude', magnitude.mag),
+                        ('magnitude_type', magnitude.magnitude_type),
+                        ('depth', orig.depth * 0.001),
+                        ('depth_unit', 'km')
+                        ])
 
-    # =========================================================================
-    #                                   
-    #                                  PAGE 1
-    #               Create map with event location & information
-    #
-    # =========================================================================
-    print("\nPage 1 > Title Card...", end=" ")
+    def add_station(self, dic_station):
 
-    # ================================ Draw Maps===============================
-    if is_local(ds_in_km) == 'FAR': 
-        shift_text = 200000
-        event_size = 200
-        if ds_in_km <= 13000:
-            plt.figure(figsize=(18, 9))
-            plt.subplot2grid((4, 9), (0, 4), colspan=5, rowspan=4)
-
-            # globe plot
-            map = Basemap(projection='ortho', 
-                            lat_0=(station_lat + event_lat) / 2, 
-                            lon_0=(station_lon + event_lon) / 2, 
-                            resolution='l')
-            map.drawmeridians(np.arange(0, 360, 30))
-            map.drawparallels(np.arange(-90, 90, 30))
-        elif ds_in_km > 13000:
-            plt.figure(figsize=(18, 9))
-            plt.subplot2grid((4, 9), (0, 4), colspan=5, rowspan=4)
-
-            # If the great circle between the station and event is crossing the
-            # 180° meridian in the pacific and the stations are far apart the 
-            # map has to be re-centered, otherwise wrong side of globe.
-            if abs(station_lon - event_lon) > 180:
-                lon0 = 180 + (station_lon + event_lon) / 2
-            else:
-                lon0 = (station_lon + event_lon) / 2
-
-            map = Basemap(projection='moll', lon_0=lon0, resolution='l')
-            map.drawparallels(np.arange(-90, 90, 30))
-            map.drawmeridians(np.arange(0, 360, 30))
-
-    elif is_local(ds_in_km) == 'LOCAL':
-        shift_text = 35000
-        event_size = 300
-        plt.figure(figsize=(18, 9))
-        plt.subplot2grid((4, 9), (0, 4), colspan=5, rowspan=4)
-
-        # conic map plot
-        map = Basemap(projection='lcc', 
-                        lat_0=(station_lat + event_lat) / 2, 
-                        lon_0=(station_lon + event_lon) / 2, 
-                        resolution='i', 
-                        width=3000000, 
-                        height=2000000)
-        map.drawparallels(np.arange(0., 90, 5.), labels=[1, 0, 0, 1])
-        map.drawmeridians(np.arange(0., 360., 5.), labels=[1, 0, 0, 1])
-        map.drawstates(linewidth=0.25)
-
-    elif is_local(ds_in_km) == 'CLOSE':
-        event_size = 300
-        plt.figure(figsize=(26, 13))
-        plt.title('{}T{}Z\n \n '.format(startev.date, startev.time), 
-                                                fontsize=24, fontweight='bold')
-        plt.subplot2grid((4, 9), (0, 4), colspan=5, rowspan=4)
-
-        # conic map plot
-        map = Basemap(projection='lcc', 
-                        lat_0=(station_lat + event_lat) / 2, 
-                        lon_0=(station_lon + event_lon) / 2, 
-                        resolution='i', 
-                        width=600000, 
-                        height=400000)
-        map.drawparallels(np.arange(0., 90, 2.), labels=[1, 0, 0, 1])
-        map.drawmeridians(np.arange(0., 360., 2.), labels=[1, 0, 0, 1])
-        map.drawrivers(linewidth=0.25, color='b')
-        map.drawstates(linewidth=0.25)
-
-    # basemap boundary settings
-    map.drawcoastlines(linewidth=0.25)
-    map.drawcountries(linewidth=0.25)
-    map.fillcontinents(color='coral', lake_color='lightblue')
-    map.drawmapboundary(fill_color='lightblue')
-
-    if is_local(ds_in_km) == 'LOCAL' or is_local(ds_in_km) == 'CLOSE':
-        map.drawlsmask(land_color='coral', ocean_color='lightblue', lakes=True)
-        map.drawcountries(linewidth=0.6)
-   
-    map.drawgreatcircle(event_lon, event_lat, station_lon, station_lat, 
-                                                    linewidth=3, color='yellow')
-    
-    # =========================== Station/ Event ===============================
-    ev_x, ev_y = map(event_lon, event_lat)
-    sta_x, sta_y = map(station_lon, station_lat)
-
-    # station
-    map.scatter(sta_x, sta_y, 200, color='b', marker='v',
-                                    edgecolor='k', zorder=100)
-    plt.text(sta_x + shift_text, sta_y, station, va='top',
-                                             family='monospace', 
-                                             weight='bold', 
-                                             zorder=101,
-                                             color='k', 
-                                             backgroundcolor='white')
-    # event as moment tensor or star 
-    # !!! doesn't work for some reason - disregard for now
-    # if moment_tensor:
-    #     ax = plt.gca()
-    #     b = beach(moment_tensor, xy=(ev_x,ev_y), facecolor='blue',
-    #                                 width=100, linewidth=1, alpha=1.0)
-    #     b.set_zorder(100)
-    #     ax.add_collection(b)
-    # else:
-    #     map.scatter(ev_x, ev_y, 200, color="b", marker="*", 
-    #                                         edgecolor="k", zorder=200)
-
-    # plot event
-    map.scatter(ev_x, ev_y, event_size, color="b", marker="*", 
-                                            edgecolor="k", zorder=100)
-
-    # title large
-    plt.subplot2grid((4, 9), (1, 0), colspan=2)
-    plt.title(u'{}T{}Z\n'.format(startev.date, startev.time), 
-                                        fontsize=20, weight='bold')
-    ax = plt.gca()
-    ax.axis('equal')
-    ax.axis('off')
-
-    # sub-title
-    plt.subplot2grid((4, 9), (2, 0), colspan=2)
-    plt.title(u'\n\nRegion: {}'.format(flinn_engdahl_title) + 
-            '\n\nMagnitude: {} {}'.format(mag.mag,mag.magnitude_type) + 
-            '\n\nDistance: {} [km], {} [°]'.format(
-                                round(ds_in_km,2), round(BAz,2)) + 
-            '\n\nDepth: {} [km]'.format(depth),
-              fontsize=18, fontweight='bold')
-
-    ax = plt.gca()
-    ax.axis('off')
-
-    plt.subplot2grid((4, 9), (3, 0), colspan=2)
-    plt.title(u'Event Information: \n Global Centroid-Moment-Tensor '
-              'Catalog (GCMT) \n\n Processing Date:\n' + 
-              str(UTCDateTime().date),
-              fontsize=14)
-
-    ax = plt.gca()
-    ax.axis('off')
-
-    # ============================= Save Figure ============================
-    plt.savefig(
-        os.path.join(folder_name,tag_name + '_{}_page_1.png'.format(station)))
-    plt.close()
-    print("Done")
-    # ======================================================================== 
-    #                                   
-    #               Preprocessing of rotations and translations
-    #
-    # =========================================================================
-    rt, ac, rt_pcoda, ac_pcoda, sec, sec_p, cutoff, cutoff_pc = resample(
-                                                    is_local(ds_in_km), rt, ac)
+        """
+        :type dic_station: :class: `~collections.OrderedDict`
+        :param dic_station: station dictionary from station_information()
+        """
+        self.dic_event.update(dic_station)
 
-    print("Removing instrument response...")
-    # remove instrument response based on station
-    rt, ac, rt_pcoda, ac_pcoda = remove_instr_resp(
-                                    rt, ac, rt_pcoda, ac_pcoda,station, startev)
+    def station(self, station):
+        return self.dic_event['station_information_{}'.format(station)]
 
-    print("Filtering and rotating traces...")
-    # filter raw data, rotate some to theoretical backazimuth, separate Pcoda
-    trv_acc, trv_pcoda, rt_bands, trv_bands, rt_pcoda_coarse, trv_pcoda_coarse,\
-    filt_rt_pcoda, filt_ac_pcoda, filt_trv_pcoda = filter_and_rotate(
-            rt, ac, rt_pcoda, ac_pcoda, cutoff, cutoff_pc, is_local(ds_in_km))
+    def stations(self):
+        return [K.split('station_information_')[1] for K in self.dic_event
+                                        if K.startswith('station_information_')]
 
-    print("Getting theoretical arrival times...")
-    # find trace start
-    init_sec = startev - ac[0].stats.starttime
+    def to_json(self):
+        return json.dumps(self.dic_event, indent = 4).encode()
 
-    # theoretical arrival times for P and S waves
-    arriv_p, arriv_s = ps_arrival_times(ds_in_km, depth, init_sec)
-    
-    # determine time windows for seismic phases (P,S,surface)
-    min_pw, max_pw, min_sw, max_sw, min_lwi, max_lwi, min_lwf, max_lwf = \
-        time_windows(ds_in_km, arriv_p, arriv_s, init_sec, is_local(ds_in_km))
+    def to_quakeml(self):
 
-    # ======================================================================== 
-    #                                
-    #                                   Page 2
-    #           Waveform Comparison plot w/ individual phase subplots
-    #
-    # =========================================================================    
-    print("\nPage 2 >  Waveform Comparison...",end=" ")
+        """
+        :rtype: bytes
+        :return: QuakeML of the event with the rotational parameters of all
+            stations in its extra tag.
+        """
+        event = self.event
+        ns = self.namespace
 
-    # rt.taper(max_percentage=0.05) # this was here but we already taper?
+        # check if event already has extra section
+        try:
+            event.extra
+        except AttributeError:
+            event.extra = AttribDict()
+
+        # write parameters into attribute dictionaries
+        for station in self.stations():
+            params = AttribDict()
+            for RP in self.rotational_parameters:
+                RP_value = self.station(station)['rotational_parameters'][RP]
+                params[RP] = AttribDict()
+                params[RP] = {'namespace':ns,
+                              'value': RP_value}
+
+            # set unit attributes
+            params.epicentral_distance.attrib = {'unit':"km"}
+            params.theoretical_backazimuth.attrib = {'unit':"degree"}
+
+            event.extra['rotational_parameters_{}'.format(station)] = \
+                                                            {'namespace': ns,
+                                                            'value': params}
 
-    # phase velocity, factor for displacing rotation rate, and time array
-    c1 = .5 * max(abs(trv_acc[0].data)) / max(abs(rt[0].data))  
-    fact1 = 2 * max(rt[0].data)  
-    time = rt[0].stats.delta * np.arange(0, len(rt[0].data))
+        quakeml = io.BytesIO()
+        event.write(quakeml, 'QUAKEML',
+                        nsmap={"rotational_seismology_database": 
+                            r"http://www.rotational-seismology.org"})
+        return quakeml.getvalue()
 
-    # main figure
-    plt.figure(figsize=(18, 9))
-    plt.subplot2grid((6, 5), (2, 0), colspan=5, rowspan=2)
-    plt.plot(time, rt[0].data, color='r', label=r'Rotation rate')
-    plt.plot(time, (0.5 / c1) * trv_acc[0].data + fact1, 
-                                color='k', label=r'Transversal acceleration')
-    plt.xlabel(r'Time [s]', fontweight='bold', fontsize=13)
-    plt.ylabel(
-        r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ [nrad/s] - a$_\mathbf{T}$/2c'
-        '[1/s]', fontweight='bold', fontsize=13)
-    plt.xlim(0, rt[0].stats.delta * len(rt[0].data))
-    plt.ylim(min(rt[0].data), fact1 + max((1. / (2. * c1)) * trv_acc[0].data))
-    
-    # place box in middle of figure
-    box_yposition = ((fact1 + max((1. / (2. * c1)) * trv_acc[0].data))
-                     - abs(min(rt[0].data)))/2  
-    
-    # gap between annotation and vertical
-    if is_local(ds_in_km) == 'FAR':  
-        xgap = 50
-    else:
-        xgap = 15
+    def write(self):
 
-    bbox_props = dict(boxstyle="square, pad=0.3", fc='white')
-    plt.axvline(x=min_pw, linewidth=1)
-    plt.annotate('1', xy=(min_pw+xgap, box_yposition), fontsize=14,
-                                            fontweight='bold', bbox=bbox_props)
-    plt.axvline(x=min_sw, linewidth=1)
-    plt.annotate('2', xy=(min_sw+xgap, box_yposition), fontsize=14,
-                                            fontweight='bold', bbox=bbox_props)
-    plt.axvline(x=min_lwi, linewidth=1)
-    plt.annotate('3', xy=(min_lwi+xgap, box_yposition), fontsize=14,
-                                            fontweight='bold', bbox=bbox_props)
-    plt.axvline(x=min_lwf, linewidth=1)
-    plt.annotate('4', xy=(min_lwf+xgap, box_yposition), fontsize=14,
-                                            fontweight='bold', bbox=bbox_props)
-    plt.title(r'Ring laser and broadband seismometer recordings. Event: %s %sZ'
-              % (startev.date, startev.time))
-    plt.grid(True)
-    plt.legend(loc=7,shadow=True)
-
-    # =============================== P coda ===============================
-    plt.subplot2grid((6, 5), (0, 0), colspan=2)
-    
-    # integer sampling rate for slice indexing
-    rt_SR = int(rt[0].stats.sampling_rate)
-    rt_pcoda_SR = int(rt_pcoda_coarse[0].stats.sampling_rate)
-    
-    # pwave arrival times in samples for normal trace and pcoda
-    min_pw_rt = rt_SR * min_pw
-    max_pw_rt = rt_SR * max_pw
-    min_pw_pcrt = rt_pcoda_SR * min_pw
-    max_pw_pcrt = rt_pcoda_SR * max_pw
-
-    # pcoda phase velocity
-    cp = 0.5 * (max(abs(trv_pcoda_coarse[0][min_pw_pcrt:max_pw_pcrt]))/
-                max(abs(rt_pcoda_coarse[0].data[min_pw_pcrt:max_pw_pcrt])))
-
-    # find min and max trace amplitudes for y-limits
-    min_ta_pcod = min((0.5 / cp) * trv_pcoda_coarse[0][min_pw_rt:max_pw_rt])
-    max_ta_pcod = max((0.5 / cp) * trv_pcoda_coarse[0][min_pw_rt:max_pw_rt])
-    min_rt_pcod = min(rt_pcoda_coarse[0].data[min_pw_rt:max_pw_rt])
-    max_rt_pcod = max(rt_pcoda_coarse[0].data[min_pw_rt:max_pw_rt])
-
-    plt.plot(time, rt_pcoda_coarse[0].data, color='r')
-    plt.plot(time, (0.5 / cp) * trv_pcoda_coarse[0], color='k')
-    plt.xlim(min_pw, max_pw)
-    plt.ylim(min([min_ta_pcod, min_ta_pcod]), max([max_rt_pcod, max_rt_pcod]))
-    plt.xlabel(r'Time [s]', fontweight='bold', fontsize=11)
-    plt.ylabel(
-        r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ [nrad/s] - a$_\mathbf{T}$/2c'
-        '[1/s]', fontweight='bold', fontsize=11)
-    plt.title(u'1: P-coda (Highpass, cut-off: %.1f Hz)' % cutoff_pc)
-    plt.grid(True)
-
-    # =============================== S wave ===============================
-    plt.subplot2grid((6, 5), (0, 3), colspan=2)
-
-    # swave arrival times in samples
-    min_sw_rt = rt_SR * min_sw
-    max_sw_rt = rt_SR * max_sw
-
-    cs = 0.5 * (max(abs(trv_acc[0].data[min_sw_rt:max_sw_rt])) / 
-                max(abs(rt[0].data[min_sw_rt:max_sw_rt])))
-
-    max_rt_s = max(rt[0].data[min_sw_rt:max_sw_rt])
-    min_rt_s = min(rt[0].data[min_sw_rt:max_sw_rt])
-    min_ta_s = min((0.5 / cs) * trv_acc[0].data[min_sw_rt:max_sw_rt])
-    max_ta_s = max((0.5 / cs) * trv_acc[0].data[min_sw_rt:max_sw_rt])
-
-    plt.plot(time, rt[0].data, color='r')
-    plt.plot(time, (0.5 / cs) * trv_acc[0].data, color='k')
-    plt.xlim(min_sw, max_sw)
-    plt.ylim(min([min_ta_s, min_rt_s]), max([max_ta_s, max_rt_s]))
-    plt.xlabel(r'Time [s]', fontweight='bold', fontsize=11)
-    plt.ylabel(
-        r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ [nrad/s] - a$_\mathbf{T}$/2c'
-        '[1/s]', fontweight='bold', fontsize=11)
-    plt.title(u'2: S-wave (Lowpass, cut-off: %s Hz)' % (cutoff))
-    plt.grid(True)
-
-    # ======================== Initial surface waves ==========================
-    plt.subplot2grid((6, 5), (5, 0), colspan=2)
-
-    # initial surface wave arrival times in samples
-    min_lwi_rt = rt_SR * min_lwi
-    max_lwi_rt = rt_SR * max_lwi
-
-    cl1 = 0.5 * (max(abs(trv_acc[0].data[min_lwi_rt:max_lwi_rt])) /
-                 max(abs(rt[0].data[min_lwi_rt:max_lwi_rt])))
-
-    min_rt_lwi = min(rt[0].data[min_lwi_rt:max_lwi_rt])
-    max_rt_lwi= max(rt[0].data[min_lwi_rt:max_lwi_rt])
-    min_ta_lwi = min((0.5 / cl1) * trv_acc[0].data[min_lwi_rt:max_lwi_rt])
-    max_ta_lwi = max((0.5 / cl1) * trv_acc[0].data[min_lwi_rt:max_lwi_rt])
-
-    plt.plot(time, rt[0].data, color='r')
-    plt.plot(time, (0.5 / cl1) * trv_acc[0].data, color='k')
-    plt.xlim(min_lwi, max_lwi)
-    plt.ylim(min([min_rt_lwi, min_ta_lwi]),max([max_rt_lwi, max_ta_lwi]))
-    plt.xlabel(r'Time [s]', fontweight='bold', fontsize=11)
-    plt.ylabel(
-        r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ [rad/s] - a$_\mathbf{T}$/2c'
-        '[1/s]', fontweight='bold', fontsize=11)
-    plt.title(r'3: Initial surface waves (Lowpass, cut-off: %s Hz)'
-              % (cutoff))
-    plt.grid(True)
-
-    # ========================== Later surface waves ==========================
-    plt.subplot2grid((6, 5), (5, 3), colspan=2)
-
-    # later surface wave arrival times in samples
-    min_lwf_rt = rt_SR * min_lwf
-    max_lwf_rt = rt_SR * max_lwf
-
-    cl2 = 0.5 * (max(abs(trv_acc[0].data[min_lwf_rt:max_lwf_rt])) /
-                 max(abs(rt[0].data[min_lwf_rt:max_lwf_rt])))
-    
-    min_rt_lwf = min(rt[0].data[min_lwf_rt:max_lwf_rt])
-    max_rt_lwf = max(rt[0].data[min_lwf_rt:max_lwf_rt])
-    min_ta_lwf = min((0.5 / cl2) * trv_acc[0].data[min_lwf_rt:max_lwf_rt])
-    max_ta_lwf = max((0.5 / cl2) * trv_acc[0].data[min_lwf_rt:max_lwf_rt])
-
-    plt.plot(time, rt[0].data, color='r')
-    plt.plot(time, (0.5 / cl2) * trv_acc[0].data, color='k')
-    plt.xlim(min_lwf, max_lwf)
-    plt.ylim(min([min_rt_lwf, min_ta_lwf]),max([max_rt_lwf, max_ta_lwf]))
-    plt.xlabel(r'Time [s]', fontsize=11, fontweight='bold')
-    plt.ylabel(
-        r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ [rad/s] - a$_\mathbf{T}$/2c'
-                                        '[1/s]', fontsize=11, fontweight='bold')
-    plt.title(r'4: Later surface waves (Lowpass, cut-off: %s Hz)' % (cutoff))
-    plt.grid(True)
-
-    # ============================= Save Figure =============================
-    plt.savefig(
-        os.path.join(folder_name,tag_name + '_{}_page_2.png'.format(station)))
-    plt.close()
-    print("Done")
+        """
+        Writes the .json and QuakeML files, see write_files().
+        """
+        write_files([(self.filename_json, self.to_json()),
+                     (self.filename_xml, self.to_quakeml())])
 
-    # ======================================================================== 
-    #                                
-    #                Cross Correlations and Phase Velocities
-    #
-    # ========================================================================= 
-    print("Finding zero-lag correlation coefficients...")
 
-    # correlate vertical rotation rate and transverse acceleration
-    corrcoefs, thres = get_corrcoefs(rt, trv_acc, sec)
+class MapBackgrounds(object):
 
-    # calculate correlations for different frequency bands,
-    # length of time windows given by seconds_list
-    corrcoefs_bands, thresholds = [], []
-    seconds_list = [200, 100, 50, 20, 12, 10, 8, 6]
+    """
+    Cache of the page 1 map backgrounds. Building a Basemap with coastline 
+    data and drawing continents, borders and the land-sea mask is the slowest
+    part of page 1, so for each view and rounded map center this is done only
+    once: the background is rasterized to a .png in cache_dir and the 
+    projection is kept as a Basemap without coastline data. For each event 
+    only gridline labels, great circle and markers are drawn on top.
+
+    :type cache_dir: str
+    :param cache_dir: Folder of the rasterized backgrounds.
+    :type size: int
+    :param size: Number of backgrounds kept in memory.
+    """
+    def __init__(self, cache_dir='./map_cache/', size=16):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.cache = OrderedDict()
+
+    def center(self, view, lat_0, lon_0):
+
+        """
+        Rounds a map center to the quantum of the view.
+
+        :type view: str
+        :param view: Key of MAP_VIEWS.
+        :type lat_0, lon_0: float
+        :param lat_0, lon_0: Map center [deg].
+        :rtype: tuple
+        :return: Rounded (latitude, longitude), longitude in [-180, 180).
+        """
+        quantum = MAP_VIEWS[view]['quantum']
+        lat_0 = round(lat_0 / quantum) * quantum + 0.
+        lon_0 = (round(lon_0 / quantum) * quantum + 180.) % 360. - 180.
+        return lat_0, lon_0
+
+    def view(self, ds_in_km, station_lat, station_lon, event_lat, event_lon):
+
+        """
+        Chooses the map view for a station-event pair.
+
+        :type ds_in_km: float
+        :param ds_in_km: Event-station distance in km
+        :type station_lat, station_lon: float
+        :param station_lat, station_lon: Station location [deg].
+        :type event_lat, event_lon: float
+        :param event_lat, event_lon: Event location [deg].
+        :rtype view: str
+        :return view: Key of MAP_VIEWS.
+        :rtype center: tuple
+        :return center: Rounded map center (latitude, longitude).
+        """
+        view = is_local(ds_in_km)
+        lat_0 = (station_lat + event_lat) / 2
+        lon_0 = (station_lon + event_lon) / 2
+        if view == 'FAR' and ds_in_km <= 13000:
+            view = 'GLOBE'
+        elif view == 'FAR':
+            view = 'WORLD'
+            lat_0 = 0.
+            # If the great circle between the station and event is crossing 
+            # the 180° meridian in the pacific and the stations are far apart
+            # the map has to be re-centered, otherwise wrong side of globe.
+            if abs(station_lon - event_lon) > 180:
+                lon_0 += 180
+
+        return view, self.center(view, lat_0, lon_0)
+
+    def path(self, view, center):
+        return os.path.join(self.cache_dir, 
+                                '{}_{:+05.1f}_{:+06.1f}.png'.format(view, *center))
+
+    def basemap(self, view, center, resolution=None):
+
+        """
+        Basemap of a view, without coastline data unless a resolution is set.
+        """
+        settings = dict(MAP_VIEWS[view]['basemap'], resolution=resolution)
+        if view != 'WORLD':
+            settings['lat_0'] = center[0]
+        return Basemap(lon_0=center[1], **settings)
+
+    def render(self, view, center):
+
+        """
+        Draws the background of a view with coastline data and rasterizes
+        the map axes to cache_dir.
+
+        :type view: str
+        :param view: Key of MAP_VIEWS.
+        :type center: tuple
+        :param center: Rounded map center (latitude, longitude).
+        """
+        settings = MAP_VIEWS[view]
+        map = self.basemap(view, center, settings['basemap']['resolution'])
+
+        # same layout as page 1 so the raster is not resampled when drawn
+        fig = plt.figure(figsize=settings['figsize'])
+        ax = plt.subplot2grid((4, 9), (0, 4), colspan=5, rowspan=4)
+        if view in ['GLOBE', 'WORLD']:
+            map.drawmeridians(np.arange(0, 360, settings['grid']))
+            map.drawparallels(np.arange(-90, 90, settings['grid']))
+        else:
+            if view == 'CLOSE':
+                map.drawrivers(linewidth=0.25, color='b')
+            map.drawstates(linewidth=0.25)
+
+        # basemap boundary settings
+        map.drawcoastlines(linewidth=0.25)
+        map.drawcountries(linewidth=0.25)
+        map.fillcontinents(color='coral', lake_color='lightblue')
+        map.drawmapboundary(fill_color='lightblue')
+
+        if view in ['LOCAL', 'CLOSE']:
+            map.drawlsmask(land_color='coral', ocean_color='lightblue', 
+                                                                lakes=True)
+            map.drawcountries(linewidth=0.6)
+
+        ax.axis('off')
+        fig.patch.set_alpha(0.)
+        fig.canvas.draw()
+        canvas = np.asarray(fig.canvas.buffer_rgba())
+        x0, y0, x1, y1 = np.round(ax.bbox.extents).astype(int)
+        image = canvas[len(canvas) - y1:len(canvas) - y0, x0:x1].copy()
+        plt.close(fig)
+
+        # several workers may render the same background
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path(view, center)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        plt.imsave(tmp, image, format='png')
+        os.replace(tmp, path)
+
+    def get(self, view, center):
+
+        """
+        Projection and background image of a view, rendered if not cached.
+        """
+        key = (view, center)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        path = self.path(view, center)
+        if not os.path.exists(path):
+            self.render(view, center)
+        self.cache[key] = (self.basemap(view, center), plt.imread(path))
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+
+        return self.cache[key]
+
+    def draw(self, ax, view, center):
+
+        """
+        Draws the cached background of a view into the page 1 map axes.
+
+        :type ax: :class: `~matplotlib.axes.Axes`
+        :param ax: Map axes of page 1.
+        :type view: str
+        :param view: Key of MAP_VIEWS.
+        :type center: tuple
+        :param center: Rounded map center (latitude, longitude).
+        :rtype: :class: `~mpl_toolkits.basemap.Basemap`
+        :return: Projection of the map, used for great circle and markers.
+        """
+        map, image = self.get(view, center)
+        ax.imshow(image, extent=(map.llcrnrx, map.urcrnrx, 
+                                 map.llcrnry, map.urcrnry), 
+                                 interpolation='none', zorder=0)
+        map.set_axes_limits(ax=ax)
+
+        if view in ['LOCAL', 'CLOSE']:
+            grid = MAP_VIEWS[view]['grid']
+            map.drawparallels(np.arange(0., 90, grid), labels=[1, 0, 0, 1],
+                                                                        ax=ax)
+            map.drawmeridians(np.arange(0., 360., grid), labels=[1, 0, 0, 1],
+                                                                        ax=ax)
+        return map
+
+    def warm(self, stations, views=['LOCAL', 'CLOSE']):
+
+        """
+        Renders the missing backgrounds of all map centers that events in 
+        the given views can produce around the stations.
+
+        :type stations: list of str
+        :param stations: Stations, i.e. ['RLAS', 'ROMY'].
+        :type views: list of str
+        :param views: Keys of MAP_VIEWS, only regional views are bounded.
+        :rtype: int
+        :return: Number of rendered backgrounds.
+        """
+        # maximum event distance [deg] of the view, see is_local()
+        max_distance = {'LOCAL': 10., 'CLOSE': 3.}
+
+        centers = set()
+        for station in stations:
+            sta_lat, sta_lon = STATION_COORDINATES[station]
+            for view in views:
+                quantum = MAP_VIEWS[view]['quantum']
+                radius = max_distance[view] / 2. + quantum
+                lon_radius = radius / np.cos(np.radians(sta_lat))
+                for lat in np.arange(sta_lat - radius, sta_lat + radius, 
+                                                                    quantum):
+                    for lon in np.arange(sta_lon - lon_radius, 
+                                            sta_lon + lon_radius, quantum):
+                        if locations2degrees(sta_lat, sta_lon, lat, 
+                                                            lon) <= radius:
+                            centers.add((view, self.center(view, lat, lon)))
+
+        missing = [C for C in sorted(centers) 
+                                        if not os.path.exists(self.path(*C))]
+        print("{} map background(s), {} missing".format(len(centers), 
+                                                                len(missing)))
+        for i, (view, center) in enumerate(missing):
+            print("{} of {}: {} {}".format(i + 1, len(missing), view, center))
+            self.render(view, center)
+
+        return len(missing)
+
+
+# page 1 map backgrounds, cache_dir set by --map_cache
+MAP_BACKGROUNDS = MapBackgrounds()
+
+
+def envelope_decimate(x, y, xlim, bounds):
 
-    for i in range(len(rt_bands)):
-        corrcoefs_tmp, thresh_tmp = get_corrcoefs(streamA = rt_bands[i],
-                                                  streamB = trv_bands[i],
-                                                  sec = seconds_list[i])
-        corrcoefs_bands.append(corrcoefs_tmp)
-        thresholds.append(thresh_tmp)
+    """
+    Reduces a uniformly sampled series to what can be seen in an axes: the
+    samples inside xlim and, if there are more than a few per pixel column,
+    the first, minimum, maximum and last sample of each column in their
+    original order. The drawn line covers the same pixels as the full
+    series, so peaks are kept and the rendered page does not change.
+
+    :type x: numpy.ndarray
+    :param x: Increasing sample times.
+    :type y: numpy.ndarray
+    :param y: Sample values, same length as x.
+    :type xlim: tuple
+    :param xlim: Visible x-range of the axes.
+    :type bounds: tuple
+    :param bounds: Left and right edge of the axes in pixels.
+    :rtype: tuple
+    :return: Decimated x and y.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    first = max(np.searchsorted(x, xlim[0]) - 1, 0)
+    last = min(np.searchsorted(x, xlim[1]) + 1, len(x))
+    x, y = x[first:last], y[first:last]
+    if len(y) < 8 * (bounds[1] - bounds[0]):
+        return x, y
+
+    # pixel column of each sample and first sample of each column
+    scale = (bounds[1] - bounds[0]) / float(xlim[1] - xlim[0])
+    column = np.floor(bounds[0] + (x - xlim[0]) * scale).astype(int)
+    starts = np.flatnonzero(np.diff(column, prepend=column[0] - 1))
+    ends = np.append(starts[1:], len(y)) - 1
+    counts = ends - starts + 1
+
+    # first occurrence of the minimum and maximum in each column
+    index = [starts, ends]
+    for extreme in [np.minimum, np.maximum]:
+        values = np.repeat(extreme.reduceat(y, starts), counts)
+        hits = np.flatnonzero(y == values)
+        _, once = np.unique(np.searchsorted(starts, hits, side='right'),
+                                                            return_index=True)
+        index.append(hits[once])
+    index = np.unique(np.concatenate(index))
+    return x[index], y[index]
+
+
+class PageTemplate(object):
 
-    # zero-lag correlation coefficients for range of backazimuths
-    print("Analyzing correlation by BAz bins...")
-    corrbaz, maxcorr, backas, max_coefs_10deg = baz_analysis(rt, ac, sec)
+    """
+    Figure skeleton of one page layout. Axes, labels, legends and colorbars
+    are built once, for each event only the data, limits and titles of the
+    artists are updated before the figure is saved. Templates are kept per
+    process in PAGE_TEMPLATES, see get_page_template(). Each page subclasses
+    it, builds its artists in __init__ and sets them from the products of a
+    station in update(P), called by render().
+
+    :type figsize: tuple
+    :param figsize: Figure size in inches.
+    """
+    def __init__(self, figsize):
+        self.fig = Figure(figsize=figsize)
+        FigureCanvasAgg(self.fig)
 
-    # estimate backazimuth and correlations for given BAz
-    print("Estimating best backazimuth values...")
-    corrsum, baz_list, max_ebaz_xcoef, EBA = estimate_baz(
-                                                        rt, ac, min_sw, max_lwf)
+    def set_trace(self, line, x, y):
 
-    print("Calculating phase velocities...")
-    phasv = get_phase_vel(rt, trv_acc, sec, corrcoefs, start=0)
-    
-    # calculate phase velocities for different frequency bands
-    surf_start = min_lwi // sec
-    phasv_bands,phasv_means,phasv_stds = [],[],[]
-    for i in range(len(rt_bands)):
-        phasv_tmp = get_phase_vel(rt_bands[i], trv_bands[i], seconds_list[i],
-                                        corrcoefs_bands[i], start=surf_start)
-        
-        # filter out NaNs and append to list
-        phasv_bands.append(phasv_tmp[~np.isnan(phasv_tmp)])
-    
-    # phase velocity mean values and std. for json file
-    for PVB in phasv_bands:
-        if len(PVB) != 0:
-            phasv_means.append(np.mean(PVB))
-            phasv_stds.append(np.std(PVB))
-        else:
-            phasv_means.append(np.NaN)
-            phasv_stds.append(np.NaN)
+        """
+        Sets the data of a line showing a full trace, reduced to a few
+        points per pixel column of its axes, see envelope_decimate(). The x-limits
+        of the axes have to be set before.
+        """
+        ax = line.axes
+        line.set_data(*envelope_decimate(x, y, ax.get_xlim(),
+                                                (ax.bbox.x0, ax.bbox.x1)))
 
-    # ======================================================================== 
-    #                                
-    #                                Page 3
-    #              Cross Correlation, phase velocity determination,
-    #                    Estimation of backazimuth figures
-    #
-    # ========================================================================= 
-    print("\nPage 3 > Cross-correlation, Phase velocity...",end=" ")
+    def render(self, P, filename):
 
-    X, Y = np.meshgrid(np.arange(0, sec * len(corrcoefs), sec), backas)
-
-    # subplot 1
-    plt.figure(figsize=(18, 9))
-    plt.subplot2grid((4, 26), (0, 0), colspan=25)
-    plt.plot(time, rt[0].data, color='r', label=r'Rotation rate')
-    plt.plot(time, (1. / (2. * c1)) * trv_acc[0].data + fact1, 
-                                color='k', label=r'Transversal acceleration')
-    plt.ylabel(
-        r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ [nrad/s] - a$_\mathbf{T}$/2c '
-        '[1/s]', fontsize=10, fontweight='bold')
-    plt.xlim(0, rt[0].stats.delta * len(rt[0].data))
-    plt.ylim(min(rt[0].data), fact1 + max((1. / (2. * c1)) * trv_acc[0].data))
-    plt.title(r'Cross-correlation for $\dot\Omega_z$ and a$_T$ in %s seconds '
-                          'time windows (lowpass, cutoff: %s Hz). Event: %s %sZ'
-                          % (sec, cutoff, startev.date, startev.time))
-    plt.grid(True)
-    plt.legend(loc=7,shadow=True)
-
-    # subplot 2
-    plt.subplot2grid((4, 26), (1, 0), colspan=25)
-    plt.scatter(np.arange(0, sec * len(phasv), sec), phasv,
-                c=corrcoefs, vmin=0.75, vmax=1, s=35,
-                cmap=plt.cm.autumn_r)
-    plt.ylabel(r'Phase velocity [km/s]', fontsize=10, fontweight='bold')
-    plt.xlim(0, rt[0].stats.delta * len(rt[0].data))
-    plt.ylim(0, 16)
-    plt.grid(True)
-
-    fig = plt.subplot2grid((4, 26), (1, 25))
-    cmap = mpl.cm.autumn_r
-    norm = mpl.colors.Normalize(vmin=0.75, vmax=1)
-    cb1 = mpl.colorbar.ColorbarBase(
-                            fig, cmap=cmap, norm=norm, orientation='vertical',
-                            ticks=np.linspace(0.75,1,6).tolist())
-    cb1.set_label(r'X-corr. coeff.', fontweight='bold')
-
-    # subplot 3
-    plt.subplot2grid((4, 26), (2, 0), colspan=25)
-    plt.plot(np.arange(0, sec * len(corrcoefs), sec), max_coefs_10deg, 'ro-', 
-                                    label='Max. CC for est. BAz', linewidth=1)
-    plt.plot(np.arange(0, sec * len(corrcoefs), sec), corrcoefs, 'ko-', 
-                                        label='CC for theo. BAz', linewidth=1)
-    plt.plot(np.arange(0, sec * len(corrcoefs) + 1, sec), thres, '--r', lw=2)
-    plt.ylabel(r'X-corr. coeff.', fontsize=10, fontweight='bold')
-
-    # 75% annotation location
-    if is_local(ds_in_km) == 'FAR':
-        shift75 = 50
-    else:
-        shift75 = 10
-
-    plt.text(time[len(time) - 1] + shift75, 0.71, r'0.75', color='red')
-    plt.xlim(0, rt[0].stats.delta * len(rt[0].data))
-
-    min_corr = min(min(max_coefs_10deg), min(corrcoefs))
-    plt.ylim(min_corr, 1)
-    plt.legend(loc=4, shadow=True)
-    plt.grid(True)
-
-    # subplot 4
-    plt.subplot2grid((4, 26), (3, 0), colspan=25)
-    teobaz = BAz * np.ones(len(corrcoefs) + 1)
-    plt.pcolor(X, Y, corrbaz, cmap=plt.cm.RdYlGn_r, vmin=-1, vmax=1)
-    plt.plot(np.arange(0, sec * len(corrcoefs) + 1, sec), teobaz, '--r', lw=2)
-    plt.plot(np.arange(0, sec * len(corrcoefs), sec), maxcorr, '.k')
-    plt.text(1000, BAz, str(BAz)[0:5] + r'°',
-             bbox={'facecolor': 'black', 'alpha': 0.8}, color='r')
-
-    # only plot estimated backazimuth if a value is given
-    if not np.isnan(EBA):
-        obsbaz = EBA * np.ones(len(corrcoefs) + 1)
-        plt.text(400, EBA, str(EBA)[0:5] + r'°',
-                 bbox={'facecolor': 'black', 'alpha': 0.8}, color='y')
-        plt.plot(np.arange(0, sec * len(corrcoefs) + 1, sec),
-                 obsbaz, '--y', lw=2)
-
-    plt.xlim(0, rt[0].stats.delta * len(rt[0].data))
-    plt.xlabel(r'Time [s]', fontweight='bold')
-    plt.ylabel(r'BAz [°]', fontsize=10, fontweight='bold')
-    plt.ylim([0, 360])
-    plt.yticks(np.linspace(0,360,7).tolist())
-    plt.grid(True)
-    fig = plt.subplot2grid((4, 26), (3, 25))
-    norm = mpl.colors.Normalize(vmin=-1, vmax=1)
-    cb1 = mpl.colorbar.ColorbarBase(fig, cmap=plt.cm.RdYlGn_r, norm=norm, 
-                                                        orientation='vertical')
-    cb1.set_label(r'X-corr. coeff.', fontweight='bold')
-    cb1.set_ticks(np.linspace(-1,1,9).tolist())
-
-    # ============================= Save Figure =============================
-    
-    plt.savefig(
-        os.path.join(folder_name,tag_name + '_{}_page_3.png'.format(station)))
-    plt.close()
-    print("Done")
+        """
+        Updates the template with the products of one station and saves it.
 
-    # ======================================================================== 
-    #                                
-    #                                P-Coda analysis
-    #
-    # ========================================================================= 
-    print("Analyzing rotations in the P-coda...")
-    
-    # Zero-lag correlation coefficients
-    print("Zero-lag cross correlations...",end=" ")
+        :type P: :class: `~obspy.core.util.attribdict.AttribDict`
+        :param P: Analysis products of one station, see plot_waveform_comp().
+        :type filename: str
+        :param filename: Path of the .png file.
+        """
+        self.update(P)
+        self.fig.savefig(filename)
 
-    # integer sampling rates
-    rt_pc_SR = int(filt_rt_pcoda[0].stats.sampling_rate)
-    ac_pc_SR = int(filt_trv_pcoda[0].stats.sampling_rate)
-    
-    corrcoefs_p = []
-    lwi_average = int(round((min_lwi+max_lwi)/2))
 
-    # separate vertical components
-    acZ_pcoda = ac_pcoda.select(component='Z')
+def set_annotation(annotation, xy):
+    annotation.xy = xy
+    annotation.set_position(xy)
 
-    # cut pcoda at correct time window and taper cuts
-    rt_pcoda_cut = filt_rt_pcoda.copy()
-    ac_pcoda_cut = filt_ac_pcoda.copy()
-    trv_pcoda_cut = filt_trv_pcoda.copy()
 
-    rt_pcoda_cut[0].data = filt_rt_pcoda[0].data[0:lwi_average * rt_pc_SR]
-    trv_pcoda_cut[0].data = trv_pcoda_cut[0].data[0:lwi_average * ac_pc_SR]
-    for i in range(3):
-        ac_pcoda_cut[i].data = filt_ac_pcoda[i].data[0:lwi_average * ac_pc_SR]
-    
-    for traces in [rt_pcoda,rt_pcoda_cut,ac_pcoda_cut,trv_pcoda_cut]:
-        traces.taper(max_percentage=0.05)
+class TitleCardTemplate(PageTemplate):
 
-    # find correlations
-    corrcoefs_p, thres_p = get_corrcoefs(rt_pcoda_cut, trv_pcoda_cut, sec_p)
+    """
+    Page 1: map with event location and event information, per map view.
+    The cached map background is only redrawn if the map center changes.
+    """
+    def __init__(self, view):
+        PageTemplate.__init__(self, MAP_VIEWS[view]['figsize'])
+        self.view = view
+        self.center = None
+        self.artists = []
+        fig = self.fig
+        gs = GridSpec(4, 9, figure=fig)
+
+        if view == 'CLOSE':
+            self.ax_close = fig.add_subplot(111)
+        self.ax_map = fig.add_subplot(gs[0:4, 4:9])
+
+        # title large
+        self.ax_title = fig.add_subplot(gs[1, 0:2])
+        self.ax_title.axis('equal')
+        self.ax_title.axis('off')
+
+        # sub-title
+        self.ax_info = fig.add_subplot(gs[2, 0:2])
+        self.ax_info.axis('off')
+
+        self.ax_catalog = fig.add_subplot(gs[3, 0:2])
+        self.ax_catalog.axis('off')
+
+    def update(self, P):
+        view, center = MAP_BACKGROUNDS.view(P.ds_in_km, P.station_lat,
+                                    P.station_lon, P.event_lat, P.event_lon)
+        shift_text = MAP_VIEWS[view]['shift_text']
+        event_size = MAP_VIEWS[view]['event_size']
+        ax = self.ax_map
+
+        # background (coastlines, continents, land-sea mask) from the map cache
+        if center != self.center:
+            ax.cla()
+            self.map = MAP_BACKGROUNDS.draw(ax, view, center)
+            self.center = center
+        else:
+            for artist in self.artists:
+                artist.remove()
+        map = self.map
+
+        self.artists = list(map.drawgreatcircle(P.event_lon, P.event_lat,
+                                    P.station_lon, P.station_lat, ax=ax,
+                                    linewidth=3, color='yellow'))
+
+        # =========================== Station/ Event ==========================
+        ev_x, ev_y = map(P.event_lon, P.event_lat)
+        sta_x, sta_y = map(P.station_lon, P.station_lat)
+
+        # station
+        self.artists.append(map.scatter(sta_x, sta_y, 200, color='b',
+                            marker='v', edgecolor='k', zorder=100, ax=ax))
+        self.artists.append(ax.text(sta_x + shift_text, sta_y, P.station,
+                                                va='top',
+                                                family='monospace',
+                                                weight='bold',
+                                                zorder=101,
+                                                color='k',
+                                                backgroundcolor='white'))
+        # event as moment tensor or star
+        # !!! doesn't work for some reason - disregard for now
+        # if moment_tensor:
+        #     b = beach(moment_tensor, xy=(ev_x,ev_y), facecolor='blue',
+        #                                 width=100, linewidth=1, alpha=1.0)
+        #     b.set_zorder(100)
+        #     ax.add_collection(b)
+
+        # plot event
+        self.artists.append(map.scatter(ev_x, ev_y, event_size, color="b",
+                        marker="*", edgecolor="k", zorder=100, ax=ax))
+
+        if self.view == 'CLOSE':
+            self.ax_close.set_title('{}T{}Z\n \n '.format(P.startev.date,
+                        P.startev.time), fontsize=24, fontweight='bold')
+        self.ax_title.set_title(u'{}T{}Z\n'.format(P.startev.date,
+                        P.startev.time), fontsize=20, weight='bold')
+        self.ax_info.set_title(u'\n\nRegion: {}'.format(P.flinn_engdahl_title)
+                + '\n\nMagnitude: {} {}'.format(P.mag, P.magnitude_type) +
+                '\n\nDistance: {} [km], {} [°]'.format(
+                                    round(P.ds_in_km,2), round(P.BAz,2)) +
+                '\n\nDepth: {} [km]'.format(P.depth),
+                fontsize=18, fontweight='bold')
+        self.ax_catalog.set_title(u'Event Information: \n Global '
+                'Centroid-Moment-Tensor Catalog (GCMT) \n\n Processing Date:\n'
+                + str(UTCDateTime().date), fontsize=14)
+
+
+class WaveformTemplate(PageTemplate):
 
-    print("Backzimuths...")
-    # surface wave start sample
-    max_lwi_ac = ac_pc_SR * max_lwi
+    """
+    Page 2: waveform comparison plot with individual phase subplots.
+    """
+    def __init__(self, category):
+        PageTemplate.__init__(self, (18, 9))
+        fig = self.fig
+        gs = GridSpec(6, 5, figure=fig)
+        ylabel = (r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ [nrad/s] - '
+                                                r'a$_\mathbf{T}$/2c[1/s]')
+
+        # main figure
+        ax = self.ax_main = fig.add_subplot(gs[2:4, 0:5])
+        self.rt, = ax.plot([], [], color='r', label=r'Rotation rate')
+        self.trv, = ax.plot([], [], color='k',
+                                        label=r'Transversal acceleration')
+        ax.set_xlabel(r'Time [s]', fontweight='bold', fontsize=13)
+        ax.set_ylabel(ylabel, fontweight='bold', fontsize=13)
+
+        bbox_props = dict(boxstyle="square, pad=0.3", fc='white')
+        self.vlines, self.boxes = [], []
+        for box in ['1', '2', '3', '4']:
+            self.vlines.append(ax.axvline(x=0, linewidth=1))
+            self.boxes.append(ax.annotate(box, xy=(0, 0), fontsize=14,
+                                            fontweight='bold', bbox=bbox_props))
+        ax.grid(True)
+        ax.legend(loc=7,shadow=True)
+
+        # phase windows: P coda, S wave, initial and later surface waves
+        self.phases = []
+        for position, ylabel in [((0, 0), ylabel), ((0, 3), ylabel),
+                                 ((5, 0), ylabel.replace('nrad', 'rad')),
+                                 ((5, 3), ylabel.replace('nrad', 'rad'))]:
+            ax = fig.add_subplot(gs[position[0], position[1]:position[1] + 2])
+            rt, = ax.plot([], [], color='r')
+            trv, = ax.plot([], [], color='k')
+            ax.set_xlabel(r'Time [s]', fontweight='bold', fontsize=11)
+            ax.set_ylabel(ylabel, fontweight='bold', fontsize=11)
+            ax.grid(True)
+            self.phases.append((ax, rt, trv))
+
+    def update(self, P):
+        rt, trv_acc, time = P.rt, P.trv_acc, P.time
+        c1, fact1, xgap, cutoff = P.c1, P.fact1, P.xgap, P.cutoff
+
+        # main figure
+        self.ax_main.set_xlim(0, P.delta * len(rt))
+        self.set_trace(self.rt, time, rt)
+        self.set_trace(self.trv, time, (0.5 / c1) * trv_acc + fact1)
+        self.ax_main.set_ylim(min(rt), fact1 + max((1. / (2. * c1)) * trv_acc))
+
+        # place box in middle of figure
+        box_yposition = ((fact1 + max((1. / (2. * c1)) * trv_acc))
+                         - abs(min(rt)))/2
+        for vline, box, x in zip(self.vlines, self.boxes,
+                                    [P.min_pw, P.min_sw, P.min_lwi, P.min_lwf]):
+            vline.set_xdata([x, x])
+            set_annotation(box, (x + xgap, box_yposition))
+        self.ax_main.set_title(r'Ring laser and broadband seismometer '
+                'recordings. Event: %s %sZ' % (P.startev.date, P.startev.time))
+
+        # time windows in samples, pcoda from the coarse traces
+        windows = [(P.min_pw, P.max_pw, P.rt_pcoda_coarse, P.trv_pcoda_coarse,
+                    u'1: P-coda (Highpass, cut-off: %.1f Hz)' % P.cutoff_pc),
+                   (P.min_sw, P.max_sw, rt, trv_acc,
+                    u'2: S-wave (Lowpass, cut-off: %s Hz)' % (cutoff)),
+                   (P.min_lwi, P.max_lwi, rt, trv_acc,
+                    r'3: Initial surface waves (Lowpass, cut-off: %s Hz)'
+                    % (cutoff)),
+                   (P.min_lwf, P.max_lwf, rt, trv_acc,
+                    r'4: Later surface waves (Lowpass, cut-off: %s Hz)'
+                    % (cutoff))]
+
+        for i, (ax, rt_line, trv_line) in enumerate(self.phases):
+            min_w, max_w, rt_w, trv_w, title = windows[i]
+            min_rt = P.rt_SR * min_w
+            max_rt = P.rt_SR * max_w
+
+            if i == 0:
+                # pcoda phase velocity and y-limits
+                min_pc = P.rt_pcoda_SR * min_w
+                max_pc = P.rt_pcoda_SR * max_w
+                c = 0.5 * (max(abs(trv_w[min_pc:max_pc])) /
+                           max(abs(rt_w[min_pc:max_pc])))
+                min_ta = min((0.5 / c) * trv_w[min_rt:max_rt])
+                max_rt_w = max(rt_w[min_rt:max_rt])
+                ylim = (min_ta, max_rt_w)
+            else:
+                c = 0.5 * (max(abs(trv_w[min_rt:max_rt])) /
+                           max(abs(rt_w[min_rt:max_rt])))
+                ylim = (min(min((0.5 / c) * trv_w[min_rt:max_rt]),
+                            min(rt_w[min_rt:max_rt])),
+                        max(max((0.5 / c) * trv_w[min_rt:max_rt]),
+                            max(rt_w[min_rt:max_rt])))
 
-    # analyze backazimuth
-    corrbaz_p, maxcorr_p, backas_p, max_coefs_10deg_p = baz_analysis(
-                                            rt_pcoda_cut, ac_pcoda_cut, sec_p)
+            ax.set_xlim(min_w, max_w)
+            self.set_trace(rt_line, time, rt_w)
+            self.set_trace(trv_line, time, (0.5 / c) * trv_w)
+            ax.set_ylim(*ylim)
+            ax.set_title(title)
 
-    # set up arrays for plotting
-    time_p = rt_pcoda_cut[0].stats.delta * np.arange(0, len(rt_pcoda[0].data))
-    fact1_p = 2 * max(rt_pcoda[0].data[0:max_lwi_ac])
 
-    c1_p = .5 * (max(abs(trv_pcoda[0].data[0:max_lwi_ac])) /
-                 max(abs(rt_pcoda[0].data[0:max_lwi_ac])))
+class CorrelationTemplate(PageTemplate):
 
-    # check for correlations >= 0.5
-    maxcorr_p_list = []
-    for m in range(0, len(maxcorr_p)):
-        if np.max(corrbaz_p[:,m]) >= 0.5:
-            maxcorr_p_list.append(maxcorr_p[m])
+    """
+    Page 3: cross correlation, phase velocity determination and estimation
+    of backazimuth.
+    """
+    def __init__(self, category):
+        PageTemplate.__init__(self, (18, 9))
+        fig = self.fig
+        gs = GridSpec(4, 26, figure=fig)
+
+        # 75% annotation location
+        if category == 'FAR':
+            self.shift75 = 50
         else:
-            maxcorr_p_list.append(0)
+            self.shift75 = 10
+
+        # subplot 1
+        ax = self.ax_wave = fig.add_subplot(gs[0, 0:25])
+        self.rt, = ax.plot([], [], color='r', label=r'Rotation rate')
+        self.trv, = ax.plot([], [], color='k',
+                                        label=r'Transversal acceleration')
+        ax.set_ylabel(
+            r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ [nrad/s] - a$_\mathbf{T}$/2c '
+            '[1/s]', fontsize=10, fontweight='bold')
+        ax.grid(True)
+        ax.legend(loc=7,shadow=True)
+
+        # subplot 2
+        ax = self.ax_phasv = fig.add_subplot(gs[1, 0:25])
+        self.phasv = ax.scatter([], [], c=[], vmin=CORRELATION_THRESHOLD, 
+                                vmax=1, s=35,
+                                                        cmap=plt.cm.autumn_r)
+        ax.set_ylabel(r'Phase velocity [km/s]', fontsize=10,
+                                                        fontweight='bold')
+        ax.set_ylim(0, 16)
+        ax.grid(True)
+
+        cb1 = mpl.colorbar.ColorbarBase(fig.add_subplot(gs[1, 25]),
+                            cmap=mpl.cm.autumn_r,
+                            norm=mpl.colors.Normalize(
+                                        vmin=CORRELATION_THRESHOLD, vmax=1),
+                            orientation='vertical',
+                            ticks=np.linspace(CORRELATION_THRESHOLD, 1, 
+                                                                6).tolist())
+        cb1.set_label(r'X-corr. coeff.', fontweight='bold')
+
+        # subplot 3
+        ax = self.ax_corr = fig.add_subplot(gs[2, 0:25])
+        self.max_coefs, = ax.plot([], [], 'ro-', label='Max. CC for est. BAz',
+                                                                linewidth=1)
+        self.corrcoefs, = ax.plot([], [], 'ko-', label='CC for theo. BAz',
+                                                                linewidth=1)
+        self.thres, = ax.plot([], [], '--r', lw=2)
+        ax.set_ylabel(r'X-corr. coeff.', fontsize=10, fontweight='bold')
+        self.text75 = ax.text(0, CORRELATION_THRESHOLD - 0.04, 
+                                    str(CORRELATION_THRESHOLD), color='red')
+        ax.legend(loc=4, shadow=True)
+        ax.grid(True)
+
+        # subplot 4
+        ax = self.ax_baz = fig.add_subplot(gs[3, 0:25])
+        self.corrbaz = ax.imshow(np.zeros((2, 2)), cmap=plt.cm.RdYlGn_r,
+                                vmin=-1, vmax=1, origin='lower', aspect='auto',
+                                interpolation='nearest')
+        self.teobaz, = ax.plot([], [], '--r', lw=2)
+        self.maxcorr, = ax.plot([], [], '.k')
+        self.text_baz = ax.text(1000, 0, '', color='r',
+                                bbox={'facecolor': 'black', 'alpha': 0.8})
+        self.obsbaz, = ax.plot([], [], '--y', lw=2)
+        self.text_ebaz = ax.text(400, 0, '', color='y',
+                                 bbox={'facecolor': 'black', 'alpha': 0.8})
+        ax.set_xlabel(r'Time [s]', fontweight='bold')
+        ax.set_ylabel(r'BAz [°]', fontsize=10, fontweight='bold')
+        ax.set_ylim([0, 360])
+        ax.set_yticks(np.linspace(0,360,7).tolist())
+        ax.grid(True)
+
+        cb1 = mpl.colorbar.ColorbarBase(fig.add_subplot(gs[3, 25]),
+                            cmap=plt.cm.RdYlGn_r,
+                            norm=mpl.colors.Normalize(vmin=-1, vmax=1),
+                            orientation='vertical')
+        cb1.set_label(r'X-corr. coeff.', fontweight='bold')
+        cb1.set_ticks(np.linspace(-1,1,9).tolist())
+
+    def update(self, P):
+        rt, trv_acc, time, sec, hop = P.rt, P.trv_acc, P.time, P.sec, P.hop
+        c1, fact1, corrcoefs, BAz, EBA = P.c1, P.fact1, P.corrcoefs, P.BAz, \
+                                                                        P.EBA
+        xlim = (0, P.delta * len(rt))
+
+        # window starts, the threshold line runs to the end of the last one
+        windows = hop * np.arange(len(corrcoefs))
+        windows_thres = np.append(windows, hop * (len(corrcoefs) - 1) + sec)
+
+        # subplot 1
+        self.ax_wave.set_xlim(*xlim)
+        self.set_trace(self.rt, time, rt)
+        self.set_trace(self.trv, time, (1. / (2. * c1)) * trv_acc + fact1)
+        self.ax_wave.set_ylim(min(rt),
+                                fact1 + max((1. / (2. * c1)) * trv_acc))
+        self.ax_wave.set_title(r'Cross-correlation for $\dot\Omega_z$ and '
+                'a$_T$ in %s seconds time windows (lowpass, cutoff: %s Hz). '
+                'Event: %s %sZ' % (sec, P.cutoff, P.startev.date,
+                                                            P.startev.time))
+
+        # subplot 2, windows below the threshold are not shown
+        phasv = np.where(np.asarray(corrcoefs) >= CORRELATION_THRESHOLD, 
+                                                            P.phasv, np.nan)
+        self.phasv.set_offsets(np.column_stack((
+                        hop * np.arange(len(phasv)), phasv)))
+        self.phasv.set_array(np.asarray(corrcoefs))
+        self.ax_phasv.set_xlim(*xlim)
+
+        # subplot 3
+        self.max_coefs.set_data(windows, P.max_coefs_10deg)
+        self.corrcoefs.set_data(windows, corrcoefs)
+        self.thres.set_data(windows_thres, CORRELATION_THRESHOLD * 
+                                                np.ones(len(windows_thres)))
+        self.text75.set_position((time[len(time) - 1] + self.shift75, 
+                                                CORRELATION_THRESHOLD - 0.04))
+        self.ax_corr.set_xlim(*xlim)
+        self.ax_corr.set_ylim(min(min(P.max_coefs_10deg), min(corrcoefs)), 1)
+
+        # subplot 4, heatmap cells start at their window and BAz bin
+        backas = P.backas
+        self.corrbaz.set_data(P.corrbaz)
+        self.corrbaz.set_extent((0, hop * len(corrcoefs),
+                        backas[0], backas[-1] + (backas[-1] - backas[-2])))
+        self.teobaz.set_data(windows_thres, BAz * np.ones(len(corrcoefs) + 1))
+        self.maxcorr.set_data(windows, P.maxcorr)
+        self.text_baz.set_position((1000, BAz))
+        self.text_baz.set_text(str(BAz)[0:5] + r'°')
+
+        # only plot estimated backazimuth if a value is given
+        show_ebaz = not np.isnan(EBA)
+        if show_ebaz:
+            self.obsbaz.set_data(windows_thres,
+                                            EBA * np.ones(len(corrcoefs) + 1))
+            self.text_ebaz.set_position((400, EBA))
+            self.text_ebaz.set_text(str(EBA)[0:5] + r'°')
+        self.obsbaz.set_visible(show_ebaz)
+        self.text_ebaz.set_visible(show_ebaz)
+        self.ax_baz.set_xlim(*xlim)
+        self.ax_baz.set_ylim([0, 360])
+
+
+class PCodaTemplate(PageTemplate):
 
-    # ======================================================================== 
-    #                                
-    #                                Page 4
-    #               Cross correlations for P-Coda time window
-    #
-    # ========================================================================= 
-    # P-coda limits
-    xlim1 = rt[0].stats.delta * len(rt[0].data) 
-    Xp, Yp = np.meshgrid(np.arange(0,sec_p * len(corrcoefs_p), sec_p), backas_p)
+    """
+    Page 4: cross correlations for the P-coda time window.
+    """
+    def __init__(self, category):
+        PageTemplate.__init__(self, (18, 9))
+        fig = self.fig
+        gs = GridSpec(5, 26, figure=fig)
+
+        # subplot 1
+        ax = self.ax_z = fig.add_subplot(gs[0, 0:25])
+        self.acZ, = ax.plot([], [], color='g')
+        ax.set_ylabel(r'a$_\mathbf{Z}$ [nm/s$^2$]', fontweight='bold',
+                                                                fontsize=11)
+        ax.ticklabel_format(axis='y', style='sci', scilimits=(-2,2))
+        self.vlines_z = [ax.axvline(x=0, linewidth=1),
+                         ax.axvline(x=0, linewidth=1)]
+        ax.grid(True)
+
+        # subplot 2
+        ax = self.ax_wave = fig.add_subplot(gs[1:3, 0:25])
+        self.rt, = ax.plot([], [], color='r', label=r'Rotation rate')
+        self.trv, = ax.plot([], [], color='k',
+                                        label=r'Transversal acceleration')
+        ax.set_ylabel(r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ [nrad/s] -'
+                   r'a$_\mathbf{T}$/2c [1/s]', fontweight='bold', fontsize=11)
+        bbox_props = dict(boxstyle="square, pad=0.3", fc='white')
+        self.vlines, self.boxes = [], []
+        for box in ['P-arrival', 'S-arrival']:
+            self.vlines.append(ax.axvline(x=0, linewidth=1))
+            self.boxes.append(ax.annotate(box, xy=(0, 0), fontsize=14,
+                                            fontweight='bold', bbox=bbox_props))
+        ax.grid(True)
+        ax.legend(loc=6, shadow=True)
+
+        # subplot 3
+        ax = self.ax_corr = fig.add_subplot(gs[3, 0:25])
+        self.corrcoefs, = ax.plot([], [], '.k')
+        ax.set_ylabel(r'X-corr. coeff.', fontweight='bold')
+        ax.set_ylim(0, 1)
+        ax.grid(True)
+
+        # subplot 4
+        ax = self.ax_baz = fig.add_subplot(gs[4, 0:25])
+        self.corrbaz = ax.imshow(np.zeros((2, 2)), cmap=plt.cm.RdYlGn_r,
+                                vmin=-1, vmax=1, origin='lower', aspect='auto',
+                                interpolation='nearest')
+        self.maxcorr, = ax.plot([], [], '.k')
+        ax.set_xlabel(r'Time [s]', fontweight='bold')
+        ax.set_ylabel(r'BAz [°]', fontweight='bold')
+        ax.set_yticks(np.linspace(0,360,7).tolist())
+        ax.grid(True)
+
+        cb1 = mpl.colorbar.ColorbarBase(fig.add_subplot(gs[4, 25]),
+                            cmap=plt.cm.RdYlGn_r,
+                            norm=mpl.colors.Normalize(vmin=-1, vmax=1),
+                            orientation='vertical')
+        cb1.set_label(r'X-corr. coeff.', fontweight='bold')
+        cb1.set_ticks(np.linspace(-1,1,9).tolist())
+
+    def update(self, P):
+        time_p, rt_pcoda, trv_pcoda = P.time_p, P.rt_pcoda, P.trv_pcoda
+        acZ_pcoda, corrcoefs_p, sec_p = P.acZ_pcoda, P.corrcoefs_p, P.sec_p
+        max_lwi_ac, fact1_p, c1_p = P.max_lwi_ac, P.fact1_p, P.c1_p
+
+        # P-coda limits
+        xlim1 = P.delta * len(P.rt)
+        xlim2 = (P.min_lwi + P.max_lwi) // 2
+
+        # subplot 1
+        self.ax_z.set_xlim(0, xlim2)
+        self.set_trace(self.acZ, time_p, acZ_pcoda)
+        self.ax_z.set_ylim(min(acZ_pcoda[0:max_lwi_ac]),
+                                            max(acZ_pcoda[0:max_lwi_ac]))
+        self.ax_z.set_title(r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ and '
+                r'a$_\mathbf{T}$correlation in the P-coda in a %d seconds '
+                'time window (highpass, cutoff: 1 Hz). Event: %s %sZ' %
+                                    (sec_p, P.startev.date, P.startev.time))
+        for vline, x in zip(self.vlines_z, [P.min_pw, P.min_sw]):
+            vline.set_xdata([x, x])
+
+        # subplot 2
+        self.ax_wave.set_xlim(0, xlim2)
+        self.set_trace(self.rt, time_p, rt_pcoda)
+        self.set_trace(self.trv, time_p, (0.5 / c1_p) * trv_pcoda + fact1_p)
+        self.ax_wave.set_ylim(min(rt_pcoda[0:max_lwi_ac]),
+            fact1_p + max((1. / (2. * c1_p)) * trv_pcoda[0:max_lwi_ac]))
+
+        box_yposition2 = (fact1_p + max((1. / (2. * c1_p)) *
+                            trv_pcoda[0:max_lwi_ac]) -
+                            np.abs(min(rt_pcoda[0: max_lwi_ac])))/2.
+        for vline, box, x in zip(self.vlines, self.boxes,
+                                                    [P.min_pw, P.min_sw]):
+            vline.set_xdata([x, x])
+            set_annotation(box, (x + P.xgap * float(xlim2/xlim1),
+                                                            box_yposition2))
+
+        # subplot 3
+        windows = P.hop_p * np.arange(len(corrcoefs_p))
+        self.corrcoefs.set_data(windows, corrcoefs_p)
+        self.ax_corr.set_xlim(0, xlim2)
+
+        # subplot 4, heatmap cells start at their window and BAz bin
+        backas_p = P.backas_p
+        self.corrbaz.set_data(P.corrbaz_p)
+        self.corrbaz.set_extent((0, P.hop_p * len(corrcoefs_p),
+                    backas_p[0], backas_p[-1] + (backas_p[-1] - backas_p[-2])))
+        self.maxcorr.set_data(windows, P.maxcorr_p_list)
+        self.ax_baz.set_xlim(0, xlim2)
+        self.ax_baz.set_ylim([0, 360])
+
+
+# page templates of this process by (page, view or distance category)
+PAGE_TEMPLATES = {}
+
+
+def get_page_template(page, P):
 
-    print("\nPage 4 > P-Coda Waveform Comparison...",end=" ")
+    """
+    Returns the template of a page for the products of one station, built on
+    first use. Page 1 templates are kept per map view, pages 2-4 per distance
+    category.
+
+    :type page: int
+    :param page: Page number (1-4).
+    :type P: :class: `~obspy.core.util.attribdict.AttribDict`
+    :param P: Analysis products of one station, see plot_waveform_comp().
+    :rtype: :class: `PageTemplate`
+    :return: Template of the page layout.
+    """
+    if page == 1:
+        key = MAP_BACKGROUNDS.view(P.ds_in_km, P.station_lat, P.station_lon,
+                                                P.event_lat, P.event_lon)[0]
+    else:
+        key = is_local(P.ds_in_km)
 
-    # subplot 1
-    plt.figure(figsize=(18, 9))
-    plt.subplot2grid((5, 26), (0, 0), colspan=25)
-    plt.plot(time_p, acZ_pcoda[0].data, color='g')
-    plt.ylabel(r'a$_\mathbf{Z}$ [nm/s$^2$]', fontweight='bold', fontsize=11)
-    plt.ticklabel_format(axis='y', style='sci', scilimits=(-2,2))
-    plt.xlim(0, (min_lwi + max_lwi) // 2)
-    plt.ylim(min(acZ_pcoda[0].data[0:max_lwi_ac]),
-             max(acZ_pcoda[0].data[0:max_lwi_ac]))
-    plt.title(r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ and a$_\mathbf{T}$'
-              'correlation in the P-coda in a %d seconds time window'
-              ' (highpass, cutoff: 1 Hz). Event: %s %sZ' % 
-                                            (sec_p, startev.date, startev.time))
-    plt.axvline(x=min_pw, linewidth=1)
-    plt.axvline(x=min_sw, linewidth=1)
-    plt.grid(True)
-
-    # subplot 2
-    xlim2 = (min_lwi + max_lwi) // 2
-    plt.subplot2grid((5, 26), (1, 0), colspan=25, rowspan=2)
-
-    plt.plot(time_p, rt_pcoda[0].data, color='r', label=r'Rotation rate')
-    plt.plot(time_p, (0.5 / c1_p) * trv_pcoda[0].data + fact1_p, color='k',
-                                             label=r'Transversal acceleration')
-    plt.ylabel(r'$\dot{\mathbf{\Omega}}_\mathbf{z}$ [nrad/s] -'
-                   'a$_\mathbf{T}$/2c [1/s]', fontweight='bold', fontsize=11)
-    plt.xlim(0, xlim2)
-    plt.ylim(min(rt_pcoda[0].data[0:max_lwi_ac]), 
-        fact1_p + max((1. / (2. * c1_p)) * trv_pcoda[0].data[0:max_lwi_ac]))
-    
-    box_yposition2 = (fact1_p + max((1. / (2. * c1_p)) * 
-                        trv_pcoda[0].data[0:max_lwi_ac]) -
-                        np.abs(min(rt_pcoda[0].data[0: max_lwi_ac])))/2.
-    plt.axvline(x=min_pw, linewidth=1)
-    plt.annotate('P-arrival', 
-                            xy=(min_pw+xgap*float(xlim2/xlim1),box_yposition2), 
-                            fontsize=14, fontweight='bold', bbox=bbox_props)
-    plt.axvline(x=min_sw, linewidth=1)
-    plt.annotate('S-arrival', 
-                            xy=(min_sw+xgap*float(xlim2/xlim1),box_yposition2), 
-                            fontsize=14,fontweight='bold', bbox=bbox_props)
-    plt.grid(True)
-    plt.legend(loc=6, shadow=True)
-
-    # subplot 3
-    plt.subplot2grid((5, 26), (3, 0), colspan=25)
-    plt.plot(np.arange(0, sec_p * len(corrcoefs_p), sec_p), corrcoefs_p, '.k')
-    plt.ylabel(r'X-corr. coeff.', fontweight='bold')
-    plt.xlim(0, xlim2)
-    plt.ylim(0, 1)
-    plt.grid(True)
-
-    # subplot 4
-    plt.subplot2grid((5, 26), (4, 0), colspan=25)
-    plt.pcolor(Xp, Yp, corrbaz_p, cmap=plt.cm.RdYlGn_r, vmin=-1, vmax=1)
-    plt.plot(np.arange(0, sec_p * len(corrcoefs_p), sec_p), 
-                                                        maxcorr_p_list, '.k')
-    plt.xlim(0, xlim2)
-    plt.xlabel(r'Time [s]', fontweight='bold')
-    plt.ylabel(r'BAz [°]', fontweight='bold')
-    plt.ylim([0, 360])
-    plt.yticks(np.linspace(0,360,7).tolist())
-    plt.grid(True)
-
-    fig = plt.subplot2grid((5, 26), (4, 25))
-    norm = mpl.colors.Normalize(vmin=-1, vmax=1)
-    cb1 = mpl.colorbar.ColorbarBase(fig, cmap=plt.cm.RdYlGn_r, norm=norm, 
-                                                        orientation='vertical')
-    cb1.set_label(r'X-corr. coeff.', fontweight='bold')
-    cb1.set_ticks(np.linspace(-1,1,9).tolist())
-   
-    # ============================= Save Figure ============================== 
-    plt.savefig(
-        os.path.join(folder_name,tag_name + '_{}_page_4.png'.format(station)))
-    plt.close()
-    print("Done")
+    if (page, key) not in PAGE_TEMPLATES:
+        template = {1: TitleCardTemplate, 2: WaveformTemplate,
+                    3: CorrelationTemplate, 4: PCodaTemplate}[page]
+        PAGE_TEMPLATES[(page, key)] = template(key)
 
-    # ======================================================================== 
-    #                                
-    #                        Store in Json and XML files
-    #
-    # ========================================================================= 
-    print("\n>> Storing event information in JSON and XML files...",end=" ")
-    
-    store_info_json(rt, ac, trv_acc, data_sources, station, event, dist_baz, 
-                    arriv_p, corrcoefs, EBA, max_ebaz_xcoef, phasv_means, 
-                    phasv_stds, folder_name, tag_name)
+    return PAGE_TEMPLATES[(page, key)]
 
-    store_info_xml(event,folder_name,tag_name,station)
 
-    print("Done\n")
+def plot_page_1(P, filename):
+
+    """
+    Page 1: map with event location and event information.
+
+    :type P: :class: `~obspy.core.util.attribdict.AttribDict`
+    :param P: Analysis products of one station, see plot_waveform_comp().
+    :type filename: str
+    :param filename: Path of the .png file.
+    """
+    print("\nPage 1 > Title Card...", end=" ")
+    get_page_template(1, P).render(P, filename)
+    print("Done")
+
+
+def plot_page_2(P, filename):
+
+    """
+    Page 2: waveform comparison plot with individual phase subplots.
+
+    :type P: :class: `~obspy.core.util.attribdict.AttribDict`
+    :param P: Analysis products of one station, see plot_waveform_comp().
+    :type filename: str
+    :param filename: Path of the .png file.
+    """
+    print("\nPage 2 >  Waveform Comparison...",end=" ")
+    get_page_template(2, P).render(P, filename)
+    print("Done")
+
+
+def plot_page_3(P, filename):
+
+    """
+    Page 3: cross correlation, phase velocity determination and estimation
+    of backazimuth.
+
+    :type P: :class: `~obspy.core.util.attribdict.AttribDict`
+    :param P: Analysis products of one station, see plot_waveform_comp().
+    :type filename: str
+    :param filename: Path of the .png file.
+    """
+    print("\nPage 3 > Cross-correlation, Phase velocity...",end=" ")
+    get_page_template(3, P).render(P, filename)
+    print("Done")
+
+
+def plot_page_4(P, filename):
+
+    """
+    Page 4: cross correlations for the P-coda time window.
+
+    :type P: :class: `~obspy.core.util.attribdict.AttribDict`
+    :param P: Analysis products of one station, see plot_waveform_comp().
+    :type filename: str
+    :param filename: Path of the .png file.
+    """
+    print("\nPage 4 > P-Coda Waveform Comparison...",end=" ")
+    get_page_template(4, P).render(P, filename)
+    print("Done")
+
+
+# page renderers by page number, see plot_waveform_comp()
+PAGE_RENDERERS = {1: plot_page_1, 2: plot_page_2, 3: plot_page_3,
+                                                                4: plot_page_4}
+
+
+def page_filename(folder_name, tag_name, station, page):
+    return os.path.join(folder_name,
+                        tag_name + '_{}_page_{}.png'.format(station, page))
+
+
+def product_filename(folder_name, tag_name, station):
+    return os.path.join(folder_name,
+                        tag_name + '_{}_products.npz'.format(station))
+
+
+def store_products(filename, products):
+
+    """
+    Writes the analysis products of one station to a compressed .npz file.
+    Arrays are stored as they are, lists of arrays (frequency bands) as one
+    array per band, all other values as JSON metadata. The file is written 
+    to a temporary name first, so a product file is always complete.
+
+    :type filename: str
+    :param filename: Path of the .npz file, see product_filename().
+    :type products: :class: `~obspy.core.util.attribdict.AttribDict`
+    :param products: Products of plot_waveform_comp(), the page products and
+        the frequency band and BAz estimation results.
+    """
+    arrays = OrderedDict()
+    metadata = OrderedDict([('version', PRODUCTS_VERSION), ('bands', {}), 
+                            ('times', []), ('values', OrderedDict())])
+    for key, value in products.items():
+        if isinstance(value, np.ndarray):
+            arrays[key] = value
+        elif isinstance(value, list):
+            metadata['bands'][key] = len(value)
+            for i, band in enumerate(value):
+                arrays['{}_{}'.format(key, i)] = np.asarray(band)
+        elif isinstance(value, UTCDateTime):
+            metadata['times'].append(key)
+            metadata['values'][key] = str(value)
+        elif isinstance(value, np.generic):
+            metadata['values'][key] = value.item()
+        else:
+            metadata['values'][key] = value
+
+    temp = filename + '.tmp'
+    with open(temp, 'wb') as f:
+        np.savez_compressed(f, metadata=json.dumps(metadata), **arrays)
+    os.replace(temp, filename)
+
+
+def load_products(filename):
+
+    """
+    Reads the products written by store_products(), no pickled objects are 
+    loaded.
+
+    :type filename: str
+    :param filename: Path of the .npz file.
+    :rtype: :class: `~obspy.core.util.attribdict.AttribDict`
+    :return: Products as handed to store_products().
+    """
+    with np.load(filename, allow_pickle=False) as npz:
+        metadata = json.loads(str(npz['metadata']))
+        if metadata['version'] != PRODUCTS_VERSION:
+            raise RotationalProcessingException('Product file version {}, '
+                'expected {}: {}'.format(metadata['version'], PRODUCTS_VERSION,
+                                                                    filename))
+        products = AttribDict(metadata['values'])
+        for key in metadata['times']:
+            products[key] = UTCDateTime(products[key])
+        for key, number in metadata['bands'].items():
+            products[key] = [npz['{}_{}'.format(key, i)] 
+                                                    for i in range(number)]
+        bands = set('{}_{}'.format(key, i) for key, number in 
+                            metadata['bands'].items() for i in range(number))
+        for key in npz.files:
+            if key != 'metadata' and key not in bands:
+                products[key] = npz[key]
+
+    return products
+
+
+def product_files(output_path):
+
+    """
+    Product files of all processed event folders.
+
+    :type output_path: str
+    :param output_path: Folder containing the event folders.
+    :rtype: list of str
+    :return: Paths of the .npz files, sorted by event folder.
+    """
+    return sorted(glob.glob(os.path.join(output_path, 'GCMT*', 
+                                                        '*_products.npz')) +
+                  glob.glob(os.path.join(output_path, 'ISC*', 
+                                                        '*_products.npz')))
+
+
+def replot_products(output_path, pages):
+
+    """
+    Renders the pages of all processed events from their product files and
+    overwrites existing pages, i.e. after a fix in the page layout. Nothing
+    is downloaded or processed.
+
+    :type output_path: str
+    :param output_path: Folder containing the event folders.
+    :type pages: list of int
+    :param pages: Pages to render (1-4).
+    :rtype: int
+    :return: Number of rendered pages.
+    """
+    rendered = 0
+    filenames = product_files(output_path)
+    for counter, filename in enumerate(filenames):
+        try:
+            products = load_products(filename)
+            folder_name = os.path.dirname(filename)
+            tag_name = os.path.basename(folder_name)
+            print("{} of {} product file(s): {} {}".format(counter + 1, 
+                                len(filenames), tag_name, products.station))
+            for N in pages:
+                PAGE_RENDERERS[N](products, page_filename(folder_name, 
+                                                tag_name, products.station, N))
+                rendered += 1
+        except Exception as e:
+            print(e)
+            plt.close('all')
+
+    return rendered
+
+
+def reanalyze_products(output_path):
+
+    """
+    Derives the backazimuth estimate, correlation and phase velocity values
+    of the .json and QuakeML files again from the product files of all 
+    processed events, i.e. after a fix in ebaz_from_correlations() or 
+    phasv_statistics() or a change of CORRELATION_THRESHOLD or 
+    EBAZ_THRESHOLD. The thresholds are recorded in the processing parameters
+    of the .json entries. Values that need the traces (peak values, SNR) are 
+    kept. The product files are updated as well, so pages re-plotted 
+    afterwards show the new estimated backazimuth.
+
+    :type output_path: str
+    :param output_path: Folder containing the event folders.
+    :rtype: int
+    :return: Number of re-analyzed stations.
+    """
+    # set the global 'round to decimal point' value, see station_information()
+    rnd = 6
+
+    reanalyzed = 0
+    filenames = product_files(output_path)
+    folders = OrderedDict()
+    for filename in filenames:
+        folders.setdefault(os.path.dirname(filename), []).append(filename)
+
+    for counter, (folder_name, filenames) in enumerate(folders.items()):
+        tag_name = os.path.basename(os.path.normpath(folder_name))
+        filename_xml = os.path.join(folder_name, tag_name + '.xml')
+        print("{} of {} folder(s): {}".format(counter + 1, len(folders), 
+                                                                    tag_name))
+        try:
+            event = read_events(filename_xml, format='QUAKEML')[0]
+            result = EventResult(event, folder_name, tag_name)
+            for filename in filenames:
+                products = load_products(filename)
+                corrsum, max_ebaz_xcoef, EBA = ebaz_from_correlations(
+                                        products.ebaz_corr, products.baz_list)
+                phasv_means, phasv_stds = [], []
+                for phasv_list, corrcoefs in zip(products.phasv_bands, 
+                                                    products.corrcoefs_bands):
+                    phasv_mean, phasv_std = phasv_statistics(phasv_list, 
+                                                corrcoefs, products.surf_start)
+                    phasv_means.append(phasv_mean)
+                    phasv_stds.append(phasv_std)
+
+                products.corrsum, products.EBA = corrsum, EBA
+                products.max_ebaz_xcoef = max_ebaz_xcoef
+                products.phasv_means = np.array(phasv_means)
+                products.phasv_stds = np.array(phasv_stds)
+                store_products(filename, products)
+
+                station_info = result.station(products.station)
+                params = station_info['rotational_parameters']
+                params['estimated_backazimuth'] = EBA
+                params['peak_correlation_coefficient'] = round(
+                                            max(products.corrcoefs), rnd)
+                params['minimum_correlation_coefficient'] = round(
+                                            min(products.corrcoefs), rnd)
+                params['max_xcoef_for_estimated_backazimuth'] = round(
+                                                        max_ebaz_xcoef, rnd)
+                for band, phasv_mean, phasv_std in zip(
+                                    station_info['phase_velocities'].values(),
+                                    phasv_means, phasv_stds):
+                    band['mean_phase_vel'] = round(phasv_mean, rnd)
+                    band['vel_std'] = round(phasv_std, rnd)
+
+                # the other parameters stay those of the processing
+                provenance = station_info.get('processing')
+                if provenance:
+                    parameters = provenance['parameters']
+                    parameters['correlation_threshold'] = CORRELATION_THRESHOLD
+                    parameters['ebaz_threshold'] = EBAZ_THRESHOLD
+                    provenance['parameter_hash'] = parameter_hash(parameters)
+
+            result.write()
+            reanalyzed += len(filenames)
+        except Exception as e:
+            print(e)
+
+    return reanalyzed
+
+
+def render_page(page, P, filename, marker=None):
+
+    """
+    Renders one page and marks it as rendered for the stage checkpoints.
+
+    :type marker: str
+    :param marker: Path of the marker file, see StageCheckpoints.
+    """
+    PAGE_RENDERERS[page](P, filename)
+    if marker is not None:
+        # checkpoints of a completed event are removed while its pages may 
+        # still be queued in the PageRenderer, the marker is not needed then
+        try:
+            open(marker, 'w').close()
+        except FileNotFoundError:
+            pass
+
+
+def _init_page_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _render_page_job(shm_name, layout, scalars, page, filename, marker):
+
+    """
+    Renders one page in a PageRenderer worker. The arrays of the products
+    are mapped from the shared memory block, not copied.
+
+    :rtype: tuple
+    :return: (shm_name, filename, error message or None)
+    """
+    shm = None
+    error = None
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        # the block belongs to the main process, which unlinks it
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        P = AttribDict(scalars)
+        for key, offset, shape, dtype in layout:
+            P[key] = np.ndarray(shape, dtype, buffer=shm.buf, offset=offset)
+        render_page(page, P, filename, marker)
+    except Exception as e:
+        print("Error rendering {}: {}".format(filename, e))
+        error = str(e)
+        plt.close('all')
+    finally:
+        # figures may still reference the arrays until collected
+        P = None
+        gc.collect()
+        if shm is not None:
+            shm.close()
+
+    return shm_name, filename, error
+
+
+class PageRenderer(object):
+
+    """
+    Renders pages in worker processes while the calling process continues 
+    with the next event. The arrays of the analysis products of a station
+    are copied once into a shared memory block that the workers map instead
+    of receiving pickled copies, each page is rendered as a separate task. 
+    The block is unlinked when all its pages are written.
+
+    :type workers: int
+    :param workers: Number of rendering processes.
+    :type max_pending: int
+    :param max_pending: Number of stations whose pages may be queued before
+        submit() blocks, default 2 * workers.
+    """
+    def __init__(self, workers, max_pending=None):
+        self.pid = os.getpid()
+        self.max_pending = max_pending or 2 * workers
+        self.pending = {}
+        self.errors = []
+        self.condition = threading.Condition()
+        self.pool = multiprocessing.get_context('fork').Pool(workers,
+                        initializer=_init_page_worker, maxtasksperchild=50)
+
+    def active(self):
+
+        """
+        True in the process that created the renderer, forked processes 
+        inherit the object but have to render their pages themselves.
+        """
+        return os.getpid() == self.pid
+
+    def submit(self, P, jobs):
+
+        """
+        Queues the pages of one station and returns immediately, unless 
+        max_pending stations are already queued.
+
+        :type P: :class: `~obspy.core.util.attribdict.AttribDict`
+        :param P: Analysis products of one station, see plot_waveform_comp().
+        :type jobs: list of tuples
+        :param jobs: (page, filename, marker) of each page to render, see 
+            render_page().
+        """
+        if not jobs:
+            return
+        with self.condition:
+            while len(self.pending) >= self.max_pending:
+                self.condition.wait()
+
+        # arrays go to shared memory, aligned to 64 bytes, the rest is pickled
+        arrays, scalars = [], {}
+        for key, value in P.items():
+            if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+                arrays.append((key, np.ascontiguousarray(value)))
+            else:
+                scalars[key] = value
+
+        layout, size = [], 0
+        for key, array in arrays:
+            layout.append((key, size, array.shape, array.dtype.str))
+            size += -(-array.nbytes // 64) * 64
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for (key, array), (_, offset, _, _) in zip(arrays, layout):
+            np.ndarray(array.shape, array.dtype, buffer=shm.buf, 
+                                                    offset=offset)[...] = array
+
+        with self.condition:
+            self.pending[shm.name] = [shm, len(jobs), 
+                                    os.path.abspath(os.path.dirname(jobs[0][1]))]
+        for page, filename, marker in jobs:
+            self.pool.apply_async(_render_page_job, 
+                            (shm.name, layout, scalars, page, filename, marker),
+                            callback=self._done,
+                            error_callback=lambda e, N=shm.name, F=filename: 
+                                                        self._failed(N, F, e))
+
+    def _failed(self, shm_name, filename, error):
+        # the job raised outside of its own error handling
+        print("Error rendering {}: {!r}".format(filename, error))
+        self._done((shm_name, filename, repr(error)))
+
+    def _done(self, result):
+        shm_name, filename, error = result
+        with self.condition:
+            if error:
+                self.errors.append((filename, error))
+            self.pending[shm_name][1] -= 1
+            if self.pending[shm_name][1] == 0:
+                shm = self.pending.pop(shm_name)[0]
+                shm.close()
+                shm.unlink()
+            self.condition.notify_all()
+
+    def wait(self):
+
+        """
+        Waits until all queued pages are written.
+
+        :rtype: list of tuples
+        :return: (filename, error) of pages that failed since the last call.
+        """
+        with self.condition:
+            while self.pending:
+                self.condition.wait()
+            errors, self.errors = self.errors, []
+
+        return errors
+
+    def wait_folder(self, folder_name):
+
+        """
+        Waits until the queued pages of one event folder are written.
+        """
+        folder_name = os.path.abspath(folder_name)
+        with self.condition:
+            while any(F == folder_name for _, _, F in self.pending.values()):
+                self.condition.wait()
+
+    def close(self):
+
+        """
+        Waits for all pages and stops the workers.
+
+        :rtype: list of tuples
+        :return: (filename, error) of pages that failed.
+        """
+        errors = self.wait()
+        self.pool.close()
+        self.pool.join()
+
+        return errors
+
+    def terminate(self):
+
+        """
+        Stops the workers immediately and frees the shared memory blocks.
+        """
+        self.pool.terminate()
+        with self.condition:
+            for shm, _, _ in self.pending.values():
+                shm.close()
+                shm.unlink()
+            self.pending = {}
+
+
+def parameter_hash(*parameters):
+
+    """
+    Short hash of JSON serializable parameters.
+    """
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True, 
+                                    default=str).encode()).hexdigest()[:16]
+
+
+def stage_parameters(event, station, pages):
+
+    """
+    Parameters that the results of each processing stage of a station depend
+    on, see StageCheckpoints.
+
+    :rtype: dict
+    :return: Parameters of the 'raw', 'preprocessed' and 'analysis' stages.
+    """
+    orig = event.preferred_origin() or event.origins[0]
+    return {'raw': [str(orig.time), orig.latitude, orig.longitude, orig.depth,
+                            station, polarity, instrument, PROCESSING_VERSION],
+            'preprocessed': [processing_provenance(polarity, instrument)],
+            'analysis': [3 in pages or PRODUCTS, 4 in pages or PRODUCTS, 
+                                                                    PRODUCTS]}
+
+
+class StageCheckpoints(object):
+
+    """
+    Checkpoints of the processing stages of one station of an event in the
+    scratch folder: downloaded data ('raw'), preprocessed streams 
+    ('preprocessed'), analysis products ('analysis') and rendered pages. 
+    Every stage is stored with a hash of its parameters and the parameters
+    of the stages before it, checkpoints written with other parameters are 
+    ignored. The checkpoints of an event are removed when it is complete,
+    see clear_checkpoints(). Without scratch folder nothing is stored.
+
+    :type scratch_dir: str
+    :param scratch_dir: Scratch folder, None disables the checkpoints.
+    :type tag_name: str
+    :param tag_name: Handle of the event.
+    :type station: str
+    :param station: Station of interest.
+    :type parameters: dict
+    :param parameters: Parameters of each stage, see stage_parameters().
+    """
+    stages = ['raw', 'preprocessed', 'analysis']
+
+    def __init__(self, scratch_dir, tag_name, station, parameters):
+        self.folder = None
+        if scratch_dir:
+            self.folder = os.path.join(scratch_dir, tag_name, station)
+        self.hashes = {}
+        previous = None
+        for stage in self.stages:
+            previous = parameter_hash(previous, parameters[stage])
+            self.hashes[stage] = previous
+
+    def path(self, stage):
+        return os.path.join(self.folder, stage + '.pickle')
+
+    def load(self, stage):
+
+        """
+        :rtype: object
+        :return: The checkpointed results of the stage, None if there are 
+            none for the current parameters.
+        """
+        if self.folder is None or not os.path.exists(self.path(stage)):
+            return None
+        try:
+            with open(self.path(stage), 'rb') as f:
+                stage_hash, results = pickle.load(f)
+        except Exception as e:
+            print("Ignoring {} checkpoint: {}".format(stage, e))
+            return None
+        if stage_hash != self.hashes[stage]:
+            return None
+
+        print("Resuming from {} checkpoint...".format(stage))
+        return results
+
+    def save(self, stage, results):
+        if self.folder is None:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        temp = self.path(stage) + '.tmp'
+        with open(temp, 'wb') as f:
+            pickle.dump((self.hashes[stage], results), f, 
+                                                    pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, self.path(stage))
+
+        # pages rendered from earlier analysis results are outdated
+        if stage == 'analysis':
+            for marker in glob.glob(os.path.join(self.folder, 'page_*')):
+                os.remove(marker)
+
+    def page_marker(self, page):
+
+        """
+        :rtype: str
+        :return: Path of the file marking the page as rendered, written by
+            render_page(), None without scratch folder.
+        """
+        if self.folder is None:
+            return None
+        return os.path.join(self.folder, 'page_{}.{}'.format(page, 
+                                                    self.hashes['analysis']))
+
+    def page_done(self, page, filename):
+        marker = self.page_marker(page)
+        return (marker is not None and os.path.exists(marker) and 
+                                                    os.path.exists(filename))
+
+
+def clear_checkpoints(tag_name):
+
+    """
+    Removes the checkpoints of all stations of an event.
+    """
+    if CHECKPOINT_PATH:
+        shutil.rmtree(os.path.join(CHECKPOINT_PATH, tag_name), 
+                                                        ignore_errors=True)
+
+
+def plot_waveform_comp(event, station, mode, folder_name, tag_name,
+                                                                pages=None):
+
+    """
+    Main processing script, calls all other functions defined above.
+    Compare vertical rotation rate and transverse acceleration for one
+    station. Creates and saves up to four figures and returns the processed
+    parameters, which process_stations() stores in the .json and QuakeML files.
+    Analysis needed only for a figure is skipped if the page is not rendered
+    and no product file is written, the returned parameters do not depend on 
+    the pages. With a PageRenderer the figures are rendered in its workers 
+    after the function returned. With CHECKPOINT_PATH set, every stage is
+    checkpointed and a rerun continues after the last completed stage, see
+    StageCheckpoints.
+
+    :type event: :class: `~obspy.core.event.event.Event`
+    :param event: Event information container
+    :type station: str
+    :param station: Station from which data are fetched (i.e. 'RLAS').
+    :type link: string
+    :param link: URL to the IRIS-XML file
+    :type mode: str
+    :param mode: Determines if moment tensor information is fetched
+    :type folder_name: string
+    :param folder_name: Name of the folder containing the event.
+    :type tag_name: string
+    :param tag_name: Handle of the event.
+    :type pages: list of int
+    :param pages: Pages to render (1-4), default PAGES set by --pages.
+    :rtype dic_station: :class: `~collections.OrderedDict`
+    :return dic_station: station information and rotational parameters
+    """
+    if pages is None:
+        pages = PAGES
+
+    checkpoints = StageCheckpoints(CHECKPOINT_PATH, tag_name, station, 
+                                    stage_parameters(event, station, pages))
+    analysis = checkpoints.load('analysis')
+    if analysis is None:
+        analysis = analyze_station(event, station, tag_name, pages, 
+                                                                checkpoints)
+        checkpoints.save('analysis', analysis)
+    P, products, dic_station = analysis
+
+    if products is not None:
+        store_products(product_filename(folder_name, tag_name, station), 
+                                                                    products)
+
+    # ========================================================================
+    #
+    #                               Render Pages
+    #      in rendering workers if the main process has a PageRenderer
+    #
+    # =========================================================================
+    jobs = []
+    for N in pages:
+        filename = page_filename(folder_name, tag_name, station, N)
+        if not checkpoints.page_done(N, filename):
+            jobs.append((N, filename, checkpoints.page_marker(N)))
+
+    if PAGE_RENDERER is not None and PAGE_RENDERER.active():
+        PAGE_RENDERER.submit(P, jobs)
+    else:
+        for page, filename, marker in jobs:
+            render_page(page, P, filename, marker)
+
+    return dic_station
+
+
+def analyze_station(event, station, tag_name, pages, checkpoints):
+
+    """
+    Downloads, preprocesses and analyzes the data of one station for 
+    plot_waveform_comp(). The downloaded and the preprocessed streams are 
+    taken from the checkpoints if available, else they are checkpointed.
+
+    :type event: :class: `~obspy.core.event.event.Event`
+    :param event: Event information container
+    :type station: str
+    :param station: Station from which data are fetched (i.e. 'RLAS').
+    :type tag_name: string
+    :param tag_name: Handle of the event.
+    :type pages: list of int
+    :param pages: Pages to render (1-4).
+    :type checkpoints: :class: `StageCheckpoints`
+    :param checkpoints: Checkpoints of the station.
+    :rtype: tuple
+    :return: Products for the page renderers, products for store_products()
+        or None and the station dictionary of station_information().
+    """
+    # =========================================================================
+    #
+    #              Gather event information, stream objects etc.
+    #
+    # =========================================================================
+    raw = checkpoints.load('raw')
+    if raw is None:
+        raw = event_info_data(event, station, polarity, instrument)
+        checkpoints.save('raw', raw)
+    event_lat, event_lon, depth, startev, rt, ac, dist_baz, data_sources = raw
+
+    # parse out event and station location information
+    ds_in_km = dist_baz[0] * 1E-3
+    BAz = dist_baz[2]
+    station_lat = rt[0].stats.coordinates.latitude
+    station_lon = rt[0].stats.coordinates.longitude
+
+    # parse out information for title
+    flinn_engdahl_title = event.event_descriptions[0]['text'].title()
+    mag = event.preferred_magnitude() or event.magnitudes[0]
+
+    # try to get moment tensor information
+    if event.preferred_focal_mechanism():
+        moment_tensor = get_moment_tensor(event)
+    else:
+        moment_tensor = None
+
+    # analysis products handed to the page renderers, arrays and scalars
+    P = AttribDict()
+    P.station = station
+    P.startev = startev
+    P.ds_in_km, P.BAz, P.depth = ds_in_km, BAz, depth
+    P.event_lat, P.event_lon = event_lat, event_lon
+    P.station_lat, P.station_lon = station_lat, station_lon
+    P.flinn_engdahl_title = flinn_engdahl_title
+    P.mag, P.magnitude_type = mag.mag, mag.magnitude_type
+
+    # ========================================================================
+    #
+    #               Preprocessing of rotations and translations
+    #
+    # =========================================================================
+    preprocessed = checkpoints.load('preprocessed')
+    if preprocessed is None:
+        rt, ac, rt_pcoda, ac_pcoda, sec, sec_p, cutoff, cutoff_pc = resample(
+                                                    is_local(ds_in_km), rt, ac)
+
+        print("Removing instrument response...")
+        # remove instrument response based on station
+        rt, ac, rt_pcoda, ac_pcoda = remove_instr_resp(
+                                    rt, ac, rt_pcoda, ac_pcoda,station, startev)
+
+        print("Filtering and rotating traces...")
+        # filter raw data, rotate some to theoretical backazimuth, sep. Pcoda
+        preprocessed = (rt, ac, rt_pcoda, ac_pcoda, sec, sec_p, cutoff, 
+                        cutoff_pc) + filter_and_rotate(rt, ac, rt_pcoda, 
+                            ac_pcoda, cutoff, cutoff_pc, is_local(ds_in_km))
+        checkpoints.save('preprocessed', preprocessed)
+
+    rt, ac, rt_pcoda, ac_pcoda, sec, sec_p, cutoff, cutoff_pc, \
+    trv_acc, trv_pcoda, rt_bands, trv_bands, rt_pcoda_coarse, trv_pcoda_coarse,\
+    filt_rt_pcoda, filt_ac_pcoda, filt_trv_pcoda = preprocessed
+
+    print("Getting theoretical arrival times...")
+    # find trace start
+    init_sec = startev - ac[0].stats.starttime
+
+    # theoretical arrival times for P and S waves
+    arriv_p, arriv_s = ps_arrival_times(ds_in_km, depth, init_sec)
+
+    # determine time windows for seismic phases (P,S,surface)
+    min_pw, max_pw, min_sw, max_sw, min_lwi, max_lwi, min_lwf, max_lwf = \
+        time_windows(ds_in_km, arriv_p, arriv_s, init_sec, is_local(ds_in_km))
+
+    # rt.taper(max_percentage=0.05) # this was here but we already taper?
+
+    # phase velocity, factor for displacing rotation rate, and time array
+    c1 = .5 * max(abs(trv_acc[0].data)) / max(abs(rt[0].data))
+    fact1 = 2 * max(rt[0].data)
+    time = rt[0].stats.delta * np.arange(0, len(rt[0].data))
+
+    # gap between annotation and vertical
+    if is_local(ds_in_km) == 'FAR':
+        xgap = 50
+    else:
+        xgap = 15
+
+    P.rt, P.trv_acc, P.time, P.delta = rt[0].data, trv_acc[0].data, time, \
+                                                            rt[0].stats.delta
+    P.rt_pcoda_coarse = rt_pcoda_coarse[0].data
+    P.trv_pcoda_coarse = trv_pcoda_coarse[0].data
+    P.rt_SR = int(rt[0].stats.sampling_rate)
+    P.rt_pcoda_SR = int(rt_pcoda_coarse[0].stats.sampling_rate)
+    P.min_pw, P.max_pw, P.min_sw, P.max_sw = min_pw, max_pw, min_sw, max_sw
+    P.min_lwi, P.max_lwi, P.min_lwf, P.max_lwf = \
+                                            min_lwi, max_lwi, min_lwf, max_lwf
+    P.sec, P.sec_p, P.cutoff, P.cutoff_pc = sec, sec_p, cutoff, cutoff_pc
+
+    # time between window starts, see CORRELATION_HOP
+    hop, hop_p = sec * CORRELATION_HOP, sec_p * CORRELATION_HOP
+    P.hop, P.hop_p = hop, hop_p
+    P.c1, P.fact1, P.xgap = c1, fact1, xgap
+
+    # ========================================================================
+    #
+    #                Cross Correlations and Phase Velocities
+    #
+    # =========================================================================
+    print("Finding zero-lag correlation coefficients...")
+
+    # correlate vertical rotation rate and transverse acceleration
+    corrcoefs, thres = get_corrcoefs(rt, trv_acc, sec, hop=hop)
+
+    # calculate correlations for different frequency bands,
+    # length of time windows given by seconds_list
+    corrcoefs_bands, thresholds = [], []
+    seconds_list = BAND_WINDOWS
+
+    for i in range(len(rt_bands)):
+        corrcoefs_tmp, thresh_tmp = get_corrcoefs(streamA = rt_bands[i],
+                                                  streamB = trv_bands[i],
+                                                  sec = seconds_list[i],
+                                hop = seconds_list[i] * CORRELATION_HOP)
+        corrcoefs_bands.append(corrcoefs_tmp)
+        thresholds.append(thresh_tmp)
+
+    # estimate backazimuth and correlations for given BAz
+    print("Estimating best backazimuth values...")
+    corrsum, baz_list, max_ebaz_xcoef, EBA, ebaz_corr = estimate_baz(
+                                                        rt, ac, min_sw, max_lwf)
+
+    # phase velocities, mean values and std. for different frequency bands
+    print("Calculating phase velocities...")
+    surf_start = int(min_lwi // hop)
+    phasv_bands,phasv_means,phasv_stds = [],[],[]
+    for i in range(len(rt_bands)):
+        phasv_tmp, phasv_mean, phasv_std = get_phase_vel(
+                                rt_bands[i], trv_bands[i], seconds_list[i],
+                                corrcoefs_bands[i], start=surf_start,
+                                hop=seconds_list[i] * CORRELATION_HOP)
+        phasv_bands.append(phasv_tmp)
+        phasv_means.append(phasv_mean)
+        phasv_stds.append(phasv_std)
+
+    # ========================================================================
+    #
+    #              Cross Correlation, phase velocity determination,
+    #                 Estimation of backazimuth figures (Page 3)
+    #
+    # =========================================================================
+    P.corrcoefs, P.thres, P.EBA = corrcoefs, thres, EBA
+
+    if 3 in pages or PRODUCTS:
+        # zero-lag correlation coefficients for range of backazimuths
+        print("Analyzing correlation by BAz bins...")
+        corrbaz, maxcorr, backas, max_coefs_10deg = baz_analysis(rt, ac, sec,
+                                                                    hop=hop)
+        phasv, _, _ = get_phase_vel(rt, trv_acc, sec, corrcoefs, start=0, 
+                                                                    hop=hop)
+
+        P.phasv = phasv
+        P.corrbaz, P.maxcorr, P.backas = corrbaz, maxcorr, backas
+        P.max_coefs_10deg = max_coefs_10deg
+
+    # ========================================================================
+    #
+    #                           P-Coda analysis (Page 4)
+    #
+    # =========================================================================
+    if 4 in pages or PRODUCTS:
+        print("Analyzing rotations in the P-coda...")
+
+        # Zero-lag correlation coefficients
+        print("Zero-lag cross correlations...",end=" ")
+
+        # integer sampling rates
+        rt_pc_SR = int(filt_rt_pcoda[0].stats.sampling_rate)
+        ac_pc_SR = int(filt_trv_pcoda[0].stats.sampling_rate)
+
+        corrcoefs_p = []
+        lwi_average = int(round((min_lwi+max_lwi)/2))
+
+        # separate vertical components
+        acZ_pcoda = ac_pcoda.select(component='Z')
+
+        # cut pcoda at correct time window and taper cuts
+        rt_pcoda_cut = filt_rt_pcoda.copy()
+        ac_pcoda_cut = filt_ac_pcoda.copy()
+        trv_pcoda_cut = filt_trv_pcoda.copy()
+
+        rt_pcoda_cut[0].data = filt_rt_pcoda[0].data[0:lwi_average * rt_pc_SR]
+        trv_pcoda_cut[0].data = trv_pcoda_cut[0].data[0:lwi_average * ac_pc_SR]
+        for i in range(3):
+            ac_pcoda_cut[i].data = \
+                            filt_ac_pcoda[i].data[0:lwi_average * ac_pc_SR]
+
+        for traces in [rt_pcoda,rt_pcoda_cut,ac_pcoda_cut,trv_pcoda_cut]:
+            traces.taper(max_percentage=0.05)
+
+        # find correlations
+        corrcoefs_p, thres_p = get_corrcoefs(rt_pcoda_cut, trv_pcoda_cut, 
+                                                            sec_p, hop=hop_p)
+
+        print("Backzimuths...")
+        # surface wave start sample
+        max_lwi_ac = ac_pc_SR * max_lwi
+
+        # analyze backazimuth
+        corrbaz_p, maxcorr_p, backas_p, max_coefs_10deg_p = baz_analysis(
+                                rt_pcoda_cut, ac_pcoda_cut, sec_p, hop=hop_p)
+
+        # set up arrays for plotting
+        time_p = rt_pcoda_cut[0].stats.delta * \
+                                            np.arange(0, len(rt_pcoda[0].data))
+        fact1_p = 2 * max(rt_pcoda[0].data[0:max_lwi_ac])
+
+        c1_p = .5 * (max(abs(trv_pcoda[0].data[0:max_lwi_ac])) /
+                     max(abs(rt_pcoda[0].data[0:max_lwi_ac])))
+
+        # check for correlations >= 0.5
+        maxcorr_p_list = []
+        for m in range(0, len(maxcorr_p)):
+            if np.max(corrbaz_p[:,m]) >= 0.5:
+                maxcorr_p_list.append(maxcorr_p[m])
+            else:
+                maxcorr_p_list.append(0)
+
+        P.time_p, P.acZ_pcoda = time_p, acZ_pcoda[0].data
+        P.rt_pcoda, P.trv_pcoda = rt_pcoda[0].data, trv_pcoda[0].data
+        P.corrcoefs_p, P.corrbaz_p, P.backas_p = corrcoefs_p, corrbaz_p, \
+                                                                    backas_p
+        P.maxcorr_p_list = np.array(maxcorr_p_list)
+        P.max_lwi_ac, P.fact1_p, P.c1_p = max_lwi_ac, fact1_p, c1_p
+
+    # ========================================================================
+    #
+    #               Collect products for re-plotting and re-analysis
+    #
+    # =========================================================================
+    products = None
+    if PRODUCTS:
+        products = AttribDict(P)
+        products.tag_name = tag_name
+        products.event_id = event.resource_id.id
+        products.seconds_list, products.surf_start = seconds_list, surf_start
+        products.corrcoefs_bands = corrcoefs_bands
+        products.phasv_bands = phasv_bands
+        products.phasv_means = np.array(phasv_means)
+        products.phasv_stds = np.array(phasv_stds)
+        products.corrsum, products.baz_list = corrsum, baz_list
+        products.ebaz_corr, products.max_ebaz_xcoef = ebaz_corr, max_ebaz_xcoef
+
+    dic_station = station_information(rt, ac, trv_acc, data_sources, station,
+                                      dist_baz, arriv_p, corrcoefs, EBA,
+                                      max_ebaz_xcoef, phasv_means, phasv_stds)
+
+    return P, products, dic_station
+
+
+def render_missing_pages(output_path, pages):
+
+    """
+    Renders pages that are missing in already processed event folders, i.e.
+    of events processed with --pages none. Pages are rendered from the 
+    product file of the station if there is one, else data are fetched and 
+    analyzed again. The .json and QuakeML files are left untouched.
+
+    :type output_path: str
+    :param output_path: Folder containing the event folders.
+    :type pages: list of int
+    :param pages: Pages to check for (1-4).
+    :rtype: int
+    :return: Number of rendered pages.
+    """
+    rendered = 0
+    folders = sorted(glob.glob(os.path.join(output_path, 'GCMT*')) +
+                        glob.glob(os.path.join(output_path, 'ISC*')))
+    for folder_counter, folder_name in enumerate(folders):
+        tag_name = os.path.basename(os.path.normpath(folder_name))
+        filename_json = os.path.join(folder_name, tag_name + '.json')
+        filename_xml = os.path.join(folder_name, tag_name + '.xml')
+        if not (os.path.exists(filename_json) and
+                                            os.path.exists(filename_xml)):
+            continue
+
+        # stations stored for the event
+        dic_event = json.load(open(filename_json))
+        stations = [K.split('station_information_')[1] for K in dic_event
+                                        if K.startswith('station_information_')]
+        for station in stations:
+            missing = [N for N in pages if not os.path.exists(
+                        page_filename(folder_name, tag_name, station, N))]
+            if not missing:
+                continue
+
+            print("{} of {} folder(s): {} {}, page(s) {}".format(
+                                folder_counter + 1, len(folders), tag_name,
+                                station, ','.join(str(N) for N in missing)))
+            try:
+                filename = product_filename(folder_name, tag_name, station)
+                if os.path.exists(filename):
+                    products = load_products(filename)
+                    for N in missing:
+                        PAGE_RENDERERS[N](products, page_filename(
+                                            folder_name, tag_name, station, N))
+                else:
+                    event = read_events(filename_xml, format='QUAKEML')[0]
+                    plot_waveform_comp(event, station, None, folder_name,
+                                                        tag_name, pages=missing)
+                rendered += len(missing)
+            except Exception as e:
+                print(e)
+                plt.close('all')
+
+    return rendered
+
+
+def reprocess_stale(output_path):
+
+    """
+    Reprocesses the stations of already processed events whose results are
+    stale, see is_stale(). Each station is reprocessed with the polarity and
+    instrument it was processed with. Folders without stale stations are not
+    touched. The stations of an event are reprocessed into a staging folder,
+    see commit_staged(), so if reprocessing fails the previous results are 
+    kept.
+
+    :type output_path: str
+    :param output_path: Folder containing the event folders.
+    :rtype: tuple
+    :return: Numbers of reprocessed and failed events.
+    """
+    global polarity, instrument
+
+    # settings of the command line for entries without provenance
+    default_settings = (polarity, instrument)
+
+    reprocessed = failed = 0
+    folders = sorted(glob.glob(os.path.join(output_path, 'GCMT*')) +
+                        glob.glob(os.path.join(output_path, 'ISC*')))
+    for folder_counter, folder_name in enumerate(folders):
+        tag_name = os.path.basename(os.path.normpath(folder_name))
+        filename_json = os.path.join(folder_name, tag_name + '.json')
+        filename_xml = os.path.join(folder_name, tag_name + '.xml')
+        try:
+            dic_event = json.load(open(filename_json))
+        except (OSError, ValueError):
+            continue
+
+        # stale stations grouped by the settings they were processed with
+        stale = OrderedDict()
+        for key, dic_station in dic_event.items():
+            if not (key.startswith('station_information_') and 
+                                                        is_stale(dic_station)):
+                continue
+            settings = default_settings
+            if dic_station.get('processing'):
+                parameters = dic_station['processing']['parameters']
+                settings = (parameters['polarity'], parameters['instrument'])
+            stale.setdefault(settings, []).append(
+                                        key.split('station_information_')[1])
+        if not stale:
+            continue
+
+        print("{} of {} folder(s): {}, stale station(s) {}".format(
+                    folder_counter + 1, len(folders), tag_name, 
+                    ','.join(S for stations in stale.values() for S in stations)))
+        staging = os.path.join(output_path, '.reprocess_' + tag_name)
+        try:
+            event = read_events(filename_xml, format='QUAKEML')[0]
+            shutil.rmtree(staging, ignore_errors=True)
+            os.makedirs(staging)
+            shutil.copy2(filename_json, staging)
+            try:
+                for settings, stations in stale.items():
+                    # the station processes read the settings from the globals
+                    polarity, instrument = settings
+                    process_stations(event, stations, None, staging, tag_name)
+            finally:
+                polarity, instrument = default_settings
+            commit_staged(staging, folder_name)
+            clear_checkpoints(tag_name)
+            reprocessed += 1
+        except Exception as e:
+            print(e)
+            plt.close('all')
+            failed += 1
+            # process_stations() entered the staged results
+            if MANIFEST is not None:
+                MANIFEST.update(tag_name, 'complete', dic_event)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    return reprocessed, failed
+
+
+def commit_staged(staging, folder_name):
+
+    """
+    Moves the results reprocessed into a staging folder into the event 
+    folder, replacing the previous ones. Pages and product files are moved
+    first, the .json and QuakeML files last, so the results are switched
+    when the .json file is. The staging folder has to be on the same file 
+    system, i.e. in the output folder.
+
+    :type staging: str
+    :param staging: Folder the stations were reprocessed into.
+    :type folder_name: str
+    :param folder_name: Folder of the event.
+    """
+    names = sorted(os.listdir(staging), 
+                            key=lambda N: N.endswith(('.json', '.xml')))
+    for name in names:
+        os.replace(os.path.join(staging, name), 
+                                            os.path.join(folder_name, name))
+
+
+def process_stations(event, stations, mode, folder_name, tag_name, 
+                                                                parallel=True):
+
+    """
+    Processes all requested stations for one event. Event level work is done
+    once, stations run in parallel processes (forked, so they share the 
+    loaded travel time model and command line settings) and the merged .json
+    and QuakeML files are written once when all stations are finished.
+    An exception in any station is raised after all stations returned.
+
+    :type event: :class: `~obspy.core.event.event.Event`
+    :param event: Event information container
+    :type stations: list of str
+    :param stations: Stations from which data are fetched (i.e. ['RLAS']).
+    :type mode: str
+    :param mode: Determines if moment tensor information is fetched
+    :type folder_name: string
+    :param folder_name: Name of the folder containing the event.
+    :type tag_name: string
+    :param tag_name: Handle of the event.
+    :type parallel: bool
+    :param parallel: Process stations in parallel, False inside of processes 
+        that are not allowed to spawn children (i.e. pool workers).
+    """
+    # event level setup shared by all stations
+    get_taup_model()
+
+    if parallel and len(stations) > 1:
+        with ProcessPoolExecutor(max_workers=len(stations), 
+                        mp_context=multiprocessing.get_context('fork')) as ex:
+            futures = [ex.submit(plot_waveform_comp, event, S, mode, 
+                                        folder_name, tag_name) for S in stations]
+            dic_stations = [F.result() for F in futures]
+    else:
+        dic_stations = [plot_waveform_comp(event, S, mode, folder_name, 
+                                                tag_name) for S in stations]
+
+    print("\n>> Storing event information in JSON and XML files...",end=" ")
+    
+    result = EventResult(event, folder_name, tag_name)
+    for dic_station in dic_stations:
+        result.add_station(dic_station)
+    result.write()
+    if MANIFEST is not None:
+        MANIFEST.update(tag_name, 'complete', result.dic_event)
+
+    print("Done\n")
+
+
+class EventManifest(object):
+
+    """
+    SQLite index of the event folders in the output folder, one row per 
+    folder with its catalog, origin time, processed stations, status 
+    ('incomplete' while the folder is processed, 'complete' once the .json 
+    and QuakeML files are written) and the parameter hashes of its stations,
+    see processing_provenance(). generate_tags() looks up events with the 
+    same time tag here instead of scanning the output folder. Folders the 
+    manifest does not know (written with --no_manifest or by shard workers)
+    are added when it is opened, see add_missing(). Every change is one 
+    transaction, a connection is opened per call so forked workers don't 
+    share one.
+
+    :type output_path: str
+    :param output_path: Folder containing the event folders.
+    """
+    filename = '.manifest.sqlite'
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.path = os.path.join(output_path, self.filename)
+        exists = os.path.exists(self.path)
+        with self.connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS events ('
+                               'tag TEXT PRIMARY KEY, short_tag TEXT, '
+                               'catalog TEXT, origin_time TEXT, '
+                               'stations TEXT, status TEXT, '
+                               'parameter_hash TEXT, updated TEXT)')
+            connection.execute('CREATE INDEX IF NOT EXISTS short_tags '
+                               'ON events (short_tag)')
+
+        # first use on an existing output folder
+        if not exists:
+            self.rebuild()
+        else:
+            self.add_missing()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=60.)
+
+    @staticmethod
+    def short_tag(tag_name):
+        # i.e. 'GCMT_2017-09-23T125302Z', see generate_tags()
+        return '_'.join(tag_name.split('_')[:2])
+
+    @staticmethod
+    def row(tag_name, status, dic_event=None):
+        catalog, origin_time = (tag_name.split('_') + [''])[:2]
+        stations, hashes = [], set()
+        try:
+            origin_time = str(UTCDateTime(origin_time))
+        except Exception:
+            pass
+        if dic_event:
+            origin_time = dic_event.get('origin_time', origin_time)
+            for key, dic_station in dic_event.items():
+                if not key.startswith('station_information_'):
+                    continue
+                stations.append(key.split('station_information_')[1])
+                if dic_station.get('processing'):
+                    hashes.add(dic_station['processing']['parameter_hash'])
+
+        return (tag_name, EventManifest.short_tag(tag_name), catalog, 
+                origin_time, ','.join(stations), status, 
+                ','.join(sorted(hashes)), str(UTCDateTime()))
+
+    def update(self, tag_name, status, dic_event=None):
+
+        """
+        Adds or replaces the row of one event folder.
+
+        :type tag_name: str
+        :param tag_name: Handle of the event.
+        :type status: str
+        :param status: 'incomplete' or 'complete'
+        :type dic_event: dict
+        :param dic_event: Contents of the .json file of the event, 
+            see EventResult.
+        """
+        with self.connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO events VALUES '
+                        '(?, ?, ?, ?, ?, ?, ?, ?)', 
+                        self.row(tag_name, status, dic_event))
+
+    def remove(self, tag_name):
+        with self.connect() as connection:
+            connection.execute('DELETE FROM events WHERE tag = ?', 
+                                                                (tag_name,))
+
+    def folder_row(self, tag_name):
+
+        """
+        Row of an event folder found on disk, folders without .json file are
+        taken as incomplete.
+        """
+        filename_json = os.path.join(self.output_path, tag_name, 
+                                                        tag_name + '.json')
+        try:
+            dic_event = json.load(open(filename_json), 
+                                                object_pairs_hook=OrderedDict)
+            return self.row(tag_name, 'complete', dic_event)
+        except (OSError, ValueError):
+            return self.row(tag_name, 'incomplete')
+
+    def lookup(self, tag_name_short):
+
+        """
+        Folders of the events with the given time tag. Rows of folders that
+        were removed by hand are dropped. Tags the manifest does not know 
+        have no folder, the output folder is not searched.
+
+        :type tag_name_short: str
+        :param tag_name_short: Catalog and time tag of the event.
+        :rtype: list of str
+        :return: Paths of the event folders, like glob() in the output folder.
+        """
+        with self.connect() as connection:
+            tags = [T for T, in connection.execute('SELECT tag FROM events '
+                    'WHERE short_tag = ? ORDER BY tag', (tag_name_short,))]
+            folders = []
+            for tag_name in tags:
+                folder_name = os.path.join(self.output_path, tag_name)
+                if os.path.isdir(folder_name):
+                    folders.append(folder_name)
+                else:
+                    connection.execute('DELETE FROM events WHERE tag = ?', 
+                                                                (tag_name,))
+        return folders
+
+    def add_missing(self):
+
+        """
+        Adds the event folders in the output folder that have no row yet, 
+        with one scan of the output folder.
+
+        :rtype: int
+        :return: Number of added event folders.
+        """
+        with self.connect() as connection:
+            known = set(T for T, in 
+                                connection.execute('SELECT tag FROM events'))
+        rows = [self.folder_row(entry.name) for entry in 
+                    os.scandir(self.output_path) if entry.is_dir() and 
+                    not entry.name.startswith('.') and entry.name not in known]
+
+        with self.connect() as connection:
+            connection.executemany('INSERT OR IGNORE INTO events VALUES '
+                                   '(?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def rebuild(self):
+
+        """
+        Replaces all rows by the event folders found in the output folder, 
+        folders without .json file are taken as incomplete.
+
+        :rtype: int
+        :return: Number of event folders.
+        """
+        rows = []
+        for entry in os.scandir(self.output_path):
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+            rows.append(self.folder_row(entry.name))
+
+        with self.connect() as connection:
+            connection.execute('DELETE FROM events')
+            connection.executemany('INSERT OR REPLACE INTO events VALUES '
+                                   '(?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
 
 
 def generate_tags(event):
@@ -2103,7 +3939,8 @@ def generate_tags(event):
     :return folder_name: folder name tag
     :rtype check_folder_exists: list of str
     :return check_folder_exists: glob list with identical file names if event 
-                                was already processed
+                                was already processed, looked up in the 
+                                manifest if there is one
     """
 
     event_information = str(event).split('\n')[0][7:]
@@ -2137,12 +3974,673 @@ def generate_tags(event):
     # short tags used to check if an event with the same time tag has 
     # been processed because different catalogs publish diff. magnitudes
     tag_name_short = '_'.join((catalog,time_tag))
-    folder_name_short = os.path.join(output_path,tag_name_short)
-    check_folder_exists = glob.glob(folder_name_short + '*')
+    if MANIFEST is not None:
+        check_folder_exists = MANIFEST.lookup(tag_name_short)
+    else:
+        folder_name_short = os.path.join(output_path,tag_name_short)
+        check_folder_exists = glob.glob(folder_name_short + '*')
 
     return tag_name, folder_name, check_folder_exists
 
 
+def process_event(event, stations, mode, tag_name, folder_name, 
+                  check_folder_exists, parallel=True):
+
+    """
+    Runs the processing of one event, with the checks for already processed
+    events and incomplete folders. Failed events have their folder removed. 
+    On KeyboardInterrupt the folder is removed and the interrupt re-raised.
+    With stage checkpoints the folder is kept on KeyboardInterrupt and an 
+    incomplete folder is resumed, the checkpoints are removed once the event
+    is complete.
+
+    :type event: :class: `~obspy.core.event.Event`
+    :param event: Contains the event information.
+    :type stations: list of str
+    :param stations: Stations from which data are fetched (i.e. ['RLAS']).
+    :type mode: str
+    :param mode: Determines if moment tensor information is fetched
+    :type tag_name: str
+    :param tag_name: Handle of the event.
+    :type folder_name: str
+    :param folder_name: Name of the folder containing the event.
+    :type check_folder_exists: list of str
+    :param check_folder_exists: glob list with identical file names if event 
+                                was already processed
+    :type parallel: bool
+    :param parallel: Process stations in parallel, see process_stations()
+    :rtype status: str
+    :return status: 'success', 'fail' or 'already_processed'
+    :rtype errors: list of tuples
+    :return errors: (tag, error message) entries for the error log
+    """
+    # check if current event folder exists
+    if check_folder_exists:
+        # check if event source is the same, assumes 0 or 1 files found
+        if (os.path.basename(check_folder_exists[0]) != 
+                                        os.path.basename(folder_name)):
+            print("This event was processed with another mode\n")
+            return 'already_processed', [(tag_name, 
+                                                "Processed w/ Another Mode")]
+
+        # if new station, run waveform compare again
+        try:
+            filename_json = os.path.join(folder_name,tag_name + '.json')
+            data = json.load(open(filename_json))
+        # if json not found, folder is incomplete, resume from checkpoints
+        # of an interrupted run or continue
+        except FileNotFoundError:
+            if not (CHECKPOINT_PATH and os.path.exists(
+                                os.path.join(CHECKPOINT_PATH, tag_name))):
+                print("Incomplete folder found\n")
+                return 'fail', [(tag_name, "Incomplete Folder")]
+            print("Resuming incomplete folder\n")
+            data = {}
+
+        stations = [S for S in stations if 
+                            'station_information_{}'.format(S) not in data]
+        if not stations:
+            print("This event was already processed\n")
+            return 'already_processed', []
+
+    # event encountered for the first time, create folder, xml, process.
+    # A folder created in the meantime, i.e. by another node, is not removed
+    else:
+        try:
+            os.makedirs(str(folder_name))
+        except OSError as e:
+            print(e)
+            return 'fail', [(tag_name, str(e))]
+        if MANIFEST is not None:
+            MANIFEST.update(tag_name, 'incomplete')
+
+    # run processing function
+    try:
+        process_stations(event, stations, mode, folder_name, tag_name, 
+                                                            parallel=parallel)
+        clear_checkpoints(tag_name)
+        return 'success', []
+
+    # if any error, remove folder, continue
+    except Exception as e:
+        print(e)
+        print("Removing incomplete folder...\n")
+        shutil.rmtree(folder_name)
+        if MANIFEST is not None:
+            MANIFEST.remove(tag_name)
+        return 'fail', [(tag_name, str(e))]
+
+    # if keyboard interrupt, remove folder unless it can be resumed, quit
+    except KeyboardInterrupt:
+        if CHECKPOINT_PATH:
+            print("Keeping completed stages for the next run...\n")
+        else:
+            print("Removing incomplete folder...\n")
+            shutil.rmtree(folder_name)
+            if MANIFEST is not None:
+                MANIFEST.remove(tag_name)
+        raise
+
+
+def event_jobs(cat, stations, mode):
+
+    """
+    Generates tags for all events of a catalog up front and turns them into
+    jobs for process_event_pool(). Every time tag is handed to one job only,
+    later events with the same time tag are skipped the same way the 
+    sequential loop skips them once the first one is processed.
+
+    :type cat: :class: `~obspy.core.event.Catalog`
+    :param cat: Catalog of events to process.
+    :type stations: list of str
+    :param stations: Stations from which data are fetched (i.e. ['RLAS']).
+    :type mode: str
+    :param mode: Determines if moment tensor information is fetched
+    :rtype jobs: list of tuples
+    :return jobs: (index, event, stations, mode, tag_name, folder_name, 
+        check_folder_exists)
+    :rtype skipped: list of tuples
+    :return skipped: (status, errors) of events that are not processed
+    """
+    jobs, skipped, owners = [], [], {}
+    for event_counter, event in enumerate(cat):
+        print("{} of {} event(s)".format(event_counter + 1, len(cat)))
+        try:
+            tag_name, folder_name, check_folder_exists = generate_tags(event)
+        except Exception as e:
+            print("Error in tag generation: {}\n".format(e))
+            skipped.append(('fail', [(event.resource_id.id, 'Tag Creation')]))
+            continue
+
+        # same time tag already handed to a job of this run
+        tag_name_short = '_'.join(tag_name.split('_')[:2])
+        if tag_name_short in owners:
+            if owners[tag_name_short] != tag_name:
+                print("This event was processed with another mode\n")
+                skipped.append(('already_processed', 
+                                    [(tag_name, "Processed w/ Another Mode")]))
+            else:
+                print("This event was already processed\n")
+                skipped.append(('already_processed', []))
+            continue
+
+        owners[tag_name_short] = tag_name
+        jobs.append((len(jobs), event, stations, mode, tag_name, 
+                                            folder_name, check_folder_exists))
+
+    return jobs, skipped
+
+
+def _init_event_worker(job_state):
+
+    """
+    Initializer of the event pool processes. Interrupts are left to the main
+    process, which terminates the pool and cleans up unfinished folders.
+    """
+    global JOB_STATE
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    JOB_STATE = job_state
+
+
+def _process_event_job(job):
+
+    """
+    Pool wrapper around process_event(), flags the job as started/finished
+    in the shared JOB_STATE array so the main process knows which folders 
+    are being written.
+    """
+    index = job[0]
+    JOB_STATE[index] = 1
+    try:
+        # daemonic pool workers can not fork station processes
+        return index, process_event(*job[1:], parallel=False)
+    except Exception as e:
+        return index, ('fail', [(job[4], str(e))])
+    finally:
+        JOB_STATE[index] = 2
+
+
+def process_event_pool(jobs, workers):
+
+    """
+    Processes events in a pool of forked worker processes (Agg backend, one
+    event per task). Every job owns its tag, the caller has to make sure no
+    two jobs share a tag. Yields (status, errors) of each event as it 
+    finishes, successful events are handed to the UPLOADER if there is one.
+    On KeyboardInterrupt the pool is terminated, folders of events that were
+    being processed are removed and the interrupt is re-raised.
+
+    :type jobs: list of tuples
+    :param jobs: (index, event, stations, mode, tag_name, folder_name, 
+        check_folder_exists), index counting up from 0
+    :type workers: int
+    :param workers: Number of worker processes.
+    """
+    context = multiprocessing.get_context('fork')
+    job_state = context.RawArray('i', len(jobs))
+    pool = context.Pool(workers, initializer=_init_event_worker, 
+                        initargs=(job_state,), maxtasksperchild=20)
+    try:
+        for index, result in pool.imap_unordered(_process_event_job, jobs, 
+                                                                chunksize=1):
+            if result[0] == 'success' and UPLOADER is not None:
+                UPLOADER.submit(jobs[index][5])
+            yield result
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        pool.join()
+        for job in jobs:
+            if job_state[job[0]] == 1 and os.path.exists(job[5]):
+                print("Removing incomplete folder {}".format(job[4]))
+                shutil.rmtree(job[5])
+        raise
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class EventUploader(object):
+
+    """
+    Uploads the folders of successfully processed events to the JANE 
+    database while the next events are processed, with the functions of 
+    event_upload_rotjane.py in a pool of threads sharing one session. Files
+    of reprocessed events that changed since their last upload are replaced,
+    see upload_event() there. Pages still queued in the PAGE_RENDERER are 
+    waited for before an event is uploaded.
+
+    :type output_path: str
+    :param output_path: Folder containing the event folders, holds the 
+        upload ledger.
+    :type workers: int
+    :param workers: Number of upload threads.
+    """
+    def __init__(self, output_path, workers=4):
+        import event_upload_rotjane
+        self.jane = event_upload_rotjane
+        self.jane.OUTPUT_PATH = os.path.abspath(output_path)
+        self.session = self.jane.get_session(workers)
+        self.ledger = self.jane.UploadLedger(output_path)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+
+    def submit(self, folder_name):
+
+        """
+        Queues one event folder and returns immediately.
+        """
+        folder_name = os.path.abspath(folder_name)
+        self.futures.append((folder_name, 
+                             self.executor.submit(self._upload, folder_name)))
+
+    def _upload(self, folder_name):
+        if PAGE_RENDERER is not None:
+            PAGE_RENDERER.wait_folder(folder_name)
+        return self.jane.upload_event(self.session, folder_name, 
+                                                ledger=self.ledger, sync=True)
+
+    def close(self):
+
+        """
+        Waits for all queued uploads.
+
+        :rtype: list of tuples
+        :return: (tag, error) of failed uploads for the error log
+        """
+        self.executor.shutdown(wait=True)
+        errors = []
+        for folder_name, future in self.futures:
+            try:
+                results = future.result()
+            except Exception as e:
+                results = [(folder_name, str(e))]
+            for event, error in results:
+                errors.append((os.path.basename(os.path.normpath(event)), 
+                                                'Upload: {}'.format(error)))
+        self.futures = []
+        self.session.close()
+
+        return errors
+
+    def terminate(self):
+
+        """
+        Drops the queued uploads, uploads in progress are finished.
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.session.close()
+
+
+def shard_catalog(cat, shard_dir, unit_size, settings):
+
+    """
+    Partitions a catalog into work units for a sharded rebuild. Events are 
+    sorted by origin time and units are only cut between different time tags,
+    so events that share a folder name always end up in the same unit. Each
+    unit is stored as a QuakeML file in <shard_dir>/units, run settings are
+    stored in <shard_dir>/settings.json for the workers.
+
+    :type cat: :class: `~obspy.core.event.Catalog`
+    :param cat: Catalog of events to process.
+    :type shard_dir: str
+    :param shard_dir: Shared directory holding units, leases and results.
+    :type unit_size: int
+    :param unit_size: Approximate number of events per work unit.
+    :type settings: dict
+    :param settings: Processing settings, shared by all workers.
+    :rtype: int
+    :return: Number of work units created.
+    """
+    for sub in ['units', 'leases', 'done']:
+        if not os.path.exists(os.path.join(shard_dir, sub)):
+            os.makedirs(os.path.join(shard_dir, sub))
+    if glob.glob(os.path.join(shard_dir, 'units', '*.xml')):
+        raise RotationalProcessingException(
+                        "Shard directory already initialized: " + shard_dir)
+
+    def time_tag(event):
+        orig = event.preferred_origin() or event.origins[0]
+        return orig.time.isoformat()[:19]
+
+    events = sorted(cat, key=time_tag)
+    units, unit = [], []
+    for i, event in enumerate(events):
+        if len(unit) >= unit_size and time_tag(event) != time_tag(events[i-1]):
+            units.append(unit)
+            unit = []
+        unit.append(event)
+    if unit:
+        units.append(unit)
+
+    for i, unit in enumerate(units):
+        Catalog(events=unit).write(
+            os.path.join(shard_dir, 'units', 'unit_{:05d}.xml'.format(i)), 
+                                                            format='QUAKEML')
+
+    with open(os.path.join(shard_dir, 'settings.json'), 'w') as f:
+        json.dump(settings, f, indent=4)
+
+    return len(units)
+
+
+def lease_token(lease):
+
+    """
+    :type lease: str
+    :param lease: Path of the lease file.
+    :rtype: str or None
+    :return: Owner token of the lease, None if it is missing or unreadable
+    """
+    try:
+        with open(lease) as f:
+            return json.load(f).get('token')
+    except (OSError, ValueError):
+        return None
+
+
+def release_lease(lease, token):
+
+    """
+    Removes a lease if it is still owned by token. A lease taken over by 
+    another worker is left alone.
+    """
+    if lease_token(lease) == token:
+        try:
+            os.remove(lease)
+        except FileNotFoundError:
+            pass
+
+
+def claim_work_unit(shard_dir, worker_id, lease_timeout):
+
+    """
+    Claims the next free work unit through a lease file. Leases are created
+    with O_EXCL, which is atomic on the shared (NFS v3+) filesystem, and hold
+    an owner token that the heartbeat and the release check before touching
+    the file. A lease whose heartbeat is older than lease_timeout belongs to 
+    a crashed worker, it is renamed away and the unit is claimed again. The
+    expiry check and the rename are separate steps: if another worker took 
+    the lease over in between, the renamed lease is fresh, it is put back and
+    the unit is skipped. Only if yet another worker claims the unit while the
+    lease is away, two workers own it; the first one loses its lease, see 
+    LeaseHeartbeat, and abandons the unit, see run_shard_worker().
+
+    :type shard_dir: str
+    :param shard_dir: Shared directory holding units, leases and results.
+    :type worker_id: str
+    :param worker_id: Unique name of this worker, i.e. 'host:pid'
+    :type lease_timeout: float
+    :param lease_timeout: Seconds without heartbeat before a lease expires.
+    :rtype unit: str or None
+    :return unit: Name of the claimed unit, None if no unit is free
+    :rtype token: str or None
+    :return token: Owner token of the lease of the claimed unit
+    :rtype remaining: int
+    :return remaining: Number of units not done yet (including claimed ones)
+    """
+    units = sorted(os.path.basename(_)[:-4] for _ in 
+                        glob.glob(os.path.join(shard_dir, 'units', '*.xml')))
+    done = set(os.path.basename(_)[:-5] for _ in 
+                        glob.glob(os.path.join(shard_dir, 'done', '*.json')))
+    remaining = [U for U in units if U not in done]
+
+    for unit in remaining:
+        lease = os.path.join(shard_dir, 'leases', unit + '.lease')
+        token = uuid.uuid4().hex
+
+        # take over leases of crashed workers
+        try:
+            if time.time() - os.path.getmtime(lease) > lease_timeout:
+                expired = '{}.expired.{}'.format(lease, token)
+                os.rename(lease, expired)
+                if time.time() - os.path.getmtime(expired) <= lease_timeout:
+                    # renamed a lease just taken over by another worker
+                    try:
+                        os.link(expired, lease)
+                    except FileExistsError:
+                        pass
+                    os.remove(expired)
+                    continue
+                print("Lease of {} expired, reassigning".format(unit))
+                os.remove(expired)
+        except OSError:
+            pass
+
+        try:
+            fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            continue
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'worker': worker_id, 'host': socket.gethostname(),
+                       'claimed': time.time(), 'token': token}, f)
+
+        # unit may have been finished between listing and claiming
+        if os.path.exists(os.path.join(shard_dir, 'done', unit + '.json')):
+            release_lease(lease, token)
+            continue
+
+        return unit, token, len(remaining)
+
+    return None, None, len(remaining)
+
+
+class LeaseHeartbeat(threading.Thread):
+
+    """
+    Background thread that keeps a lease alive by touching the lease file 
+    every 'interval' seconds until stop() is called. The file is only touched
+    while it holds the token of this worker, once another worker owns the 
+    lease the heartbeat stops and 'lost' is set. A missing file is retried,
+    claim_work_unit() may be putting it back.
+
+    :type lease: str
+    :param lease: Path of the lease file.
+    :type token: str
+    :param token: Owner token of the lease, see claim_work_unit().
+    :type interval: float
+    :param interval: Seconds between heartbeats.
+    """
+
+    def __init__(self, lease, token, interval):
+        threading.Thread.__init__(self, daemon=True)
+        self.lease = lease
+        self.token = token
+        self.interval = interval
+        self.lost = False
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            owner = lease_token(self.lease)
+            if owner is None:
+                continue
+            if owner != self.token:
+                self.lost = True
+                print("Lost lease {}".format(os.path.basename(self.lease)))
+                return
+            try:
+                os.utime(self.lease, None)
+            except OSError:
+                pass
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_shard_worker(shard_dir, stations, mode, workers=1, 
+                     lease_timeout=1800., poll_interval=60.):
+
+    """
+    Worker loop of a sharded rebuild. Claims work units, processes their 
+    events (in a process pool if workers > 1) and records the results of each
+    unit in <shard_dir>/done/<unit>.json. Returns when all units are done,
+    while other workers still hold leases it waits and takes over units whose
+    leases expire. A unit whose lease was taken over by another worker is 
+    abandoned after the current event, its results are left to the new 
+    owner. Workers run without the manifest, SQLite locking is not reliable
+    on the shared (NFS) output folder.
+
+    :type shard_dir: str
+    :param shard_dir: Shared directory holding units, leases and results.
+    :type stations: list of str
+    :param stations: Stations from which data are fetched (i.e. ['RLAS']).
+    :type mode: str
+    :param mode: Determines if moment tensor information is fetched
+    :type workers: int
+    :param workers: Number of worker processes per unit.
+    :type lease_timeout: float
+    :param lease_timeout: Seconds without heartbeat before a lease expires.
+    :type poll_interval: float
+    :param poll_interval: Seconds to wait when all open units are leased.
+    """
+    worker_id = '{}:{}'.format(socket.gethostname(), os.getpid())
+    while True:
+        unit, token, remaining = claim_work_unit(shard_dir, worker_id, 
+                                                                lease_timeout)
+        if remaining == 0:
+            print("All work units done")
+            return
+        if unit is None:
+            print("{} unit(s) leased by other workers, waiting...".format(
+                                                                    remaining))
+            time.sleep(poll_interval)
+            continue
+
+        print("{}\n{} claimed by {}\n{}".format(bars, unit, worker_id, bars))
+        lease = os.path.join(shard_dir, 'leases', unit + '.lease')
+        heartbeat = LeaseHeartbeat(lease, token, lease_timeout / 10.)
+        heartbeat.start()
+
+        started = time.time()
+        counter = {'success': 0, 'fail': 0, 'already_processed': 0}
+        errors = []
+        try:
+            cat = read_events(os.path.join(shard_dir, 'units', unit + '.xml'),
+                                                            format='QUAKEML')
+            jobs, results = event_jobs(cat, stations, mode)
+            if workers > 1:
+                # events in flight are terminated with the pool on abandon
+                events = process_event_pool(jobs, workers)
+                for result in events:
+                    results.append(result)
+                    if heartbeat.lost:
+                        break
+                events.close()
+            else:
+                for J in jobs:
+                    if heartbeat.lost:
+                        break
+                    try:
+                        results.append(process_event(*J[1:]))
+                    except Exception as e:
+                        results.append(('fail', [(J[4], str(e))]))
+                if PAGE_RENDERER is not None:
+                    for filename, error in PAGE_RENDERER.wait():
+                        errors.append((os.path.basename(filename), 
+                                            'Page Rendering: {}'.format(error)))
+            for status, errs in results:
+                counter[status] += 1
+                errors += errs
+
+        # keep the lease on interrupt, it expires and the unit is reassigned
+        finally:
+            heartbeat.stop()
+
+        if heartbeat.lost:
+            print("{} abandoned after {} of {} event(s), its lease was taken "
+                        "over by another worker".format(unit, len(results), 
+                                                                    len(cat)))
+            continue
+
+        summary = OrderedDict([
+                    ('unit', unit),
+                    ('worker', worker_id),
+                    ('host', socket.gethostname()),
+                    ('events', len(cat)),
+                    ('success', counter['success']),
+                    ('fail', counter['fail']),
+                    ('already_processed', counter['already_processed']),
+                    ('started', started),
+                    ('finished', time.time()),
+                    ('errors', [[T, str(E)] for T, E in errors])
+                    ])
+
+        done = os.path.join(shard_dir, 'done', unit + '.json')
+        with open(done + '.tmp.' + worker_id.replace(':', '_'), 'w') as f:
+            json.dump(summary, f, indent=4)
+        os.rename(done + '.tmp.' + worker_id.replace(':', '_'), done)
+        release_lease(lease, token)
+
+
+def shard_report(shard_dir, lease_timeout=1800.):
+
+    """
+    Coordinator report of a sharded rebuild: progress over all work units and
+    the throughput of every node, printed to stdout.
+
+    :type shard_dir: str
+    :param shard_dir: Shared directory holding units, leases and results.
+    :type lease_timeout: float
+    :param lease_timeout: Seconds without heartbeat before a lease expires.
+    """
+    units = sorted(os.path.basename(_)[:-4] for _ in 
+                        glob.glob(os.path.join(shard_dir, 'units', '*.xml')))
+    done = [json.load(open(_)) for _ in 
+                        glob.glob(os.path.join(shard_dir, 'done', '*.json'))]
+    done_units = set(D['unit'] for D in done)
+
+    running, expired = [], []
+    for lease in glob.glob(os.path.join(shard_dir, 'leases', '*.lease')):
+        unit = os.path.basename(lease)[:-6]
+        if unit in done_units:
+            continue
+        try:
+            info = json.load(open(lease))
+            age = time.time() - os.path.getmtime(lease)
+        except (OSError, ValueError):
+            continue
+        if age > lease_timeout:
+            expired.append((unit, info.get('worker'), age))
+        else:
+            running.append((unit, info.get('worker'), age))
+
+    pending = len(units) - len(done_units) - len(running) - len(expired)
+    print(bars)
+    print("Sharded rebuild: {}".format(os.path.abspath(shard_dir)))
+    print("units: {} total, {} done, {} running, {} expired, {} pending".format(
+            len(units), len(done_units), len(running), len(expired), pending))
+    print("events: {} processed, {} success, {} fail, {} already processed"
+          .format(sum(D['events'] for D in done), 
+                  sum(D['success'] for D in done),
+                  sum(D['fail'] for D in done),
+                  sum(D['already_processed'] for D in done)))
+
+    # per node throughput over the wall time the node was working
+    print('{}\n{:<30}{:>8}{:>8}{:>10}{:>14}'.format(
+                    bars, 'node', 'units', 'events', 'hours', 'events/hour'))
+    for host in sorted(set(D['host'] for D in done)):
+        host_done = [D for D in done if D['host'] == host]
+        events = sum(D['events'] for D in host_done)
+        hours = sum(D['finished'] - D['started'] for D in host_done) / 3600.
+        wall = (max(D['finished'] for D in host_done) - 
+                min(D['started'] for D in host_done)) / 3600.
+        print('{:<30}{:>8}{:>8}{:>10.2f}{:>14.1f}'.format(
+                host, len(host_done), events, wall, events / max(wall, 1e-6)))
+        if hours > wall * 1.01:
+            print('{:<30}({:.2f} busy hours over parallel workers)'.format(
+                                                                '', hours))
+
+    for unit, worker, age in running:
+        print("running: {} on {} (heartbeat {:.0f} s ago)".format(
+                                                            unit, worker, age))
+    for unit, worker, age in expired:
+        print("expired: {} on {} (heartbeat {:.0f} s ago)".format(
+                                                            unit, worker, age))
+    print(bars)
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Comparison of transvere\
@@ -2150,11 +4648,81 @@ if __name__ == '__main__':
         comparison in different time windows, and cross-correlation analysis.')
     parser.add_argument('--station', help='Choice of station: RLAS, ROMY\
         (default is RLAS)', type=str, default='RLAS')
+    parser.add_argument('--stations', help='Comma separated list of stations\
+        processed together in one pass, i.e. RLAS,ROMY. Overrides --station\
+        (default: None)', type=str, default=None)
     parser.add_argument('--mode', help='Choose catalog to download events: \
         GCMT catalog for the most up to date catalog. ISC QuakeML file for \
         catalog of local/regional events. IRIS for most stable solutions, \
         though recent events might not be present \
         (default: gcmt, else: iscquakeml, iris)', type=str,default='GCMT')
+    parser.add_argument('--pages', help='Pages to render, comma separated \
+        subset of 1,2,3,4 or none for the .json and QuakeML files only \
+        (default: 1,2,3,4)', type=str, default='1,2,3,4')
+    parser.add_argument('--render_workers', help='Number of processes that\
+        render the pages while the next event is processed, 0 renders in \
+        the processing process. Not used with --workers (default: 0)', 
+                                                        type=int, default=0)
+    parser.add_argument('--render_missing', help='Render the pages missing \
+        in already processed event folders of ./OUTPUT/ and exit. Use with \
+        --pages to choose the pages.', action='store_true')
+    parser.add_argument('--no_products', help='Do not store the analysis \
+        products of each station in a .npz file in the event folder. With \
+        --pages none the analysis only needed for pages 3 and 4 is skipped.', 
+                                                        action='store_true')
+    parser.add_argument('--replot', help='Render the pages of all events in \
+        ./OUTPUT/ from their product files and exit, existing pages are \
+        overwritten. Use with --pages to choose the pages.', 
+                                                        action='store_true')
+    parser.add_argument('--reanalyze', help='Derive the estimated backazimuth,\
+        correlation and phase velocity values of all events in ./OUTPUT/ \
+        again from their product files, update the .json and QuakeML files \
+        and exit. Runs before --replot if both are given.', 
+                                                        action='store_true')
+    parser.add_argument('--reprocess_stale', help='Reprocess the stations of\
+        all events in ./OUTPUT/ that were processed with another code version\
+        or other processing parameters and exit, up-to-date events are not \
+        touched.', action='store_true')
+    parser.add_argument('--scratch', help='Folder of the stage checkpoints \
+        (download, preprocessing, analysis, pages) that interrupted or failed\
+        events are resumed from, none disables the checkpoints. Checkpoints \
+        of failed events stay until the event is processed successfully \
+        (default is ./scratch/).', type=str, default='./scratch/')
+    parser.add_argument('--upload', help='Upload every successfully \
+        processed event to the JANE database while the next events are \
+        processed, see event_upload_rotjane.py. Upload errors go to the \
+        error log. Not with --shard_worker.', action='store_true')
+    parser.add_argument('--upload_workers', help='Number of upload threads \
+        for --upload (default: 4)', type=int, default=4)
+    parser.add_argument('--no_manifest', help='Check for already processed \
+        events by scanning the output folder instead of looking them up in \
+        its manifest (OUTPUT/.manifest.sqlite).', action='store_true')
+    parser.add_argument('--rebuild_manifest', help='Rebuild the manifest of \
+        processed events from the event folders in the output folder and \
+        exit.', action='store_true')
+    parser.add_argument('--map_cache', help='Folder of the cached page 1 \
+        map backgrounds (default is ./map_cache/).', type=str, 
+                                                    default='./map_cache/')
+    parser.add_argument('--warm_map_cache', help='Render the map backgrounds\
+        of all local and close events around the stations (default RLAS and \
+        ROMY) and exit.', action='store_true')
+    parser.add_argument('--workers', help='Number of events processed in \
+        parallel worker processes (default: 1)', type=int, default=1)
+    parser.add_argument('--shard_init', help='Partition the selected catalog\
+        into work units for a sharded rebuild, stored in the given shared \
+        directory (default: None)', type=str, default=None)
+    parser.add_argument('--shard_size', help='Number of events per work unit \
+        for --shard_init (default: 50)', type=int, default=50)
+    parser.add_argument('--shard_worker', help='Claim and process work units \
+        from the given shared directory until all are done. Settings are \
+        taken from --shard_init, the manifest is not used (as with \
+        --no_manifest) (default: None)', type=str, default=None)
+    parser.add_argument('--shard_report', help='Print progress and per node \
+        throughput of the sharded rebuild in the given shared directory \
+        (default: None)', type=str, default=None)
+    parser.add_argument('--lease_timeout', help='Seconds without heartbeat \
+        after which a work unit lease is reassigned (default: 1800)', 
+                                                    type=float, default=1800.)
     parser.add_argument('--polarity', help='Flip polarity of rotation data to \
         fix data errors, to be used in specific time windows of catalog rerun \
         (default: normal, otherwise: reverse)',type=str, default='normal')
@@ -2190,10 +4758,96 @@ if __name__ == '__main__':
                                                     datetime.datetime.now()))
 
     args = parser.parse_args()
-    station = args.station
+    if args.stations:
+        stations = [S.strip().upper() for S in args.stations.split(',')]
+    else:
+        stations = [args.station]
     mode = args.mode.upper()
     polarity = args.polarity.lower()
     instrument = args.instrument.upper()
+    bars = '='*79
+    if args.pages.lower() == 'none':
+        PAGES = []
+    else:
+        try:
+            PAGES = sorted(set(int(N) for N in args.pages.split(',')))
+        except ValueError:
+            PAGES = None
+        if not PAGES or not set(PAGES) <= set(PAGE_RENDERERS):
+            parser.error('--pages must be none or a subset of 1,2,3,4')
+    if args.upload and PAGES != sorted(PAGE_RENDERERS):
+        parser.error('--upload needs all pages, the database shows 1,2,3,4')
+    # the upload ledger is a SQLite file in the shared output folder
+    if args.upload and args.shard_worker:
+        parser.error('--upload can not be used with --shard_worker, upload '
+                     'the events with event_upload_rotjane.py afterwards')
+    MAP_BACKGROUNDS.cache_dir = args.map_cache
+    PRODUCTS = not args.no_products
+    if args.scratch.lower() == 'none':
+        CHECKPOINT_PATH = None
+    else:
+        CHECKPOINT_PATH = args.scratch
+
+    if args.warm_map_cache:
+        if not args.stations:
+            stations = sorted(STATION_COORDINATES)
+        MAP_BACKGROUNDS.warm(stations)
+        sys.exit()
+
+    if args.render_missing:
+        output_path = './OUTPUT/'
+        rendered = render_missing_pages(output_path, PAGES)
+        print("{} page(s) rendered".format(rendered))
+        sys.exit()
+
+    if args.rebuild_manifest:
+        output_path = './OUTPUT/'
+        if not os.path.exists(output_path): 
+            os.makedirs(output_path)
+        folders = EventManifest(output_path).rebuild()
+        print("{} event folder(s) in the manifest".format(folders))
+        sys.exit()
+
+    if args.reprocess_stale:
+        output_path = './OUTPUT/'
+        if not args.no_manifest:
+            MANIFEST = EventManifest(output_path)
+        reprocessed, failed = reprocess_stale(output_path)
+        print("{} event(s) reprocessed, {} failed".format(reprocessed, failed))
+        sys.exit()
+
+    # work from the stored product files only
+    if args.reanalyze or args.replot:
+        output_path = './OUTPUT/'
+        if args.reanalyze:
+            reanalyzed = reanalyze_products(output_path)
+            print("{} station(s) re-analyzed".format(reanalyzed))
+        if args.replot:
+            rendered = replot_products(output_path, PAGES)
+            print("{} page(s) rendered".format(rendered))
+        sys.exit()
+
+    # sharded rebuild: report and workers take their events from shard_dir
+    if args.shard_report:
+        shard_report(args.shard_report, args.lease_timeout)
+        sys.exit()
+
+    if args.shard_worker:
+        settings = json.load(open(os.path.join(args.shard_worker, 
+                                                            'settings.json')))
+        mode, catalog = settings['mode'], settings['catalog']
+        polarity, instrument = settings['polarity'], settings['instrument']
+        stations = settings['stations']
+        output_path = settings['output_path']
+        # no manifest on the shared output folder, see run_shard_worker(). 
+        # Build it with --rebuild_manifest once the units are done
+        MANIFEST = None
+        if args.render_workers > 0 and args.workers <= 1:
+            PAGE_RENDERER = PageRenderer(args.render_workers)
+        run_shard_worker(args.shard_worker, stations, mode, args.workers,
+                         lease_timeout=args.lease_timeout, 
+                         poll_interval=args.lease_timeout / 10.)
+        sys.exit()
 
     # [default]: get event catalog from GCMT NEW QUICK,
     if mode == 'GCMT':
@@ -2253,97 +4907,100 @@ if __name__ == '__main__':
     output_path = './OUTPUT/'
     if not os.path.exists(output_path): 
         os.makedirs(output_path)
+    if not args.no_manifest:
+        MANIFEST = EventManifest(output_path)
+
+    if args.shard_init:
+        settings = OrderedDict([('mode', mode), ('catalog', catalog),
+                                ('polarity', polarity), 
+                                ('instrument', instrument), 
+                                ('stations', stations),
+                                ('output_path', output_path)])
+        units = shard_catalog(cat, args.shard_init, args.shard_size, settings)
+        print("{} event(s) split into {} work unit(s) in {}".format(
+                                            len(cat), units, args.shard_init))
+        sys.exit()
+
+    if args.render_workers > 0 and args.workers <= 1:
+        PAGE_RENDERER = PageRenderer(args.render_workers)
+    if args.upload:
+        UPLOADER = EventUploader(output_path, args.upload_workers)
 
     print("%i event(s) downloaded, beginning processing...\n" % len(cat))
     event_counter = success_counter = fail_counter = already_processed = 0
-    bars = '='*79
     error_list,error_type = [],[]
-    for event in cat:
-        event_counter += 1
-        print("{} of {} event(s)".format(event_counter,len(cat)))
-        try:
-            tag_name, folder_name, check_folder_exists = generate_tags(event)
-            # check if current event folder exists
-            if check_folder_exists:
-                # check if event source is the same, assumes 0 or 1 files found
-                if (os.path.basename(check_folder_exists[0]) != 
-                                                os.path.basename(folder_name)):
-                    print("This event was processed with another mode\n")
-                    error_list.append(tag_name)
-                    error_type.append("Processed w/ Another Mode")
-                    already_processed += 1
-                    continue
 
-                # if new station, run waveform compare again
-                try:
-                    filename_json = os.path.join(folder_name,tag_name + '.json')
-                    data = json.load(open(filename_json))
-                    if data['station_information_{}'.format(station)]:
-                        print("This event was already processed\n")
-                        already_processed += 1
-                    else:
-                        try:
-                            plot_waveform_comp(event, station, mode,
-                                                        folder_name, tag_name)
-                            success_counter += 1
-
-                        # if any error, remove folder, continue
-                        except Exception as e:
-                            print(e)
-                            print("Removing incomplete folder...\n")
-                            error_list.append(tag_name)
-                            error_type.append(e)
-                            shutil.rmtree(folder_name)
-                            fail_counter += 1
-
-                        # if keyboard interrupt, remove folder, quit
-                        except KeyboardInterrupt:
-                            print("Removing incomplete folder...\n")
-                            shutil.rmtree(folder_name)
-                            sys.exit()
-
-                # if json not found, folder is incomplete, continue
-                except FileNotFoundError:
-                    error_list.append(tag_name)
-                    error_type.append("Incomplete Folder")
-                    print("Incomplete folder found\n")
-                    fail_counter += 1 
-
-
-            
-            # event encountered for the first time, create folder, xml, process
-            elif not check_folder_exists:  
-                os.makedirs(str(folder_name))
-                
-                # run processing function
-                try:
-                    plot_waveform_comp(event, station, mode, 
-                                                        folder_name, tag_name)
-                    success_counter += 1
-                
-                # if any error, remove folder, continue
-                except Exception as e:
-                    print(e)
-                    print("Removing incomplete folder...\n")
-                    error_list.append(tag_name)
-                    error_type.append(e)
-                    shutil.rmtree(folder_name)
-                    fail_counter += 1
-
-                # if keyboard interrupt, remove folder, quit
-                except KeyboardInterrupt:
-                    fail_counter += 1
-                    print("Removing incomplete folder...\n")
-                    shutil.rmtree(folder_name)
-                    sys.exit()
-
-        # if error creating tags, continue
-        except Exception as e:
-            print("Error in tag generation: {}\n".format(e))
-            error_list.append(event.resource_id.id)
-            error_type.append('Tag Creation')
+    def count(status, errors):
+        global success_counter, fail_counter, already_processed
+        if status == 'success':
+            success_counter += 1
+        elif status == 'fail':
             fail_counter += 1
+        elif status == 'already_processed':
+            already_processed += 1
+        for tag, error in errors:
+            error_list.append(tag)
+            error_type.append(error)
+
+    # single process: tag and process events one after another
+    if args.workers <= 1:
+        for event in cat:
+            event_counter += 1
+            print("{} of {} event(s)".format(event_counter,len(cat)))
+            try:
+                tag_name, folder_name, check_folder_exists = \
+                                                        generate_tags(event)
+            # if error creating tags, continue
+            except Exception as e:
+                print("Error in tag generation: {}\n".format(e))
+                count('fail', [(event.resource_id.id, 'Tag Creation')])
+                continue
 
+            try:
+                status, errors = process_event(event, stations, mode, 
+                                tag_name, folder_name, check_folder_exists)
+                count(status, errors)
+                if status == 'success' and UPLOADER is not None:
+                    UPLOADER.submit(folder_name)
+            except Exception as e:
+                print(e)
+                count('fail', [(tag_name, str(e))])
+            except KeyboardInterrupt:
+                if PAGE_RENDERER is not None:
+                    PAGE_RENDERER.terminate()
+                if UPLOADER is not None:
+                    UPLOADER.terminate()
+                sys.exit()
+
+        # pages still queued in the rendering workers
+        if PAGE_RENDERER is not None:
+            print("Waiting for page rendering...")
+            for filename, error in PAGE_RENDERER.close():
+                error_list.append(os.path.basename(filename))
+                error_type.append('Page Rendering: {}'.format(error))
+
+    # process pool: tags are generated up front, each tag owned by one job
+    else:
+        jobs, skipped = event_jobs(cat, stations, mode)
+        for status, errors in skipped:
+            count(status, errors)
+
+        print("Processing {} event(s) with {} workers...\n".format(
+                                                    len(jobs), args.workers))
+        try:
+            for status, errors in process_event_pool(jobs, args.workers):
+                count(status, errors)
+        except KeyboardInterrupt:
+            if UPLOADER is not None:
+                UPLOADER.terminate()
+            sys.exit()
+
+    # uploads still queued
+    if UPLOADER is not None:
+        print("Waiting for uploads...")
+        for tag, error in UPLOADER.close():
+            error_list.append(tag)
+            error_type.append(error)
 
     # print end message
     print('{}\n'.format('_'*79))
@@ -2369,11 +5026,12 @@ if __name__ == '__main__':
 
             # prompt showing search parameters, counters and errors
             f.write(("{} < datetime < {}\n{} < mag < {}\n"
-                     "mode: {}\nsuccess: {}/{}\nerror: {}/{}\n"
+                     "mode: {}\nstations: {}\nsuccess: {}/{}\nerror: {}/{}\n"
                      "already processed: {}/{}\n").format(
                                         args.min_datetime,args.max_datetime,
                                         args.min_magnitude,args.max_magnitude,
-                                        mode,success_counter,len(cat),
+                                        mode,','.join(stations),
+                                        success_counter,len(cat),
                                         fail_counter,len(cat),
                                         already_processed,len(cat)))
             for i,j in zip(error_list,error_type):